@@ -0,0 +1,197 @@
+import os
+import json
+import time
+import shutil
+import hashlib
+
+# Number of bytes read from the head and the tail of each input file to
+# fingerprint its content
+FINGERPRINT_BYTES = 1 << 16
+
+
+def _files(path):
+    if not os.path.isdir(path):
+        return [path]
+    files = []
+    for root, dirs, names in os.walk(path, followlinks=True):
+        dirs.sort()
+        for name in sorted(names):
+            if not name.startswith('.'):
+                files.append(os.path.join(root, name))
+    return files
+
+
+# Fingerprint of an input file or directory: the name, size and modification
+# time of every file, plus a hash of the first and last bytes of each file.
+def fingerprint(path):
+    h = hashlib.sha256()
+    for f in _files(path):
+        st = os.stat(f)
+        h.update(('%s\t%d\t%d\n' % (os.path.relpath(f, path), st.st_size, st.st_mtime_ns)).encode())
+        with open(f, 'rb') as fin:
+            h.update(fin.read(FINGERPRINT_BYTES))
+            if st.st_size > 2 * FINGERPRINT_BYTES:
+                fin.seek(-FINGERPRINT_BYTES, os.SEEK_END)
+                h.update(fin.read(FINGERPRINT_BYTES))
+    return h.hexdigest()
+
+
+def _du(path):
+    if os.path.islink(path) or not os.path.isdir(path):
+        return os.lstat(path).st_size
+    size = 0
+    for root, dirs, files in os.walk(path):
+        for f in files:
+            size += os.lstat(os.path.join(root, f)).st_size
+    return size
+
+
+# Content-addressed cache of database builds. An entry is a directory named
+# after the key of the build, which holds the database ('db'), whatever the
+# build wrote next to it (e.g. 'db.log') and 'meta.json'. Builds happen in a
+# staging directory that is renamed into place only when they succeed, so a
+# crashed build never becomes an entry. Entries are evicted in LRU order when
+# the cache grows beyond 'quota' GB, except those that some database dir
+# still links to (the paths an entry was linked to are listed in 'links').
+class BuildCache:
+    def __init__(self, cachedir, quota):
+        self.cachedir = cachedir
+        self.quota = quota * (1024 ** 3)
+        self.pinned = set()
+        self.binaries = {}
+        if not os.path.exists(cachedir):
+            os.makedirs(cachedir)
+        # Remove what is left of builds whose process died
+        for name in os.listdir(cachedir):
+            if name.startswith('.staging-'):
+                pid = int(name.split('-')[2])
+                if not self._alive(pid):
+                    shutil.rmtree(os.path.join(cachedir, name), ignore_errors=True)
+
+    def _alive(self, pid):
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            return False
+        except PermissionError:
+            pass
+        return True
+
+    def _binary_hash(self, path):
+        st = os.stat(path)
+        if path not in self.binaries or self.binaries[path][0] != st.st_mtime_ns:
+            h = hashlib.sha256()
+            with open(path, 'rb') as fin:
+                for block in iter(lambda: fin.read(1 << 20), b''):
+                    h.update(block)
+            self.binaries[path] = (st.st_mtime_ns, h.hexdigest())
+        return self.binaries[path][1]
+
+    # Key of a build from its inputs, the executables that perform it and
+    # the full option string
+    def key(self, inputs, binaries, opts):
+        h = hashlib.sha256()
+        for i in inputs:
+            h.update(b'input ' + fingerprint(i).encode() + b'\n')
+        for b in binaries:
+            h.update(b'binary ' + self._binary_hash(b).encode() + b'\n')
+        h.update(b'opts ' + ' '.join(opts.split()).encode() + b'\n')
+        return h.hexdigest()[:32]
+
+    def entry(self, key):
+        return os.path.join(self.cachedir, key)
+
+    # Return the entry of a key, marking it as used, or None on a miss
+    def lookup(self, key):
+        entry = self.entry(key)
+        if not os.path.exists(os.path.join(entry, 'meta.json')):
+            return None
+        os.utime(os.path.join(entry, 'meta.json'))
+        self.pinned.add(key)
+        return entry
+
+    def staging(self, key):
+        staging = os.path.join(self.cachedir, '.staging-%s-%d-%d' % (key, os.getpid(), time.monotonic_ns()))
+        os.makedirs(staging)
+        return staging
+
+    def discard(self, staging):
+        shutil.rmtree(staging, ignore_errors=True)
+
+    # Atomically turn a successful build into the entry of 'key'
+    def commit(self, key, staging, description):
+        meta = {'key': key, 'description': description, 'size': _du(staging), 'created': time.time()}
+        with open(os.path.join(staging, 'meta.json'), 'wt') as fout:
+            json.dump(meta, fout)
+        try:
+            os.rename(staging, self.entry(key))
+        except OSError:
+            # Somebody else committed the same build in the meantime
+            self.discard(staging)
+        self.pinned.add(key)
+        self.evict()
+        return self.entry(key)
+
+    # Make 'path' (and 'path'.log, 'path'.resources, ... for whatever the
+    # build wrote next to the database) point to an entry. What is already
+    # there and is not a link is renamed to <path>.old.
+    def link(self, key, path):
+        entry = self.entry(key)
+        self.pinned.add(key)
+        linksfile = os.path.join(entry, 'links')
+        listed = open(linksfile, 'rt').read().splitlines() if os.path.exists(linksfile) else []
+        if os.path.abspath(path) not in listed:
+            with open(linksfile, 'at') as fout:
+                fout.write(os.path.abspath(path) + '\n')
+        files = [('db', path)]
+        for name in sorted(os.listdir(entry)):
+            if name.startswith('db.'):
+                files.append((name, path + name[2:]))
+        for src, dst in files:
+            if os.path.islink(dst):
+                os.remove(dst)
+            elif os.path.exists(dst):
+                # A database (or its log) that was not built through the
+                # cache is kept aside, never deleted
+                if os.path.lexists(dst + '.old'):
+                    raise Exception('Cannot link ' + dst + ' to the cached build ' + key + ': it was not built '
+                                    'through the cache and ' + dst + '.old exists')
+                print(" Moving " + dst + ", which was not built through the cache, to " + dst + '.old')
+                os.rename(dst, dst + '.old')
+            if os.path.lexists(os.path.join(entry, src)):
+                os.symlink(os.path.join(entry, src), dst)
+
+    # Whether some path that an entry was linked to still points to it
+    def linked(self, name):
+        entry = self.entry(name)
+        linksfile = os.path.join(entry, 'links')
+        if not os.path.exists(linksfile):
+            return False
+        for path in open(linksfile, 'rt').read().splitlines():
+            if os.path.islink(path) and os.readlink(path) == os.path.join(entry, 'db'):
+                return True
+        return False
+
+    # Remove the least recently used entries until the cache fits its quota.
+    # Entries used by this process or linked from a database dir are never
+    # evicted, so that no link is left dangling.
+    def evict(self):
+        entries = []
+        total = 0
+        for name in os.listdir(self.cachedir):
+            metafile = os.path.join(self.cachedir, name, 'meta.json')
+            if name.startswith('.') or not os.path.exists(metafile):
+                continue
+            with open(metafile, 'rt') as fin:
+                size = json.load(fin)['size']
+            total += size
+            entries.append((os.stat(metafile).st_mtime, name, size))
+        entries.sort()
+        for lastused, name, size in entries:
+            if total <= self.quota:
+                break
+            if name in self.pinned or self.linked(name):
+                continue
+            print(" Evicting cached build " + name)
+            shutil.rmtree(os.path.join(self.cachedir, name), ignore_errors=True)
+            total -= size
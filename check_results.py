@@ -0,0 +1,134 @@
+import os
+import sys
+import argparse
+import numpy as np
+
+import resultsdb
+import resultsink
+from resultsdb import ResultsDB
+
+# Check that the engines return the same answers. For every query of a run,
+# the summaries written by resultsink (row count and checksum of the
+# normalized rows) of trident query, trident query_native and rdf3x are
+# compared. The reference answer is the one that most engines return (the
+# one of trident query on a tie). If the hashes of the rows were kept
+# (results_partitions > 0), the rows that are missing or extra are counted
+# one partition at a time, so that the memory needed stays bounded.
+#
+# Every engine gets a 'result_match' measurement (1 or 0) in the results
+# store, which experiments-print.py shows next to the timings.
+
+ENGINES = ['trident', 'trident-native', 'rdf3x']
+
+
+# Summaries of the answers of a run by (dataset, query, config) and engine
+def summaries(run):
+    answers = {}
+    for dirpath, dirs, files in os.walk(run):
+        dirs.sort()
+        for f in sorted(files):
+            if not f.startswith('results_') or not f.endswith(resultsink.SUFFIX):
+                continue
+            output = os.path.join(dirpath, f[:-len(resultsink.SUFFIX)])
+            desc = resultsdb.describe(os.path.join(dirpath, 'logs_' + f[8:-len(resultsink.SUFFIX)]))
+            if desc is None:
+                continue
+            key = (desc['dataset'], desc['query'], desc['config'])
+            answers.setdefault(key, {})[desc['engine']] = (output, resultsink.read_summary(output))
+    return answers
+
+
+# The rdf3x results of the run, whose directory may be glued to its name
+def runs_of(run):
+    parent = os.path.dirname(run)
+    name = os.path.basename(run)
+    return [run] + sorted([os.path.join(parent, d) for d in os.listdir(parent)
+                           if d.startswith(name) and d != name and os.path.isdir(os.path.join(parent, d))])
+
+
+def _hashes(output, partition):
+    path = output + resultsink.HASHES_SUFFIX + '/%03d' % partition
+    if not os.path.exists(path):
+        return np.empty(0, dtype='<u8')
+    return np.fromfile(path, dtype='<u8')
+
+
+# Number of rows of 'output' that are missing from and extra to the
+# reference, or None if the hashes were not kept
+def diff(reference, rsummary, output, summary):
+    partitions = rsummary['partitions']
+    if partitions == 0 or summary['partitions'] != partitions:
+        return None
+    missing = 0
+    extra = 0
+    for i in range(partitions):
+        ref, refcounts = np.unique(_hashes(reference, i), return_counts=True)
+        hashes, counts = np.unique(_hashes(output, i), return_counts=True)
+        both, iref, ihashes = np.intersect1d(ref, hashes, assume_unique=True, return_indices=True)
+        common = np.minimum(refcounts[iref], counts[ihashes]).sum()
+        missing += int(refcounts.sum() - common)
+        extra += int(counts.sum() - common)
+    return missing, extra
+
+
+# Compare the engines of a run. Returns the rows of the report and the
+# number of mismatches.
+def check_run(run, store=None):
+    run = os.path.abspath(run)
+    answers = {}
+    for r in runs_of(run):
+        for key, engines in summaries(r).items():
+            answers.setdefault(key, {}).update(engines)
+    rows = []
+    mismatches = 0
+    matches = []
+    for key in sorted(answers.keys()):
+        engines = answers[key]
+        if len(engines) < 2:
+            continue
+        votes = {}
+        for engine in ENGINES:
+            if engine in engines:
+                s = engines[engine][1]
+                votes.setdefault((s['rows'], s['checksum']), []).append(engine)
+        reference = max(votes.keys(), key=lambda v: (len(votes[v]), -min([ENGINES.index(e) for e in votes[v]])))
+        refengine = votes[reference][0]
+        for engine in ENGINES:
+            if engine not in engines:
+                continue
+            output, s = engines[engine]
+            ok = (s['rows'], s['checksum']) == reference
+            verdict = 'OK'
+            if not ok:
+                mismatches += 1
+                verdict = 'MISMATCH'
+                d = diff(engines[refengine][0], engines[refengine][1], output, s)
+                if d is not None:
+                    verdict += ' (%d missing, %d extra)' % d
+            matches.append((key[0], engine, key[1], key[2], 1.0 if ok else 0.0))
+            rows.append([key[0], key[1], key[2], engine, s['rows'], s['checksum'], verdict])
+    if store is not None:
+        store.record_matches(run, matches)
+    return rows, mismatches
+
+
+def print_report(rows):
+    print('DATASET\tQUERY\tCONFIG\tENGINE\tROWS\tCHECKSUM\tVERDICT')
+    for r in rows:
+        print('\t'.join([str(v) for v in r]))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Check that the engines return the same answers')
+    parser.add_argument('runs', nargs='+', help='results directories (results-<date>)')
+    parser.add_argument('--store', help='results store to record the checks in')
+    args = parser.parse_args()
+    store = None
+    if args.store is not None:
+        store = ResultsDB(args.store)
+    mismatches = 0
+    for run in args.runs:
+        rows, n = check_run(run, store)
+        print_report(rows)
+        mismatches += n
+    sys.exit(1 if mismatches > 0 else 0)
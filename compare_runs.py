@@ -0,0 +1,130 @@
+import os
+import re
+import sys
+import argparse
+import statistics
+from resultsdb import ResultsDB
+import repstats
+
+# Compare the results of two or more runs of the same test, e.g. before and
+# after a new trident binary. Every run is compared to the first one, per
+# (dataset, engine, query, config, metric). A difference is flagged as a
+# regression (or an improvement) if the median changed by more than the
+# threshold and the Mann-Whitney U test on the samples of the two runs is
+# significant. With fewer than MINSAMPLES samples on either side there is
+# no test, and the threshold alone decides. The exit code is 1 if there is
+# at least one regression.
+#
+# A run is the directory with the results of one execution of a test (for
+# test 1, 2, 5 and 10 a results-<date> directory; for test 4, which
+# overwrites its results, a copy of the test4 directory).
+
+MINSAMPLES = 3
+
+# Metrics compared for a test, by default the total runtime of the queries
+METRICS = {'1': ['warm'], '4': ['runtime']}
+DEFAULT_METRICS = ['total']
+
+# Durations of the database builds of a run, recorded by launch_experiments.py
+LOAD_METRICS = "metric LIKE 'load_%'"
+
+
+# The store of the output directory of a run
+def default_store(run):
+    parts = os.path.abspath(run).split(os.sep)
+    for i in range(len(parts) - 1, -1, -1):
+        if re.match(r'^test\d+$', parts[i]):
+            return os.sep.join(parts[:i]) + '/results.sqlite'
+    return os.path.abspath(run) + '/results.sqlite'
+
+
+def samples(store, test, run):
+    metrics = METRICS.get(test, DEFAULT_METRICS)
+    cond = 'metric IN (' + ','.join(['?'] * len(metrics)) + ')'
+    rows = store.select(
+        'SELECT dataset, engine, query, config, metric, repetition, value FROM measurements '
+        'WHERE run = ? AND (' + cond + ' OR ' + LOAD_METRICS + ') ORDER BY repetition',
+        [run] + metrics)
+    result = {}
+    for dataset, engine, query, config, metric, repetition, value in rows:
+        # Skip the run of the trident queries that produced the results
+        if test not in METRICS and engine.startswith('trident') and not metric.startswith('load_') \
+                and repetition == 0:
+            continue
+        result.setdefault((dataset, engine, query, config, metric), []).append(value)
+    # Only the warm runs of the queries are compared: the leading warm-up
+    # runs, such as the cold one, are detected as in experiments-print.py
+    if test not in METRICS:
+        for key in result:
+            if not key[4].startswith('load_'):
+                result[key] = repstats.warm(result[key])
+    return result
+
+
+# Compare the samples of two runs. Returns the rows of the report and the
+# number of regressions.
+def compare(base, new, threshold, alpha):
+    rows = []
+    regressions = 0
+    for key in sorted(set(base.keys()) & set(new.keys())):
+        a = base[key]
+        b = new[key]
+        mbase = statistics.median(a)
+        mnew = statistics.median(b)
+        if mbase == 0:
+            change = 0 if mnew == 0 else float('inf')
+        else:
+            change = (mnew - mbase) / mbase
+        if len(a) < MINSAMPLES or len(b) < MINSAMPLES:
+            p = float('nan')
+            significant = True
+        else:
+            p = repstats.mannwhitney(a, b)
+            significant = p < alpha
+        verdict = ''
+        if significant and change > threshold:
+            verdict = 'REGRESSION'
+            regressions += 1
+        elif significant and change < -threshold:
+            verdict = 'IMPROVEMENT'
+        if verdict != '' and p != p:
+            verdict += ' (no test)'
+        rows.append(list(key) + [len(a), len(b), mbase, mnew, change * 100, p, verdict])
+    return rows, regressions
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Compare the runs of a test and flag the regressions')
+    parser.add_argument('test', help='test of the runs (1, 2, 4, 5, 10, ...)')
+    parser.add_argument('runs', nargs='+', help='baseline run, followed by the runs to compare to it')
+    parser.add_argument('--store', help='results store (default: results.sqlite in the output directory)')
+    parser.add_argument('--threshold', type=float, default=0.1,
+                        help='relative change of the median that is flagged (default 0.1)')
+    parser.add_argument('--alpha', type=float, default=0.05, help='significance level (default 0.05)')
+    args = parser.parse_args()
+    if len(args.runs) < 2:
+        parser.error('at least two runs are needed')
+
+    runs = [os.path.abspath(r) for r in args.runs]
+    store = ResultsDB(args.store or default_store(runs[0]))
+    for run in runs:
+        store.ingest(run, parallel=True)
+    base = samples(store, args.test, runs[0])
+    if len(base) == 0:
+        print('No results for test ' + args.test + ' in ' + runs[0])
+        sys.exit(2)
+
+    regressions = 0
+    for run in runs[1:]:
+        print('*** ' + runs[0] + ' -> ' + run + ' ***')
+        rows, n = compare(base, samples(store, args.test, run), args.threshold, args.alpha)
+        regressions += n
+        print('%-12s %-15s %-12s %-30s %-18s %5s %5s %12s %12s %9s %8s  %s' % (
+            'DATASET', 'ENGINE', 'QUERY', 'CONFIG', 'METRIC', 'N1', 'N2', 'MEDIAN1', 'MEDIAN2', 'CHANGE%',
+            'P', 'VERDICT'))
+        for r in rows:
+            print('%-12s %-15s %-12s %-30s %-18s %5d %5d %12.3f %12.3f %9.1f %8.4f  %s' % tuple(r))
+        print(str(n) + ' regressions, ' + str(len([r for r in rows if r[-1].startswith('IMPROVEMENT')]))
+              + ' improvements out of ' + str(len(rows)) + ' comparisons')
+    store.close()
+    sys.exit(1 if regressions > 0 else 0)
@@ -2,39 +2,34 @@
 
 import sys
 import os
-import math
 import numpy
 import gzip
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import logparse
+import resultsink
+
 print ("QUERY\tCOLD_RUNTIME\tAVG_WARM_RUNTIME\tCOLD_Q_RUNTIME\tAVG_WARM_Q_RUNTIME\tROWS\tMAXMEM_MB\tIO_BYTES")
 for f in os.listdir(sys.argv[1]):
-    if f.startswith("logs"):
-        runtimes = []
-        runtimeQ = []
-        coldR = -1
-        coldRQ = -1
-        rows = -1
-        maxmem = -1
-        iobytes = -1
-        for line in open(sys.argv[1] + "/" + f):
-            if "Time total" in line:
-                if coldR == -1:
-                    coldR = float(line[12:-4])
-                else:
-                    runtimes.append(float(line[12:-4]))
-            if "Time query:" in line:
-                if coldRQ == -1:
-                    coldRQ = float(line[12:-4])
-                else:
-                    runtimeQ.append(float(line[12:-4]))
-            if "Max mem" in line and maxmem == -1:
-                maxmem = line[18:-1]
-            if "IO Read bytes" in line and iobytes == -1:
-                iobytes = line[14:-1]
+    if f.startswith("logs") and not f.endswith('.resources'):
+        records = logparse.parse(sys.argv[1] + "/" + f, logparse.RDF3X)
+        runtimes = logparse.values(records, 'total')
+        runtimeQ = logparse.values(records, 'query')
+        coldR = runtimes[0] if len(runtimes) > 0 else -1
+        coldRQ = runtimeQ[0] if len(runtimeQ) > 0 else -1
+        maxmem = logparse.first(records, 'maxmem')
+        iobytes = logparse.first(records, 'ioread')
 
         nameQuery = f[5:]
-        rows = 0
-        for line in gzip.open(sys.argv[1] + '/results_' + nameQuery + '.gz', 'rb'):
-            if not b' cardinality' in line:
-                rows = rows + 1
-        print (nameQuery + "\t" + str(coldR) + "\t" + str(numpy.mean(runtimes)) + "\t" + str(coldRQ) + "\t" + str(numpy.mean(runtimeQ)) + "\t" + str(rows) + "\t" + str(maxmem) + "\t" + str(iobytes))
+        summary = resultsink.read_summary(sys.argv[1] + '/results_' + nameQuery)
+        if summary is not None:
+            rows = summary['rows']
+        elif os.path.exists(sys.argv[1] + '/results_' + nameQuery + '.gz'):
+            # Results of before the sink
+            rows = 0
+            for line in gzip.open(sys.argv[1] + '/results_' + nameQuery + '.gz', 'rb'):
+                if not b' cardinality' in line:
+                    rows = rows + 1
+        else:
+            rows = -1
+        print (nameQuery + "\t" + logparse.fmt(coldR) + "\t" + str(numpy.mean(runtimes[1:])) + "\t" + logparse.fmt(coldRQ) + "\t" + str(numpy.mean(runtimeQ[1:])) + "\t" + str(rows) + "\t" + logparse.fmt(maxmem) + "\t" + logparse.fmt(iobytes))
@@ -2,58 +2,39 @@
 
 import sys
 import os
-import math
 import numpy
-import gzip
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import logparse
+import resultsink
 
 
 print ("QUERY\tCOLD_RUNTIME\tAVG_WARM_RUNTIME\tCOLD_Q_RUNTIME\tAVG_WARM_Q_RUNTIME\tROWS\tMAXMEM_MB\tIO_BYTES")
 for f in os.listdir(sys.argv[1]):
-    if f.startswith("logs"):
-        runtimes = []
-        runtimeQO = []
-        runtimeQE = []
-        coldR = -1
-        coldRQO = -1
-        coldRQE = -1
-        rows = -1
-        maxmem = -1
-        iobytes = -1
-        for line in open(sys.argv[1] + "/" + f):
-            if "Runtime total" in line:
-                if coldR == -1:
-                    coldR = float(line[66:-4])
-                else:
-                    runtimes.append(float(line[66:-4]))
-            if "Runtime queryexec:" in line:
-                if coldRQE == -1:
-                    coldRQE = float(line[66:-4])
-                else:
-                    runtimeQE.append(float(line[66:-4]))
-            if "Runtime queryopti:" in line:
-                if coldRQO == -1:
-                    coldRQO = float(line[66:-4])
-                else:
-                    runtimeQO.append(float(line[66:-4]))
-            if "Max memory" in line and maxmem == -1:
-                maxmem = line[64:-4]
-            if rows == -1 and "# rows" in line:
-                rows = int(line[56:])
-            if "Process IO Read bytes" in line and iobytes == -1:
-                # Note: the second run is the "cold" run, the first run is for the query results and IO bytes
-                # after which the cache gets flushed.
-                iobytes = line[72:-1]
-                coldR = -1
-                coldRQE = -1
-                coldRQO = -1
+    if f.startswith("logs") and not f.endswith('.resources'):
+        records = logparse.parse(sys.argv[1] + "/" + f, logparse.TRIDENT)
+        # Note: the second run is the "cold" run, the first run is for the query results and IO bytes
+        # after which the cache gets flushed.
+        after = logparse.first_line(records, 'ioread')
+        runtimes = logparse.values(records, 'total', after)
+        runtimeQE = logparse.values(records, 'queryexec', after)
+        coldR = runtimes[0] if len(runtimes) > 0 else -1
+        coldRQE = runtimeQE[0] if len(runtimeQE) > 0 else -1
+        rows = int(logparse.first(records, 'rows'))
+        maxmem = logparse.first(records, 'maxmem')
+        iobytes = logparse.first(records, 'ioread')
 
         nameQuery = f[5:]
 
-        if rows == -1:
+        summary = resultsink.read_summary(sys.argv[1] + '/results_' + nameQuery)
+        if rows == -1 and summary is not None:
+            rows = summary['rows']
+        elif rows == -1 and os.path.exists(sys.argv[1] + '/results_' + nameQuery):
+            # Results of before the sink
             rf = open(sys.argv[1] + '/results_' + nameQuery)
             rows = 0
             for line in rf:
                 if not "<empty result" in line:
                     rows = rows + 1
 
-        print (nameQuery + "\t" + str(coldR) + "\t" + str(numpy.mean(runtimes)) + "\t" + str(coldRQE) + "\t" + str(numpy.mean(runtimeQE)) + "\t" + str(rows) + "\t" + str(maxmem) + "\t" + str(iobytes))
+        print (nameQuery + "\t" + logparse.fmt(coldR) + "\t" + str(numpy.mean(runtimes[1:])) + "\t" + logparse.fmt(coldRQE) + "\t" + str(numpy.mean(runtimeQE[1:])) + "\t" + str(rows) + "\t" + logparse.fmt(maxmem) + "\t" + logparse.fmt(iobytes))
@@ -1,166 +1,155 @@
+import os
 import sys
+import argparse
 import matplotlib as mpl
 mpl.use('pdf')
 import matplotlib.pyplot as plt
 import matplotlib.backends.backend_pdf
 import matplotlib.gridspec as gridspec
 import numpy as np
-from datetime import datetime
-
-
-events = [('Starting the loading', 'Sorting'),
-          ('Start creating the tree...','NODEMGR'),
-          #('Start sorting...','Sorting'),
-          ('Start inserting...','Binary Tables'),
-          ('Start process generating new permutation','New Perm')]
-
-
-def label_value(line):
-    idx = line.find('=')
-    label = line[0:idx].strip()
-    value = line[idx+1:].strip()
-    return label, value
-
-
-def plot(parsedEvents, x, ys, ylims, labels, namefile, sample):
-    if sample < 1.0:
-        elsToSample = len(x) * sample
-        inter = int(len(x) / elsToSample)
-        x = x[::inter]
-
-    parseEventsMin = []
-    parseEventsLbs = []
-    parseEventsMin.append(0)
-    parseEventsLbs.append('Encoding')
-    for p in parsedEvents:
-        parseEventsMin.append(int(p[0]))
-        parseEventsLbs.append(p[1])
-        # After 'Create Tree' stops (only sampling)
-        if p[1] == 'NODEMGR':
-            break
+from datetime import datetime, timedelta, timezone
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import logparse
+
+# Plot the CPU load, the memory and the I/O of one or more trident loads
+# from the STATS lines of their logs. With several logs (e.g. loads with
+# different --maxThreads or --readThreads) the loads are overlaid on one
+# time axis, each starting at 0.
+
+labels = {'encoding': 'Encoding', 'sorting': 'Sorting', 'tree': 'NODEMGR', 'tables': 'Binary Tables',
+          'permutations': 'New Perm'}
+
+
+class Load:
+    def __init__(self, path, label):
+        self.label = label
+        self.stats = logparse.load_stats(path)
+        self.phases = logparse.load_phases(path)
+        if len(self.phases) > 0:
+            self.start = self.phases[0][1]
+            self.end = self.phases[-1][2]
+        elif len(self.stats) > 0:
+            self.start = self.stats['time'][0]
+            self.end = self.stats['time'][-1]
+        else:
+            self.start = self.end = 0
+        # I/O per second, from the time between the STATS lines
+        t = self.stats['time']
+        dt = np.diff(t, prepend=t[0] - 10 if len(t) > 0 else 0)
+        if len(dt) > 1:
+            dt[0] = np.median(dt[1:])
+        dt[dt <= 0] = 1
+        self.diskr = self.stats['diskr'] / dt
+        self.diskw = self.stats['diskw'] / dt
+
+    def x(self, scale):
+        return (self.stats['time'] - self.start) / scale
+
+
+def plot(loads, namefile, points):
+    duration = max([l.end - l.start for l in loads] + [1])
+    # Minutes, or hours for loads that take days
+    if duration > 2 * 24 * 3600:
+        scale, unit = 3600, 'Hours'
+    else:
+        scale, unit = 60, 'Minutes'
+    xmax = duration / scale
+    maxmem = max([np.max(l.stats['mem']) for l in loads if len(l.stats) > 0] + [0])
+    # assuming at least 4G, and doubling until maxmem seems reasonable
+    memlimit = 4
+    while maxmem > 1.3 * memlimit:
+        memlimit += memlimit
+    single = len(loads) == 1
 
     pdf = matplotlib.backends.backend_pdf.PdfPages(namefile)
-
     fig = plt.figure()
     gs = gridspec.GridSpec(2, 1)
-
     # First I plot CPU load and Memory consumption in two graphs
-    for i in range(2):
-        y = ys[i]
-        ylim = ylims[i]
-        label = labels[i]
-        if sample < 1.0:
-            y = y[::inter]
-        # subfig = fig.add_subplot(210 + i + 1)
+    for i, (column, ylim, ylabel) in enumerate([('cpu', 100, 'CPU Load (%)'), ('mem', memlimit, 'RAM (GB)')]):
         subfig = plt.subplot(gs[i])
-        subfig.plot(x, y)
-        subfig.set_ylabel(label)
+        for load in loads:
+            x, y = logparse.minmax_downsample(load.x(scale), load.stats[column], points)
+            line = subfig.plot(x, y, label=load.label)[0]
+            if single:
+                subfig.fill_between(x, y, color='blue')
+            subfig.vlines([(p[1] - load.start) / scale for p in load.phases], 0, ylim, linestyles='dotted',
+                          colors=line.get_color())
+        subfig.set_ylabel(ylabel)
         for label in subfig.get_yticklabels():
             label.set_fontsize(10)  # Size here overrides font_prop
-        subfig.fill_between(x, y, color='blue')
-        subfig.vlines(parseEventsMin, 0, ylim, linestyles='dotted')
-        subfig.set_xlim([0,np.max(x)])
+        subfig.set_xlim([0, xmax])
         subfig.set_ylim([0, ylim])
-        if i == 1:
-            plt.xticks(parseEventsMin, parseEventsLbs, rotation=0, fontsize=8)
+        if i == 1 and single:
+            # Phases until 'Create Tree' stops (only sampling)
+            phases = []
+            for p in loads[0].phases:
+                phases.append(p)
+                if p[0] == 'tree':
+                    break
+            plt.xticks([(p[1] - loads[0].start) / scale for p in phases], [labels[p[0]] for p in phases],
+                       rotation=0, fontsize=8)
         else:
-            subfig.set_xlabel('Minutes', labelpad=0)
-            plt.xticks(np.arange(0, max(x), 200), fontsize=10)
+            subfig.set_xlabel(unit, labelpad=0)
+            plt.xticks(fontsize=10)
+        if i == 0 and not single:
+            subfig.legend(fontsize=8)
     gs.tight_layout(fig, h_pad=0.5)
     pdf.savefig(fig)
     plt.close()
 
     # Now I want to plot one more graph with the stacked I/O
     fig = plt.figure()
-    diskr = ys[2]
-    diskw = ys[3]
-    if sample < 1.0:
-        diskr = diskr[::inter]
-        diskw = diskw[::inter]
-    diskr = np.array(diskr)
-    diskw = np.array(diskw)
-    plt.plot(x, diskr, label='Read')  # Bytes read
-    plt.plot(x, diskr + diskw, label='Write')  # Bytes written
-    plt.fill_between(x, diskw + diskr, color='green')
-    plt.fill_between(x, diskr, color='blue')
-    plt.vlines(parseEventsMin, 0, np.max(diskr + diskw), linestyles='dotted')
-    plt.ylabel('I/O (MB)')
-    plt.xlabel('Minutes')
-    plt.xlim([0,np.max(x)])
-    plt.legend()
+    top = 0
+    for load in loads:
+        x = load.x(scale)
+        xr, diskr = logparse.minmax_downsample(x, load.diskr, points)
+        xt, total = logparse.minmax_downsample(x, load.diskr + load.diskw, points)
+        if single:
+            plt.plot(xr, diskr, label='Read')  # Bytes read
+            plt.plot(xt, total, label='Write')  # Bytes written
+            plt.fill_between(xt, total, color='green')
+            plt.fill_between(xr, diskr, color='blue')
+        else:
+            line = plt.plot(xt, total, label=load.label + ' read+write')[0]
+            plt.plot(xr, diskr, linestyle='dashed', color=line.get_color(), label=load.label + ' read')
+        if len(total) > 0:
+            top = max(top, np.max(total))
+    for load in loads:
+        plt.vlines([(p[1] - load.start) / scale for p in load.phases], 0, top, linestyles='dotted')
+    plt.ylabel('I/O (MB/s)')
+    plt.xlabel(unit)
+    plt.xlim([0, xmax])
+    plt.legend(fontsize=8)
     pdf.savefig(fig)
     plt.close()
     pdf.close()
 
 
-time = []
-diskr = []
-diskw = []
-cpu = []
-mem = []
-i = 0
-prev_diskr = 0
-prev_diskw = 0
-
-timeline = []
-start = None  # Start time
-end = None  # End time
-maxmem = 0
-done = []
-for line in open(sys.argv[1], "rt"):
-    if start is None:
-        start = line[20:39]
-    end = line[20:39]
-
-    if "STATS" not in line:
-        # Check whether the string corresponds to an event
-        idx = 0
-        for e in events:
-            if e[0] in line and not e[0] in done:
-                timeline.append((line[20:39], line[42:-1], idx))
-                done.append(e[0])
-            idx += 1
-        continue
-
-    line = line[:-1]
-    tokens = line.split('\t')
-    # Get time
-    t = tokens[0][20:39]
-    # time.append(t)
-    time.append(i / 60)
-    i += 10
-    cpu_l, cpu_v = label_value(tokens[2])
-    mem_l, mem_v = label_value(tokens[1])
-    diskr_l, diskr_v = label_value(tokens[5])
-    diskw_l, diskw_v = label_value(tokens[6])
-
-    diskr.append(int(diskr_v) / 10)
-    diskw.append(int(diskw_v) / 10)
-    cpu.append(int(cpu_v))
-    curmem = int(mem_v)
-    mem.append(curmem)
-    if (curmem > maxmem):
-        maxmem = curmem
-# assuming at least 4G, and doubling until maxmem seems reasonable
-memlimit = 4
-while maxmem > 1.3 * memlimit:
-    memlimit += memlimit
-
-# Parse the various events
-start = datetime.strptime(start, '%Y-%m-%d %H:%M:%S')
-end = datetime.strptime(end, '%Y-%m-%d %H:%M:%S')
-parsedEvents = []
-for t in timeline:
-    time_event = datetime.strptime(t[0], '%Y-%m-%d %H:%M:%S')
-    duration = time_event - start
-    minutes = int(duration.total_seconds() / 60)
-    parsedEvents.append((minutes, events[t[2]][1], duration))
-
-plot(parsedEvents, time, [cpu, mem, diskr, diskw], [100, memlimit, 0, 0],
-     ['CPU Load (%)', 'RAM (GB)', 'I/O MB read', 'I/O MB written'],
-     'output.pdf', 0.01)
-
-# Print some general statistics
-print('Start time:', start.strftime('%Y-%m-%d %H:%M:%S'), 'End time:', end.strftime('%Y-%m-%d %H:%M:%S'), 'Duration:', end - start)
-for p in parsedEvents:
-    print(p[1], '=>', p[0])
+def fmt_time(t):
+    return datetime.fromtimestamp(t, timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Plot the resources used by trident loads')
+    parser.add_argument('logs', nargs='+', help='logs of the loads (<db>.log)')
+    parser.add_argument('-o', '--output', default='output.pdf', help='output file (default output.pdf)')
+    parser.add_argument('--labels', help='comma separated labels of the loads (default: the names of the logs)')
+    parser.add_argument('--points', type=int, default=1000,
+                        help='number of buckets of the min/max downsampling of every series (default 1000)')
+    args = parser.parse_args()
+    names = [os.path.basename(l) for l in args.logs]
+    if args.labels is not None:
+        names = args.labels.split(',')
+        if len(names) != len(args.logs):
+            parser.error('there must be one label per log')
+
+    loads = [Load(path, name) for path, name in zip(args.logs, names)]
+    plot(loads, args.output, args.points)
+
+    # Print some general statistics
+    for load in loads:
+        print(load.label + ':', 'Start time:', fmt_time(load.start), 'End time:', fmt_time(load.end),
+              'Duration:', timedelta(seconds=int(load.end - load.start)))
+        for p in load.phases:
+            print(labels[p[0]], '=>', int((p[1] - load.start) / 60))
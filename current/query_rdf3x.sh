@@ -4,8 +4,22 @@ INPUTDIR=$1
 QUERIES=$2
 OUTPUTDIR=$3
 CMD=$4
+# Rows of the answers kept as a sample (0 for none)
+SAMPLE=${5:-0}
+# Partitions of the hashes of the rows kept for check_results.py (0 for none)
+PARTITIONS=${6:-0}
+# Seconds after which a query is killed, and GB of RSS above which it is
+# killed (0 for no limit)
+TIMEOUT=${7:-10800}
+RSSLIMIT=${8:-0}
+# How the page cache is emptied before every query: evict (the files of the
+# database only), drop_caches (the whole machine, with $DROP_CACHES) or none
+CACHE=${9:-evict}
+PAGECACHE="`dirname $0`/../pagecache.py"
 PARAMS="6"
-TIMEOUT=180m
+# The answers are streamed through the sink, which keeps only their number
+# of rows and checksum (results_<query>.summary)
+SINK="`dirname $0`/../resultsink.py"
 
 if [ -d $OUTPUTDIR ]; then
 	echo "Removing output directory $OUTPUTDIR ..."
@@ -18,15 +32,19 @@ for FILENAME in `ls $QUERIES`
 do
 echo "Querying query $QUERIES/$FILENAME"
 
-sudo /cm/shared/package/utils/bin/drop_caches
+case $CACHE in
+evict) python3 $PAGECACHE evict $INPUTDIR > ${OUTPUTDIR}/logs_$FILENAME ;;
+drop_caches) ${DROP_CACHES:-sudo /cm/shared/package/utils/bin/drop_caches}
+    python3 $PAGECACHE residency $INPUTDIR > ${OUTPUTDIR}/logs_$FILENAME ;;
+*) python3 $PAGECACHE residency $INPUTDIR > ${OUTPUTDIR}/logs_$FILENAME ;;
+esac
 
-timeout $TIMEOUT $CMD $INPUTDIR $QUERIES/$FILENAME $PARAMS 2> ${OUTPUTDIR}/logs_$FILENAME > ${OUTPUTDIR}/results_$FILENAME
-if [[ "$?" == "124" ]]; then
-    echo "TIMEOUT" >> ${OUTPUTDIR}/logs_${FILENAME} 
+python3 $SINK --sample $SAMPLE --partitions $PARTITIONS --timeout $TIMEOUT --rsslimit $RSSLIMIT ${OUTPUTDIR}/results_$FILENAME $CMD $INPUTDIR $QUERIES/$FILENAME $PARAMS 2>> ${OUTPUTDIR}/logs_$FILENAME
+RET=$?
+if [ "$RET" = "124" ] || [ "$RET" = "137" ]; then
+    # The sink appended the reason (WATCHDOG: ...) to the log
     #the results are invalid. Remove them                                   
-    echo "There was a timeout. Removing results ..."
-    rm ${OUTPUDIR}/results_$FILENAME
-else
-    gzip ${OUTPUTDIR}/results_$FILENAME
+    echo "The query was killed. Removing results ..."
+    rm -rf ${OUTPUTDIR}/results_$FILENAME.summary ${OUTPUTDIR}/results_$FILENAME.sample.gz ${OUTPUTDIR}/results_$FILENAME.hashes
 fi
 done
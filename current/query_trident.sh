@@ -6,6 +6,10 @@ OUTPUTDIR=$3
 QUERY=$4 #query or query_native
 CMD=$5
 EXTRAOPTS=$6
+# How the page cache is emptied before every run: evict (the files of the
+# database only), drop_caches (the whole machine, with $DROP_CACHES) or none
+CACHE=${7:-evict}
+PAGECACHE="`dirname $0`/../pagecache.py"
 DBNAME=`basename $INPUTDIR`
 
 if [ -d $OUTPUTDIR ]; then
@@ -14,15 +18,23 @@ if [ -d $OUTPUTDIR ]; then
 fi
 mkdir -p $OUTPUTDIR
 
+flush_cache() {
+case $CACHE in
+evict) python3 $PAGECACHE evict $INPUTDIR ;;
+drop_caches) ${DROP_CACHES:-sudo /cm/shared/package/utils/bin/drop_caches} ;;
+esac
+}
+
 echo "Querying the data..."
 for FILENAME in `ls $QUERIES`
 do
-sudo /cm/shared/package/utils/bin/drop_caches
+flush_cache
 echo "Querying query $QUERIES/$FILENAME for getting results"
 $CMD $QUERY $EXTRAOPTS -i ${INPUTDIR} -q $QUERIES/$FILENAME -l info > ${OUTPUTDIR}/logs_${FILENAME}_results 2> /dev/null
-sudo /cm/shared/package/utils/bin/drop_caches
+flush_cache
 echo "Querying query $QUERIES/$FILENAME for stats"
-$CMD $QUERY $EXTRAOPTS --decodeoutput false -i ${INPUTDIR} -q $QUERIES/$FILENAME -r 6 -l info > /dev/null 2> ${OUTPUTDIR}/logs_$FILENAME
+python3 $PAGECACHE residency $INPUTDIR > ${OUTPUTDIR}/logs_$FILENAME
+$CMD $QUERY $EXTRAOPTS --decodeoutput false -i ${INPUTDIR} -q $QUERIES/$FILENAME -r 6 -l info > /dev/null 2>> ${OUTPUTDIR}/logs_$FILENAME
 done
 
 echo "...done"
@@ -1,41 +1,27 @@
-#!/usr/bin/python
+#!/usr/bin/python3
 
 import sys
 import os
-import math
 import numpy
-import gzip
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import logparse
 
-print "QUERY\tCOLD_RUNTIME_MS\tAVG_WARM_RUNTIME_MS\tCOLD_Q_RUNTIME_MS\tAVG_WARM_Q_RUNTIME_MS\tROWS\tMAXMEM_MB\tIO_BYTES"
+
+print ("QUERY\tCOLD_RUNTIME_MS\tAVG_WARM_RUNTIME_MS\tCOLD_Q_RUNTIME_MS\tAVG_WARM_Q_RUNTIME_MS\tROWS\tMAXMEM_MB\tIO_BYTES")
 for f in os.listdir(sys.argv[1]):
     if not f.endswith("results"):
-        runtimes = []
-        runtimeQ = []
-        coldR = 0
-        coldRQ = 0
-        rows = -1
-        maxmem = -1
-        iobytes = -1
-        for line in open(sys.argv[1] + "/" + f):
-            if "Runtime totalexec:" in line:
-                if coldR == 0:
-                    coldR = float(line[62:-4])
-                else:
-                    runtimes.append(float(line[62:-4]))
-            if "Runtime queryexec:" in line:
-                if coldRQ == 0:
-                    coldRQ = float(line[62:-4])
-                else:
-                    runtimeQ.append(float(line[62:-4]))
-            if "Max memory" in line and maxmem == -1:
-                maxmem = line[60:-4]
-            if "Process IO Read bytes" in line and iobytes == -1:
-                iobytes = line[62:-1]
+        records = logparse.parse(sys.argv[1] + "/" + f, logparse.TRIDENT)
+        runtimes = logparse.values(records, 'total')
+        runtimeQ = logparse.values(records, 'queryexec')
+        coldR = runtimes[0] if len(runtimes) > 0 else 0
+        coldRQ = runtimeQ[0] if len(runtimeQ) > 0 else 0
+        maxmem = logparse.first(records, 'maxmem')
+        iobytes = logparse.first(records, 'ioread')
 
         nameQuery = f[5:]
         rf = open(sys.argv[1] + '/logs_' + nameQuery + '_results')
         rows = 0
         for line in rf:
             rows = rows + 1
-        print f + "\t" + str(coldR) + "\t" + str(round(numpy.mean(runtimes),3)) + "\t" + str(round(coldRQ,3)) + "\t" + str(round(numpy.mean(runtimeQ),3)) + "\t" + str(rows) + "\t" + str(maxmem) + "\t" + str(iobytes)
+        print (f + "\t" + logparse.fmt(coldR) + "\t" + str(round(numpy.mean(runtimes[1:]),3)) + "\t" + str(round(coldRQ,3)) + "\t" + str(round(numpy.mean(runtimeQ[1:]),3)) + "\t" + str(rows) + "\t" + logparse.fmt(maxmem) + "\t" + logparse.fmt(iobytes))
@@ -1,45 +1,28 @@
+import os
+import re
 import sys
 import numpy as np
-from os import listdir
 from astropy.table import Table
 from astropy.io import ascii
+from resultsdb import ResultsDB
+import repstats
 
-resultsdir = sys.argv[1]
-tests = sys.argv[2]
-fmt = sys.argv[3]
 
-
-def gettime(line, startSubStr, endSubstr):
-    pos = line.find(startSubStr)
-    posEnd = line.find(endSubstr)
-    number = line[pos + len(startSubStr):posEnd]
-    return float(number)
-
-
-def print_test1(resultsdir, fmt):
+def print_test1(store, resultsdir, fmt):
+    run = os.path.abspath(resultsdir + '/results')
+    # Warm runtime of the first scan of every (perm, type, config)
     results = {}
     confs = set()
-    for perm in range(6):
-        results[perm] = {}
-        for typ in range(5):
-            results[perm][typ] = {}
-            for f in listdir(resultsdir + '/results'):
-                # get last part of the name
-                pos = f.find('_')
-                name = f[pos+1:]
-                confs.add(name)
-                for line in open(resultsdir + '/results/' + f, 'rt'):
-                    if line.startswith('PERM'):
-                        continue
-                    tokens = line.split('\t')
-                    if int(tokens[0]) == perm and int(tokens[1]) == typ:
-                        # Get warm runtime
-                        results[perm][typ][name] = float(tokens[5])
-                        break
+    for config, query, value in store.select(
+            "SELECT config, query, value FROM measurements WHERE run = ? AND metric = 'warm' AND repetition = 0",
+            (run,)):
+        perm, typ = query.split('-')
+        confs.add(config)
+        results[(int(perm), int(typ), config)] = value
     columns = ['perm', 'type']
     perms = []
     types = []
-    confs = [n for n in confs]
+    confs = sorted(confs)
     lenconfs = len(confs)
     colconfs = []
     colconfs.append(perms)
@@ -53,108 +36,120 @@ def print_test1(resultsdir, fmt):
             types.append(typ)
             for idxconf in range(lenconfs):
                 c = confs[idxconf]
-                v = results[perm][typ][c]
+                v = results[(perm, typ, c)]
                 colconfs[idxconf+2].append(v)
     table = Table(colconfs,
                   names=columns)
     ascii.write(table, sys.stdout, format=fmt)
 
 
-def print_test2_support(inputdir, column, nqueries, dataset, queries, lineToCatch):
-    # Get prefix suffix
-    prefix = None
-    suffix = None
-    for f in listdir(inputdir):
-        if not f.endswith('results') and not f.endswith('.gz') and str(nqueries-1) in f:
-            prefix = f[:f.find(str(nqueries-1))]
-            suffix = f[f.find(str(nqueries-1))+len(str(nqueries-1)):]
-    for j in range(nqueries + 1):
-        for f in listdir(inputdir):
-            if f == prefix + str(j) + suffix:
-                # Read the file. Get the runtimes
-                runtimes = []
-                for line in open(inputdir + '/' + f, 'rt'):
-                    if lineToCatch in line:
-                        time = gettime(line, ': ', 'ms.')
-                        runtimes.append(time)
-                if queries is not None:
-                    queries.append(dataset + '-' + str(j))
-                column.append(np.average(np.array(runtimes[1:]))) # all but the first
-
-
-def print_test2(resultsdir, fmt):
+# Queries of a dataset, in the order of their number
+def test2_queries(store, run, dataset):
+    queries = [r[0] for r in store.select(
+        "SELECT DISTINCT query FROM measurements WHERE run = ? AND dataset = ? AND engine = 'trident'",
+        (run, dataset))]
+    queries.sort(key=lambda q: int('0' + re.sub(r'\D', '', q)))
+    return queries
+
+
+def print_test2_support(store, run, column, dataset, engine, queries, metric):
+    for query in queries:
+        runtimes = [r[0] for r in store.select(
+            'SELECT value FROM measurements WHERE run = ? AND dataset = ? AND engine = ? AND query = ? '
+            'AND metric = ? AND repetition > 0 ORDER BY repetition', # all but the first
+            (run, dataset, engine, query, metric))]
+        if len(runtimes) == 0:
+            column.append(np.nan)
+        else:
+            column.append(np.average(runtimes))
+
+
+def print_test2(store, resultsdir, fmt):
     # Three columns. Trident native-rdf3x and original RDF3X
     datasets = ['lubm1', 'btc2012']
-    nqueries = [ 14, 5 ]
+    run = os.path.abspath(resultsdir + '/results')
     queries = []
     trident = []
     trident_native = []
     rdf3x = []
-    for i in range(len(datasets)):
-        dataset = datasets[i]
-        # Trident
-        inputdir = resultsdir + '/results'
-        inputdir2 = inputdir + '/' + dataset
-        print_test2_support(inputdir2, trident, nqueries[i], dataset, queries, 'Runtime queryopti')
-        inputdir2 = inputdir + '/' + dataset + '-native'
-        print_test2_support(inputdir2, trident_native, nqueries[i], dataset, None, 'Runtime queryopti')
-        # RDF3X
-        inputdir = resultsdir + '/results' + dataset + '-rdf3x'
-        print_test2_support(inputdir, rdf3x, nqueries[i], dataset, None, 'Time optimizer')
+    for dataset in datasets:
+        dqueries = test2_queries(store, run, dataset)
+        queries += [dataset + '-' + re.sub(r'\D', '', q) for q in dqueries]
+        print_test2_support(store, run, trident, dataset, 'trident', dqueries, 'queryopti')
+        print_test2_support(store, run, trident_native, dataset, 'trident-native', dqueries, 'queryopti')
+        print_test2_support(store, run, rdf3x, dataset, 'rdf3x', dqueries, 'optimizer')
 
     table = Table([queries, trident_native, trident, rdf3x],
                   names=['Queries', 'Trident-ISO', 'Trident-RDF3X', 'RDF3X'])
     ascii.write(table, sys.stdout, format=fmt)
 
 
-def print_test4(resultsdir, fmt):
-    snapdir = resultsdir + '/snap'
-    datasets = ['astro', 'web', 'twitter']
-    snaplines = { 'hits' : 'Hits', 'pagerank' : 'PR', 'clustcoef' : 'ClusterCoeff',
-                 'triangles' : 'Triangles', 'diameter' : 'Diameter',
-                 'maxwcc' : 'MaxWcc', 'maxscc' : 'MaxScc',
-                 'rw' : 'RandomWalk', 'bfs' : 'BFS',
-                 'mod' : 'Mod', 'betcentr' : 'BetCentr'}
-    inverseSnap = []
-    resultsSnap = {}
-    for k,v in snaplines.items():
-        inverseSnap.append((v,k))
+# Whether the answer of an engine matched the reference answer, as checked by
+# check_results.py
+def test2_match(store, run, dataset, engine, query):
+    rows = store.select(
+        "SELECT value FROM measurements WHERE run = ? AND dataset = ? AND engine = ? AND query = ? "
+        "AND metric = 'result_match'", (run, dataset, engine, query))
+    if len(rows) == 0:
+        return '-'
+    return 'ok' if rows[0][0] == 1 else 'MISMATCH'
+
+
+# Median, 95th percentile and confidence interval of the median of the warm
+# total runtimes, and whether the answer matched the other engines. The
+# warm-up runs are detected rather than assumed to be the first one. For
+# trident, repetition 0 is the run that produced the results.
+def print_test2_stats(store, resultsdir, fmt):
+    datasets = ['lubm1', 'btc2012']
+    engines = [('trident-native', 'Trident-ISO', 1), ('trident', 'Trident-RDF3X', 1), ('rdf3x', 'RDF3X', 0)]
+    run = os.path.abspath(resultsdir + '/results')
+    columns = [[]]
+    names = ['Queries']
+    for engine, label, firstrep in engines:
+        for stat in ['median', 'p95', 'ci_low', 'ci_high', 'match']:
+            columns.append([])
+            names.append(label + ' ' + stat)
     for dataset in datasets:
-        resultsSnap[dataset] = {}
-        fileToUse = None
-        for f in listdir(snapdir):
-            if f.endswith(dataset):
-                fileToUse = f
-                break
-        if fileToUse is None:
-            continue
-        # Process the file
-        for line in open(snapdir + '/' + fileToUse):
-            found = False
-            for p in inverseSnap:
-                if p[0] in line:
-                    found = p[1]
-                    break
-            if found is not False:
-                resultsSnap[dataset][found] = gettime(line, ': ', ' ms.')
-
-    tridentdir = resultsdir + '/trident'
-    resultsTrident = {}
-    tasks = [k for k in snaplines.keys()]
+        for query in test2_queries(store, run, dataset):
+            columns[0].append(dataset + '-' + re.sub(r'\D', '', query))
+            col = 1
+            for engine, label, firstrep in engines:
+                runtimes = [r[0] for r in store.select(
+                    "SELECT value FROM measurements WHERE run = ? AND dataset = ? AND engine = ? AND query = ? "
+                    "AND metric = 'total' AND repetition >= ? ORDER BY repetition",
+                    (run, dataset, engine, query, firstrep))]
+                summary = repstats.summary(runtimes)
+                for stat in ['median', 'p95', 'ci_low', 'ci_high']:
+                    columns[col].append(summary[stat])
+                    col += 1
+                columns[col].append(test2_match(store, run, dataset, engine, query))
+                col += 1
+    table = Table(columns, names=names)
+    ascii.write(table, sys.stdout, format=fmt)
+
+
+# Runtime of every analytics task per dataset (the last one reported)
+def test4_runtimes(store, run, engine):
+    results = {}
+    for dataset, task, runtime in store.select(
+            "SELECT dataset, query, value FROM measurements WHERE run = ? AND engine = ? AND metric = 'runtime' "
+            "ORDER BY repetition", (run, engine)):
+        if dataset not in results:
+            results[dataset] = {}
+        results[dataset][task] = runtime
+    return results
+
+
+def print_test4(store, resultsdir, fmt):
+    datasets = ['astro', 'web', 'twitter']
+    run = os.path.abspath(resultsdir)
+    tasks = ['hits', 'pagerank', 'clustcoef', 'triangles', 'diameter', 'maxwcc', 'maxscc', 'rw', 'bfs', 'mod',
+             'betcentr']
+    resultsSnap = test4_runtimes(store, run, 'snap')
+    resultsTrident = test4_runtimes(store, run, 'trident')
     for dataset in datasets:
-        resultsTrident[dataset] = {}
-        for task in tasks:
-            fileToUse = None
-            for f in listdir(tridentdir):
-                if f.startswith(dataset) and f.endswith(task):
-                    fileToUse = f
-                    break
-            if fileToUse is None:
-                continue
-            for line in open(tridentdir + '/' + fileToUse):
-                if 'Runtime' in line:
-                    runtime = gettime(line, ': ', ' ms.')
-                    resultsTrident[dataset][task] = runtime
+        resultsSnap.setdefault(dataset, {})
+        resultsTrident.setdefault(dataset, {})
 
     t_snaps = []
     t_trident = []
@@ -178,11 +173,25 @@ def print_test4(resultsdir, fmt):
 
 
 
-if tests == 'all' or tests == '1':
-    print_test1(resultsdir + '/test1', fmt)
+if __name__ == '__main__':
+    resultsdir = sys.argv[1]
+    tests = sys.argv[2]
+    fmt = sys.argv[3]
+    # The results store, brought up to date with the results directory
+    storefile = resultsdir + '/results.sqlite'
+    if len(sys.argv) > 4:
+        storefile = sys.argv[4]
+    store = ResultsDB(storefile)
+    store.ingest(resultsdir, parallel=True)
+
+    if tests == 'all' or tests == '1':
+        print_test1(store, resultsdir + '/test1', fmt)
+
+    if tests == 'all' or tests == '2':
+        print_test2(store, resultsdir + '/test2', fmt)
 
-if tests == 'all' or tests == '2':
-    print_test2(resultsdir + '/test2', fmt)
+    if tests == 'all' or tests == '2stats':
+        print_test2_stats(store, resultsdir + '/test2', fmt)
 
-if tests == 'all' or tests == '4':
-    print_test4(resultsdir + '/test4', fmt)
+    if tests == 'all' or tests == '4':
+        print_test4(store, resultsdir + '/test4', fmt)
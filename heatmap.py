@@ -0,0 +1,151 @@
+import os
+import sys
+import argparse
+
+# Which parts of a trident database the queries touch. With heatmap=true in
+# the config, the residency of the files of the database (see pagecache.py)
+# is taken before and after the cold run of every query, and the bytes
+# brought into the page cache by the query are written per file and region
+# to heat_<query> next to its log, with the page faults of the query:
+#
+#   # minflt <n> majflt <n> region <bytes>
+#   FILE  SIZE  REGION  TOUCHED
+#
+# where FILE is relative to the database and REGION is the index of a region
+# of the file. The heat files of some results dirs (e.g. the datasets of
+# test 2) are aggregated into a table per dataset and file region, and a
+# map with a row per file and a character per region, darker when more of
+# the queries touched it.
+
+PREFIX = 'heat_'
+SHADES = ' .:-=+*#%@'
+
+
+# Write the heat file of a query, and the totals to its log
+def save(path, db, touched, minflt, majflt, region, log=None):
+    total = 0
+    with open(path, 'wt') as fout:
+        fout.write('# minflt %d majflt %d region %d\n' % (minflt, majflt, region))
+        fout.write('FILE\tSIZE\tREGION\tTOUCHED\n')
+        for f in sorted(touched):
+            size = os.path.getsize(f) if os.path.exists(f) else 0
+            for r in sorted(touched[f]):
+                fout.write('%s\t%d\t%d\t%d\n' % (os.path.relpath(f, db), size, r, touched[f][r]))
+                total += touched[f][r]
+    if log is not None:
+        log.write('HEAT: touched MB %.3f\n' % (total / (1024 ** 2)))
+        log.write('FAULTS: minflt %d\n' % minflt)
+        log.write('FAULTS: majflt %d\n' % majflt)
+        log.flush()
+
+
+def load(path):
+    header = {}
+    rows = []
+    for line in open(path, 'rt'):
+        line = line.rstrip('\n')
+        if line.startswith('#'):
+            tokens = line[1:].split()
+            for i in range(0, len(tokens) - 1, 2):
+                header[tokens[i]] = int(tokens[i + 1])
+            continue
+        tokens = line.split('\t')
+        if tokens[0] == 'FILE':
+            continue
+        rows.append((tokens[0], int(tokens[1]), int(tokens[2]), int(tokens[3])))
+    return header, rows
+
+
+# The heat files under some dirs, by dataset (the dir of the file)
+def find(dirs):
+    found = {}
+    for d in dirs:
+        for root, subdirs, names in os.walk(d):
+            subdirs.sort()
+            for name in sorted(names):
+                if name.startswith(PREFIX):
+                    found.setdefault(os.path.basename(root), []).append(os.path.join(root, name))
+    return found
+
+
+# {dataset: {'queries': n, 'region': bytes, 'files': {file: {'size': bytes,
+# 'regions': {region: [queries, bytes]}}}}}. The dataset 'all' merges the
+# files of the same name of every dataset.
+def aggregate(found):
+    agg = {}
+    for dataset in sorted(found):
+        for path in found[dataset]:
+            header, rows = load(path)
+            for name in [dataset, 'all']:
+                a = agg.setdefault(name, {'queries': 0, 'region': header.get('region', 0), 'files': {}})
+                a['queries'] += 1
+                for f, size, r, touched in rows:
+                    entry = a['files'].setdefault(f, {'size': 0, 'regions': {}})
+                    entry['size'] = max(entry['size'], size)
+                    cell = entry['regions'].setdefault(r, [0, 0])
+                    cell[0] += 1
+                    cell[1] += touched
+    return agg
+
+
+def write_table(agg, out):
+    out.write('DATASET\tFILE\tREGION\tOFFSET_MB\tQUERIES\tTOUCHED_MB\n')
+    for dataset in sorted(agg):
+        a = agg[dataset]
+        for f in sorted(a['files']):
+            for r, (queries, touched) in sorted(a['files'][f]['regions'].items()):
+                out.write('%s\t%s\t%d\t%.0f\t%d\t%.3f\n' % (dataset, f, r, r * a['region'] / (1024 ** 2),
+                                                           queries, touched / (1024 ** 2)))
+
+
+# A row per file: the fraction of the queries that touched every region,
+# as a shade, with at most 'width' characters (regions merged if needed)
+def render(agg, out, width=64):
+    for dataset in sorted(agg):
+        a = agg[dataset]
+        out.write('%s: %d queries, regions of %g MB\n' % (dataset, a['queries'], a['region'] / (1024 ** 2)))
+        names = sorted(a['files'])
+        pad = max([len(f) for f in names] + [4])
+        for f in names:
+            entry = a['files'][f]
+            nregions = max(1, -(-entry['size'] // a['region'])) if a['region'] > 0 else 1
+            nregions = max(nregions, max(entry['regions']) + 1)
+            per = -(-nregions // width)
+            cells = ''
+            for c in range(-(-nregions // per)):
+                hits = max([entry['regions'].get(r, [0, 0])[0] for r in range(c * per, (c + 1) * per)])
+                level = int(round(hits / a['queries'] * (len(SHADES) - 1)))
+                if hits > 0:
+                    level = max(level, 1)
+                cells += SHADES[level]
+            touched = sum([v[1] for v in entry['regions'].values()])
+            out.write('  %s |%s| %.1f of %.1f MB\n' % (f.ljust(pad), cells, touched / (1024 ** 2),
+                                                       entry['size'] / (1024 ** 2)))
+        out.write('\n')
+
+
+def report(dirs, output, width=64):
+    agg = aggregate(find(dirs))
+    with open(output, 'wt') as fout:
+        write_table(agg, fout)
+    with open(output + '.txt', 'wt') as fout:
+        render(agg, fout, width)
+    return agg
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Heat map of the regions of the databases touched by the queries')
+    parser.add_argument('dirs', nargs='+', help='results dirs with heat_<query> files')
+    parser.add_argument('--width', type=int, default=64, help='characters of a row of the map (default 64)')
+    parser.add_argument('--out', help='write the table to this file and the map to <out>.txt')
+    args = parser.parse_args()
+    agg = aggregate(find(args.dirs))
+    if len(agg) == 0:
+        print('No heat files in ' + ' '.join(args.dirs))
+        sys.exit(1)
+    if args.out is not None:
+        report(args.dirs, args.out, args.width)
+    else:
+        write_table(agg, sys.stdout)
+        sys.stdout.write('\n')
+    render(agg, sys.stdout, args.width)
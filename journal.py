@@ -0,0 +1,103 @@
+import os
+import time
+
+# Journal of the steps of a run of the experiments (a database build, the
+# repetitions of a query, an update of a database, a whole test), so that a
+# run that was interrupted can be resumed. A step is recorded when it starts
+# and when it is done, with its return code and wall time; a step that
+# started but is not done was interrupted, and is run again on a resume. The
+# journal is rewritten to a temporary file and renamed over the old one
+# after every change, so that a crash never leaves half a journal behind.
+#
+# Format: a header line '# run <run> test <test>', then one line per event,
+# tab separated: 'start <step>' or 'done <step> <returncode> <seconds>'.
+
+
+class Journal:
+    def __init__(self, path, name, test):
+        self.path = path
+        self.name = name
+        self.test = test
+        self.started = {}
+        self.finished = {}
+        self.walls = {}
+        self.lines = []
+        if os.path.exists(path):
+            for line in open(path, 'rt'):
+                line = line.rstrip('\n')
+                if line.startswith('#'):
+                    tokens = line.split(' ')
+                    if len(tokens) >= 5 and tokens[1] == 'run':
+                        self.test = tokens[4]
+                    continue
+                tokens = line.split('\t')
+                if tokens[0] == 'start':
+                    self.started[tokens[1]] = True
+                elif tokens[0] == 'done' and len(tokens) == 4:
+                    self.finished[tokens[1]] = int(tokens[2])
+                    self.walls[tokens[1]] = float(tokens[3])
+                else:
+                    continue
+                self.lines.append(line)
+        if test is not None:
+            self.test = test
+        if not os.path.exists(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        self.starttimes = {}
+        self._save()
+
+    def _save(self):
+        with open(self.path + '.tmp', 'wt') as fout:
+            fout.write('# run ' + self.name + ' test ' + self.test + '\n')
+            for line in self.lines:
+                fout.write(line + '\n')
+            fout.flush()
+            os.fsync(fout.fileno())
+        os.replace(self.path + '.tmp', self.path)
+
+    def done(self, step):
+        return step in self.finished
+
+    # Return code of a step that is done
+    def returncode(self, step):
+        return self.finished.get(step)
+
+    # Wall time of a step that is done
+    def seconds(self, step):
+        return self.walls.get(step)
+
+    # The step started in an earlier attempt but never finished
+    def interrupted(self, step):
+        return step in self.started and step not in self.finished
+
+    # Some step whose name starts with 'prefix' started
+    def any_started(self, prefix):
+        return any([s.startswith(prefix) for s in self.started])
+
+    def start(self, step):
+        self.started[step] = True
+        self.starttimes[step] = time.time()
+        self.lines.append('start\t' + step)
+        self._save()
+
+    def finish(self, step, ret=0):
+        if ret is None:
+            ret = 0
+        wall = time.time() - self.starttimes.pop(step, time.time())
+        self.finished[step] = ret
+        self.walls[step] = wall
+        self.lines.append('done\t' + step + '\t' + str(ret) + '\t%.3f' % wall)
+        self._save()
+
+    # Run func(*args, **kwargs) as a step, unless it is already done. Returns
+    # the return code of the step.
+    def run(self, step, func, *args, **kwargs):
+        if self.done(step):
+            print(" Skip " + step + ", done in an earlier attempt")
+            return self.returncode(step)
+        if self.interrupted(step):
+            print(" Run again " + step + ", which was interrupted")
+        self.start(step)
+        ret = func(*args, **kwargs)
+        self.finish(step, ret)
+        return ret
@@ -6,12 +6,35 @@ import shutil
 import subprocess
 import configparser
 import shlex
+import time
+import math
+import random
+import resource
+import statistics
 from datetime import datetime
+from scheduler import Job, Scheduler
+from buildcache import BuildCache
+from resultsdb import ResultsDB
+import logparse
+import repstats
+import resources
+import resultsink
+import check_results
+import mergepolicy
+import mixedload
+import pagecache
+import heatmap
+import replay
+import throughput
+import templates
+import watchdog
+from journal import Journal
+from matrix import Matrix
 
 # Launch all experiments reported in the paper
 if len(sys.argv) < 2:
     print("\n*** Script to launch the experiments for the paper ***\n")
-    print("Usage: <path config file> <type of test> (the last param is optional, default is 'all')")
+    print("Usage: <path config file> <type of test> [--resume <run>] (the type of test is optional, default is 'all')")
     print("       Test '1': Execute all possible scans on a given datasets.")
     print("       Test '2': Execute simple SPARQL queries.")
     print("       Test '3': Execute more complex SPARQL queries (BSBM benchmark).")
@@ -21,14 +44,32 @@ if len(sys.argv) < 2:
     print("       Test '7': Execute additions/removals, and perform simple SPARQL queries on the result, lubm1b")
     print("       Test '8': Execute additions/removals, and perform simple SPARQL queries on the result, lubm125m")
     print("       Test '9': Execute additions/removals, and perform simple SPARQL queries on the result, wikidata")
+    print("       Test '10': Like test 2, with the skipTables option.")
+    print("       Test '11': Sweep the options of the loader on a sample of an input and recommend settings (not part of 'all').")
+    print("       Test '12': Replay the DBpedia user-log queries as an open-loop workload at increasing rates (not part of 'all').")
+    print("       Test '13': Measure the throughput of query, query_native and RDF3X with 1, 2, 4 ... concurrent clients (not part of 'all').")
+    print("       Test '14': Run the LUBM and LDBC queries as templates, with constants drawn from the databases (not part of 'all').")
+    print("       Tests 2, 7, 8, 9, 10, 12, 13 and 14, and any other test declared in the experiment matrix (experiments.matrix), are expanded from the matrix.")
+    print("       --resume <run>: resume an interrupted run (its name is printed when it starts), skipping the steps it completed.")
     print("")
     print("Examples: './launch_experiments.py experiments.config 1' will execute test 1 using the inputs and queries provided in the config file")
     print("          './launch_experiments.py experiments.config all' will execute all tests using the inputs and queries provided in the config file")
+    print("          './launch_experiments.py experiments.config --resume 18-10-26-10:05:17' will resume the run of that name")
     print("")
     exit()
 
+args = sys.argv[1:]
+resume = None
+if '--resume' in args:
+    i = args.index('--resume')
+    if i + 1 >= len(args):
+        print("--resume needs the name of the run to resume")
+        exit(1)
+    resume = args[i + 1]
+    del args[i:i + 2]
+
 config = configparser.ConfigParser()
-config.read(sys.argv[1])
+config.read(args[0])
 config = config['DEFAULT']
 
 datasets_dir = config['input']
@@ -43,253 +84,575 @@ testsnap_exec = config['testsnap']
 
 test5_extraopts = config['test5_extraopts']
 test6_extraopts = config['test6_extraopts']
-
-test = 'all'
-if len(sys.argv) > 2:
-    test = sys.argv[2]
+# Build the test5 databases from scratch, incrementally (each from the
+# previous percentage with add/merge), or both
+test5_mode = config.get('test5_mode') or 'scratch'
+
+# Loader options swept by test 11: maxThreads and readThreads values, and
+# layouts (';' separated, 'default' for no layout option), on the first
+# tune_sample fraction of the files of tune_input. The search is a full grid,
+# or successive halving, where every round keeps the best 1/tune_eta of the
+# settings and multiplies the sample by tune_eta.
+tune_input = config.get('tune_input') or 'lubm1b'
+tune_sample = float(config.get('tune_sample') or 0.05)
+tune_threads = [int(t) for t in (config.get('tune_threads') or '8,16,24,32').split(',')]
+tune_readthreads = [int(t) for t in (config.get('tune_readthreads') or '2,4,8').split(',')]
+tune_layouts = [l.strip() for l in (config.get('tune_layouts') or
+                'default;--flatTree 1;--skipTables 1;--aggrIndices 1;--storeplainlist 1').split(';')]
+tune_search = config.get('tune_search') or 'halving'
+tune_eta = int(config.get('tune_eta') or 3)
+tune_extraopts = config.get('tune_extraopts') or ''
+
+# Resources that the database builds may use concurrently (RAM and disk in GB)
+def total_ram():
+    return os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES') / (1024 ** 3)
+
+def free_disk(path):
+    while not os.path.exists(path):
+        path = os.path.dirname(path)
+    return shutil.disk_usage(path).free / (1024 ** 3)
+
+build_cpus = int(config.get('build_cpus') or os.cpu_count())
+build_ram = float(config.get('build_ram') or total_ram())
+build_disk = float(config.get('build_disk') or free_disk(results_dir))
+# Resources declared by a single trident load (the cpus default to --maxThreads)
+load_job_cpus = int(config.get('load_job_cpus') or 8)
+load_job_ram = float(config.get('load_job_ram') or 32)
+load_job_diskfactor = float(config.get('load_job_diskfactor') or 2)
+
+# Every measurement is stored as soon as the log that reports it is written
+if not os.path.exists(results_dir):
+    os.makedirs(results_dir)
+results_store = ResultsDB(config.get('resultsdb') or results_dir + '/results.sqlite')
+
+# Databases that are not modified by the tests are built through a cache
+# shared by all tests, limited to cache_quota GB
+cache = BuildCache(config.get('cachedir') or results_dir + '/cache',
+                   float(config.get('cache_quota') or build_disk))
+
+# Number of repetitions of the stats run of a query. In adaptive mode the
+# query is repeated (up to adaptive_maxreps times) until the bootstrap
+# confidence interval of the median of the warm runs is narrower than
+# adaptive_ci times the median, or until adaptive_budget seconds have passed.
+query_reps = int(config.get('query_reps') or 6)
+adaptive = (config.get('adaptive') or 'false').lower() in ['true', '1', 'yes']
+adaptive_minreps = int(config.get('adaptive_minreps') or 5)
+adaptive_maxreps = int(config.get('adaptive_maxreps') or 100)
+adaptive_ci = float(config.get('adaptive_ci') or 0.05)
+adaptive_budget = float(config.get('adaptive_budget') or 600)
+
+# The decoded answers of the queries are not written to disk: only their
+# number of rows and checksum are kept (results_<query>.summary), and a
+# sample of results_sample rows (results_<query>.sample.gz) if not 0. With
+# results_partitions > 0 the hashes of the rows are kept too, so that
+# check_results.py can count the rows on which the engines differ.
+results_sample = int(config.get('results_sample') or 0)
+results_partitions = int(config.get('results_partitions') or 0)
+
+# Interval (seconds) at which the resources used by the commands are sampled,
+# 0 to disable the sampling
+sample_interval = float(config.get('sample_interval') or 1)
+
+# Limits of the commands: wall-clock seconds of a query, of a suite of
+# queries run by one process (the scans of test 1), of a load (or
+# add/rm/merge) and of an analytics run (0 for no limit), and RSS in GB of
+# any command (default 90% of the RAM, 0 for no limit). The watchdog kills
+# the process group of a command that exceeds a limit and appends the reason
+# to its log, and the suite continues with the next command.
+query_timeout = float(config.get('query_timeout') or 10800)
+suite_timeout = float(config.get('suite_timeout') or 0)
+load_timeout = float(config.get('load_timeout') or 0)
+analytics_timeout = float(config.get('analytics_timeout') or 0)
+rss_limit = float(config.get('rss_limit') or 0.9 * total_ram())
+
+# How the page cache is emptied before a cold run: 'evict' the files of the
+# database only, run the 'drop_caches' command (the whole machine), or
+# 'none'. The stats runs of a query are 'cold' (emptied as well) or
+# 'prewarm' (the files of the database are read first).
+cache_control = config.get('cache_control') or 'evict'
+drop_caches = config.get('drop_caches') or 'sudo /cm/shared/package/utils/bin/drop_caches'
+warm_runs = config.get('warm_runs') or 'cold'
+# Instrumentation of the cold runs of the queries: the regions (of
+# heatmap_region MB) of the files of the database that every query brings
+# into the page cache, and its page faults (see heatmap.py)
+heatmap_on = (config.get('heatmap') or 'false').lower() in ['true', '1', 'yes']
+heatmap_region = float(config.get('heatmap_region') or 64)
+# Copy what an update modifies before it, so that it can be resumed (see
+# update_step())
+update_checkpoint = (config.get('update_checkpoint') or 'false').lower() in ['true', '1', 'yes']
+if cache_control not in ['evict', 'drop_caches', 'none'] or warm_runs not in ['cold', 'prewarm']:
+    print("Unknown cache_control " + cache_control + " or warm_runs " + warm_runs)
+    exit(1)
+
+# Experiments that only differ in their datasets, engines, load options and
+# query suites are declared in a matrix (see matrix.py)
+experiments = Matrix(config.get('matrix') or os.path.join(os.path.dirname(os.path.abspath(__file__)), 'experiments.matrix'),
+                     {'extraopts': extraopts})
+
+test = None
+if len(args) > 1:
+    test = args[1]
+
+# Every invocation is a run, named after the time it started. The journal of
+# the run (<output>/runs/<run>.journal) records the steps that are done, and
+# a run resumed with --resume skips them and writes to the same results
+# directories.
+run_name = resume
+if resume is None:
+    run_name = datetime.now().strftime("%d-%m-%y-%H:%M:%S")
+elif not os.path.exists(results_dir + '/runs/' + resume + '.journal'):
+    print("No journal for the run " + resume + " in " + results_dir + '/runs')
+    exit(1)
+journal = Journal(results_dir + '/runs/' + run_name + '.journal', run_name, test or ('all' if resume is None else None))
+test = journal.test
+if resume is None:
+    print("*** Run " + run_name + " (resume it with --resume " + run_name + ") ***")
+else:
+    print("*** Resume run " + run_name + ", test " + test + " ***")
 
 # generate string for results directory
 def getResultsName():
-    now = datetime.now() # current date and time
-    return now.strftime("results-%d-%m-%y-%H:%M:%S")
+    return "results-" + run_name
+
+# Launch a command, wait for it and report a failure. If 'profile' is given,
+# the resources used by the command (and all its children) are sampled and
+# saved to that file.
+# The command runs in its own session, so that the watchdog can kill all its
+# processes. If it is killed, the reason is appended to 'log' (a path or a
+# file, default stderr).
+def run_process(cmd, shell=False, stdout=subprocess.DEVNULL, stderr=None, profile=None, timeout=0, log=None):
+    args = cmd
+    if not shell:
+        args = shlex.split(cmd)
+    process = subprocess.Popen(args, shell=shell, stdout=stdout, stderr=stderr, start_new_session=True)
+    wd = watchdog.Watchdog(process, timeout, rss_limit)
+    sampler = None
+    if profile is not None and sample_interval > 0:
+        sampler = resources.Sampler(process.pid, sample_interval)
+    try:
+        process.wait()
+    except KeyboardInterrupt:
+        wd.kill()
+        raise
+    ret = wd.stop()
+    wd.report(log if log is not None else stderr)
+    if sampler is not None:
+        sampler.stop()
+        sampler.save(profile)
+        results_store.record(profile)
+    if wd.reason is not None:
+        print(" Command killed by the watchdog (" + wd.reason + "): " + cmd)
+    elif ret != 0:
+        print(" Command failed with return code " + str(ret) + ": " + cmd)
+    return ret
+
+# Keep the command of a load next to its log, for load_report.py
+def save_load_cmd(outputdir, cmd):
+    with open(outputdir + '.cmd', 'wt') as fout:
+        fout.write(cmd + '\n')
 
 # Load a Trident DB
 def load_db(inputdir, outputdir, extraopts):
     print(" Loading db into " + outputdir + "...")
     cmd = trident_exec + ' load -l debug -f ' + inputdir + ' -i ' + outputdir + ' --logfile ' + outputdir + '.log ' + extraopts
-    process = subprocess.Popen(shlex.split(cmd), stdout=subprocess.PIPE)
-    process.wait()
-    return process.returncode
+    save_load_cmd(outputdir, cmd)
+    return run_process(cmd, profile=outputdir + resources.SUFFIX, timeout=load_timeout, log=outputdir + '.log')
+
+# Load a Trident DB from input that is already compressed (e.g. the output
+# of --onlyCompress), skipping the dictionary encoding
+def load_db_compr(comprinput, comprdict, outputdir, extraopts):
+    print(" Loading db into " + outputdir + " from compressed input...")
+    cmd = trident_exec + ' load -l debug --comprinput ' + comprinput
+    if comprdict is not None:
+        cmd += ' --comprdict ' + comprdict
+    cmd += ' -i ' + outputdir + ' --logfile ' + outputdir + '.log ' + extraopts
+    save_load_cmd(outputdir, cmd)
+    return run_process(cmd, profile=outputdir + resources.SUFFIX, timeout=load_timeout, log=outputdir + '.log')
 
 # Add to a Trident DB
 def add_db(inputdir, outputdir, extraopts, addition):
     print(" Adding to db into " + outputdir + "...")
     cmd = trident_exec + ' add -l debug --update ' + inputdir + ' -i ' + outputdir + ' --logfile ' + outputdir + '.add.log.' + addition + ' ' + extraopts
-    process = subprocess.Popen(shlex.split(cmd), stdout=subprocess.PIPE)
-    process.wait()
-    return process.returncode
+    log = outputdir + '.add.log.' + addition
+    return run_process(cmd, profile=log + resources.SUFFIX, timeout=load_timeout, log=log)
 
 # Remove from a Trident DB
 def rm_db(inputdir, outputdir, extraopts, removal):
     print(" Removing from db into " + outputdir + "...")
     cmd = trident_exec + ' rm -l debug --update ' + inputdir + ' -i ' + outputdir + ' --logfile ' + outputdir + '.rm.log.' + removal + ' ' + extraopts
-    process = subprocess.Popen(shlex.split(cmd), stdout=subprocess.PIPE)
-    process.wait()
-    return process.returncode
+    log = outputdir + '.rm.log.' + removal
+    return run_process(cmd, profile=log + resources.SUFFIX, timeout=load_timeout, log=log)
 
 # Merge updates in a Trident DB
 def merge_db(outputdir, extraopts,merge):
     print(" Merging db into " + outputdir + "...")
     cmd = trident_exec + ' merge -l debug -i ' + outputdir + ' --logfile ' + outputdir + '.merge.log.' + merge + ' ' + extraopts
-    process = subprocess.Popen(shlex.split(cmd), stdout=subprocess.PIPE)
-    process.wait()
-    return process.returncode
+    log = outputdir + '.merge.log.' + merge
+    return run_process(cmd, profile=log + resources.SUFFIX, timeout=load_timeout, log=log)
 
 # Load a RDF3X DB
 def load_db_rdf3x(inputdir, outputdir):
     print(" Loading RDF3x db into " + outputdir + "...")
     cmd = 'current/importdata_rdf3x.sh ' + inputdir + ' ' + outputdir + ' ' + rdf3xload_exec
-    process = subprocess.Popen(cmd, shell=True, stdout=subprocess.PIPE)
-    process.wait()
-    return process.returncode
+    return run_process(cmd, shell=True, profile=outputdir + resources.SUFFIX, timeout=load_timeout)
+
+# Size in GB of a file or of all files in a directory
+def input_size(path):
+    if not os.path.exists(path):
+        return 0
+    if not os.path.isdir(path):
+        return os.path.getsize(path) / (1024 ** 3)
+    size = 0
+    for root, dirs, files in os.walk(path, followlinks=True):
+        for f in files:
+            size += os.path.getsize(os.path.join(root, f))
+    return size / (1024 ** 3)
+
+# Job that builds 'outputdir' through the build cache with build(target).
+# The key of the build is made of the inputs, the executables and the
+# options, and is computed when the job runs (the inputs may be built by its
+# dependencies; a missing input fails the job only). On a hit the cached
+# database is linked in place and the job is not reported as a build; on a
+# miss it builds in a staging directory and commits the database to the
+# cache only if the build succeeds. A build of the same inputs, executables
+# and options as another job waits for it and links its result. 'links' are
+# more paths to link to the database.
+cache_building = {}
+
+def cached_job(outputdir, inputs, binaries, opts, build, cpus=1, ram=0, disk=0, deps=(), links=()):
+    build_id = (tuple(inputs), tuple(binaries), ' '.join(opts.split()))
+    if build_id in cache_building:
+        def link():
+            key = cache.key(inputs, binaries, opts)
+            if cache.lookup(key) is None:
+                return 1
+            for path in [outputdir] + list(links):
+                cache.link(key, path)
+            return 0
+        return Job(outputdir, link, deps=list(deps) + [cache_building[build_id]])
+    cache_building[build_id] = outputdir
+    def build_or_link():
+        key = cache.key(inputs, binaries, opts)
+        if cache.lookup(key) is not None:
+            print(" Reusing the cached build of " + outputdir)
+            for path in [outputdir] + list(links):
+                cache.link(key, path)
+            job.description = ''
+            return 0
+        staging = cache.staging(key)
+        ret = build(staging + '/db')
+        if ret == 0:
+            cache.commit(key, staging, outputdir + ': ' + opts)
+            for path in [outputdir] + list(links):
+                cache.link(key, path)
+        else:
+            # Keep the log of the failed (or killed) build, with the stats
+            # it reported until then
+            if os.path.exists(staging + '/db.log') and os.path.isdir(os.path.dirname(outputdir)):
+                shutil.copyfile(staging + '/db.log', outputdir + '.failed.log')
+            cache.discard(staging)
+        return ret
+    def run():
+        try:
+            return build_or_link()
+        finally:
+            del cache_building[build_id]
+    job = Job(outputdir, run, cpus=cpus, ram=ram, disk=disk, deps=deps, description=opts)
+    return job
+
+# Number of cpus used by a trident load: --maxThreads if given
+def load_cpus(extraopts):
+    tokens = shlex.split(extraopts)
+    if '--maxThreads' in tokens:
+        return int(tokens[tokens.index('--maxThreads') + 1])
+    return load_job_cpus
+
+# Job that loads a Trident DB. The disk needed is estimated from the size of
+# the input.
+def load_db_job(inputdir, outputdir, extraopts, deps=(), links=()):
+    disk = input_size(inputdir) * load_job_diskfactor
+    return cached_job(outputdir, [inputdir], [trident_exec], 'load ' + extraopts,
+                      lambda target: load_db(inputdir, target, extraopts),
+                      cpus=load_cpus(extraopts), ram=load_job_ram, disk=disk, deps=deps, links=links)
+
+# Job that loads a RDF3X DB (rdf3xload is single threaded)
+def load_db_rdf3x_job(inputdir, outputdir, deps=(), links=()):
+    disk = input_size(inputdir) * load_job_diskfactor
+    return cached_job(outputdir, [inputdir], ['current/importdata_rdf3x.sh', rdf3xload_exec], 'rdf3xload',
+                      lambda target: load_db_rdf3x(inputdir, target),
+                      cpus=1, ram=load_job_ram, disk=disk, deps=deps, links=links)
+
+# Run a set of jobs concurrently within the build budget, and report them.
+# None stands for a job that was not needed, and
+# dependencies on jobs that are not in the set are taken as satisfied. The
+# builds that succeed are recorded in the results store under 'run'.
+def run_jobs(jobs, run=None):
+    jobs = [j for j in jobs if j is not None]
+    if len(jobs) == 0:
+        return []
+    names = [j.name for j in jobs]
+    scheduler = Scheduler(build_cpus, build_ram, build_disk)
+    for job in jobs:
+        job.deps = [d for d in job.deps if d in names]
+        scheduler.add(job)
+    scheduler.run()
+    scheduler.report()
+    if run is not None:
+        for job in jobs:
+            if job.returncode == 0 and job.description != '':
+                results_store.record_build(run, job.name, job.description, job.walltime())
+    return jobs
+
+# Empty the page cache of the files of some paths (see cache_control)
+def flushCache(paths):
+    if cache_control == 'evict':
+        pagecache.evict(paths)
+    elif cache_control == 'drop_caches':
+        process = subprocess.Popen(shlex.split(drop_caches), stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        process.wait()
 
-def flushCache():
-    process = subprocess.Popen(shlex.split('sudo /cm/shared/package/utils/bin/drop_caches'), stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+# Prepare the page cache for the runs of a query on a database, cold or
+# warm, and write the residency of its files to the log of the query
+def prepareCache(db, warm, log):
+    if warm:
+        pagecache.prewarm([db])
+    else:
+        flushCache([db])
+    log.write(pagecache.report([db]))
+    log.flush()
+
+
+# Launch the stats run of a query in adaptive mode. The log is read while it
+# is written, and the process is stopped as soon as the warm runtimes are
+# precise enough or the time budget is exhausted.
+def query_adaptive(cmd, log, profile=None):
+    process = subprocess.Popen(shlex.split(cmd), stderr=subprocess.PIPE, stdout=subprocess.DEVNULL, text=True,
+                               start_new_session=True)
+    wd = watchdog.Watchdog(process, query_timeout, rss_limit)
+    sampler = None
+    if profile is not None and sample_interval > 0:
+        sampler = resources.Sampler(process.pid, sample_interval)
+    start = time.time()
+    runtimes = []
+    reason = 'max repetitions'
+    for line in process.stderr:
+        log.write(line)
+        m = logparse.match(line, logparse.TRIDENT)
+        if m is not None and m[0] == 'total':
+            runtimes.append(m[1])
+            warm = repstats.warm(runtimes)
+            if len(warm) >= adaptive_minreps:
+                low, high = repstats.bootstrap_ci(warm)
+                median = statistics.median(warm)
+                if median > 0 and (high - low) / median <= adaptive_ci:
+                    reason = 'converged'
+                    break
+        if time.time() - start > adaptive_budget:
+            reason = 'time budget'
+            break
+    stopped = process.poll() is None and wd.reason is None
+    if stopped:
+        process.terminate()
+    process.stderr.close()
     process.wait()
-
-
-# Launch a query with Trident
+    ret = wd.stop()
+    wd.report(log)
+    if sampler is not None:
+        sampler.stop()
+        sampler.save(profile)
+        results_store.record(profile)
+    if wd.reason is not None:
+        reason = 'watchdog'
+    log.write('ADAPTIVE: stopped (' + reason + ') after ' + str(len(runtimes)) + ' runs\n')
+    if stopped:
+        return 0
+    return ret
+
+
+# Launch a query with Trident. Every query is a step of the journal: on a
+# resume the queries that are done are skipped.
 def query(db, queries, output, extraopts, query_type):
     print(" Launch queries on " + db)
-    if os.path.exists(output):
+    if os.path.exists(output) and not journal.any_started(output + '/'):
         print(' Removing dir ' + output)
         shutil.rmtree(output)
-    os.makedirs(output)
+    os.makedirs(output, exist_ok=True)
     fqueries = [ q for q in os.listdir(queries) if not q.startswith('.')]
     fqueries.sort()
+    ret = 0
     for queryname in fqueries:
-        flushCache()
+        step = output + '/' + queryname
+        if journal.done(step):
+            print(' Skip ' + queryname + ', done in an earlier attempt')
+            continue
+        journal.start(step)
         print(' Querying ' + queryname + ' for getting results...')
         cmd = trident_exec + ' ' + query_type + ' -i ' + db + ' -q ' + queries + '/' + queryname + ' -l debug ' + extraopts
         fout = output + "/results_" + queryname
-        o = open(fout, 'wt')
         ferr = output + "/logs_" + queryname
         o2 = open(ferr, 'wt')
+        prepareCache(db, False, o2)
         o2.write('CMD: ' + cmd + '\n')
         o2.flush()
-        process = subprocess.Popen(shlex.split(cmd), stdout=o, stderr=o2)
-        process.wait()
-        flushCache()
+        if heatmap_on:
+            before = pagecache.snapshot([db])
+            usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+        ret = resultsink.run(shlex.split(cmd), fout, stderr=o2, sample=results_sample, partitions=results_partitions,
+                             timeout=query_timeout, rsslimit=rss_limit)
+        if heatmap_on:
+            # The faults of the query, the only child that ended meanwhile
+            after = resource.getrusage(resource.RUSAGE_CHILDREN)
+            region = int(heatmap_region * 1024 * 1024)
+            heatmap.save(output + '/' + heatmap.PREFIX + queryname, db,
+                         pagecache.touched(before, pagecache.snapshot([db]), region),
+                         after.ru_minflt - usage.ru_minflt, after.ru_majflt - usage.ru_majflt, region, o2)
+        if ret in [watchdog.TIMEOUT, watchdog.OOM]:
+            # The answer is incomplete, and the stats run would be killed as well
+            print(" Command killed by the watchdog, skip the stats run: " + cmd)
+            resultsink.discard(fout)
+            o2.close()
+            results_store.record(ferr)
+            journal.finish(step, ret)
+            continue
+        elif ret != 0:
+            print(" Command failed with return code " + str(ret) + ": " + cmd)
+        prepareCache(db, warm_runs == 'prewarm', o2)
         print(' Querying ' + queryname + ' for getting stats...')
-        cmd = trident_exec + ' ' + query_type + ' -i ' + db + ' -q ' + queries + '/' + queryname + ' -l info  -r 6 --decodeoutput false' + extraopts
+        reps = query_reps
+        if adaptive:
+            reps = adaptive_maxreps
+        cmd = trident_exec + ' ' + query_type + ' -i ' + db + ' -q ' + queries + '/' + queryname + ' -l info  -r ' + str(reps) + ' --decodeoutput false ' + extraopts
         o2.write('CMD: ' + cmd + '\n')
         o2.flush()
-        process = subprocess.Popen(shlex.split(cmd), stderr=o2, stdout=subprocess.DEVNULL)
-        process.wait()
-    return process.returncode
+        if adaptive:
+            ret = query_adaptive(cmd, o2, ferr + resources.SUFFIX)
+        else:
+            ret = run_process(cmd, stderr=o2, profile=ferr + resources.SUFFIX, timeout=query_timeout, log=o2)
+        o2.close()
+        results_store.record(ferr)
+        journal.finish(step, ret)
+    return ret
 
 
 # Launch a query with RDF3X
 def query_rdf3x(db, queries, output):
     print(" Launch RDF3X queries on " + db)
-    cmd = 'current/query_rdf3x.sh ' + db + ' ' + queries + ' ' + output + ' ' + rdf3xquery_exec
-    process = subprocess.Popen(cmd, shell=True, stdout=subprocess.PIPE)
-    process.wait()
-    return process.returncode
+    cmd = 'current/query_rdf3x.sh ' + db + ' ' + queries + ' ' + output + ' ' + rdf3xquery_exec + ' ' + str(results_sample) + ' ' + str(results_partitions) + ' ' + str(int(query_timeout)) + ' ' + str(rss_limit) + ' ' + cache_control
+    if cache_control == 'drop_caches':
+        cmd = 'DROP_CACHES=' + shlex.quote(drop_caches) + ' ' + cmd
+    # The profile covers the script and all the queries it launches. The
+    # script applies the limits to every query, and is one step of the journal.
+    ret = journal.run(output, run_process, cmd, shell=True, profile=output + '.queries' + resources.SUFFIX)
+    if os.path.exists(output):
+        for f in sorted(os.listdir(output)):
+            results_store.record(output + '/' + f)
+    return ret
+
+
+# Check that the engines returned the same answers in a run
+def check_answers(resultsdir):
+    print(" Check the answers of the engines...")
+    rows, mismatches = check_results.check_run(resultsdir, results_store)
+    for r in rows:
+        if r[-1] != 'OK':
+            print(' ' + '\t'.join([str(v) for v in r]))
+    print(" " + str(mismatches) + " answers differ from the reference, out of " + str(len(rows)))
 
 
 # Exec a generic command
-def exec_cmd(cmd, o='', e=''):
+def exec_cmd(cmd, o='', e='', profile=None, timeout=0, log=None):
     if o == '':
-        o = subprocess.PIPE
+        o = subprocess.DEVNULL
     if e == '':
-        e = subprocess.PIPE
+        e = subprocess.DEVNULL
     # Why was "shell=True" removed??? It is needed, and cannot be replaced with shlex.split, because then I/O redirection does not work.
     # Re-added shell=True. --Ceriel
     print("Command = " + cmd)
-    process = subprocess.Popen(cmd, shell=True, stdout=o, stderr=e)
-    process.wait()
-    return process.returncode
+    return run_process(cmd, shell=True, stdout=o, stderr=e, profile=profile, timeout=timeout, log=log)
 
 
 def test1(inputdir, outputdir):
     outputdir = outputdir + "/test1"
     dbdir = outputdir + "/db"
-    create_dbs = True
-    # Does it already exist?
-    if os.path.exists(dbdir):
-        create_dbs = False
-    if create_dbs:
-        # Load all copies of yago2s
+    if not os.path.exists(dbdir):
         os.makedirs(dbdir)
-        # I need the mappings for RDF3X
-        outputdb = dbdir + '/yago_mappings'
-        load_db(inputdir + '/yago2s', outputdb, extraopts + ' --onlyCompress 1')
-        # Load RDF3X database
-        outputdb = dbdir + '/yago_rdf3x'
-        print(" Loading db into " + outputdb + "...")
-        cmd = rdf3xload_exec + ' ' + outputdb + ' ' +  dbdir + '/yago_mappings/triples.gz ' + dbdir + '/yago_mappings/dict.gz'
-        exec_cmd(cmd)
-        outputdb = dbdir + '/yago_default'
-        load_db(inputdir + '/yago2s', outputdb, extraopts + ' --storeplainlist 1')
-        outputdb = dbdir + '/yago_row'
-        load_db(inputdir + '/yago2s', outputdb, extraopts + ' --enableFixedStrat 1 --fixedStrat 148')
-        outputdb = dbdir + '/yago_cluster'
-        load_db(inputdir + '/yago2s', outputdb, extraopts + ' --enableFixedStrat 1 --fixedStrat 181')
-        outputdb = dbdir + '/yago_column'
-        load_db(inputdir + '/yago2s', outputdb, extraopts + ' --enableFixedStrat 1 --fixedStrat 96')
-        outputdb = dbdir + '/yago_aggr'
-        load_db(inputdir + '/yago2s', outputdb, extraopts + ' --aggrIndices 1')
-        outputdb = dbdir + '/yago_skipped'
-        load_db(inputdir + '/yago2s', outputdb, extraopts + ' --skipTables 1')
+    # Load all copies of yago2s
+    jobs = []
+    # I need the mappings for RDF3X
+    mappings = dbdir + '/yago_mappings'
+    jobs.append(load_db_job(inputdir + '/yago2s', mappings, extraopts + ' --onlyCompress 1'))
+    # Load RDF3X database. It depends on the mappings, so its key is derived
+    # from the input of the mappings.
+    def load_rdf3x(target):
+        print(" Loading db into " + target + "...")
+        return exec_cmd(rdf3xload_exec + ' ' + target + ' ' +  mappings + '/triples.gz ' + mappings + '/dict.gz',
+                        profile=target + resources.SUFFIX)
+    jobs.append(cached_job(dbdir + '/yago_rdf3x', [inputdir + '/yago2s'], [trident_exec, rdf3xload_exec],
+                           'rdf3xload mappings ' + extraopts, load_rdf3x, cpus=1, ram=load_job_ram,
+                           disk=input_size(inputdir + '/yago2s') * load_job_diskfactor, deps=[mappings]))
+    layouts = [('yago_default', ' --storeplainlist 1'),
+               ('yago_row', ' --enableFixedStrat 1 --fixedStrat 148'),
+               ('yago_cluster', ' --enableFixedStrat 1 --fixedStrat 181'),
+               ('yago_column', ' --enableFixedStrat 1 --fixedStrat 96'),
+               ('yago_aggr', ' --aggrIndices 1'),
+               ('yago_skipped', ' --skipTables 1')]
+    # The layouts are all built from the triples and the dictionary of the
+    # mappings, so that the input is encoded only once
+    for name, opts in layouts:
+        build = lambda target, opts=opts: load_db_compr(mappings + '/triples.gz', mappings + '/dict.gz', target, extraopts + opts)
+        jobs.append(cached_job(dbdir + '/' + name, [inputdir + '/yago2s'], [trident_exec],
+                               'load mappings ' + extraopts + opts, build, cpus=load_cpus(extraopts + opts),
+                               ram=load_job_ram, disk=input_size(inputdir + '/yago2s') * load_job_diskfactor,
+                               deps=[mappings]))
+    if not os.path.exists(dbdir + '/queries_shuffled'):
         # Create the queries
-        print(" Generating the queries...")
         cmd = trident_exec + ' testcq -i ' + dbdir + '/yago_default' + ' --testqueryfile ' + dbdir + "/queries"
-        exec_cmd(cmd)
+        jobs.append(Job(dbdir + '/queries', exec_cmd, (cmd,), deps=[dbdir + '/yago_default']))
         # Shuffle them
-        print(" Shuffling the queries...")
-        cmd='sort -R ' + dbdir + "/queries > " + dbdir + "/queries_shuffled"
-        exec_cmd(cmd)
+        cmd='sort -R ' + dbdir + "/queries > " + dbdir + "/queries_shuffled.tmp && mv " + dbdir + "/queries_shuffled.tmp " + dbdir + "/queries_shuffled"
+        jobs.append(Job(dbdir + '/queries_shuffled', exec_cmd, (cmd,), deps=[dbdir + '/queries']))
     else:
-        print(" Reuse the copy of the databases that are already existing")
-
+        print(" Reuse the queries that are already existing")
     resultsdir = outputdir + "/" + getResultsName()
-    os.makedirs(resultsdir)
+    os.makedirs(resultsdir, exist_ok=True)
+    run_jobs(jobs, resultsdir)
 
     # Launch all the tests
     print(" Launch the test with RDF3x...")
     cmd = rdf3xtest_exec + ' ' + dbdir + '/yago_rdf3x ' + dbdir + '/queries_shuffled > ' + resultsdir + '/test_rdf3x'
-    exec_cmd(cmd)
+    journal.run(resultsdir + '/test_rdf3x', exec_cmd, cmd, profile=resultsdir + '/test_rdf3x' + resources.SUFFIX,
+                timeout=suite_timeout, log=resultsdir + '/test_rdf3x')
+    results_store.record(resultsdir + '/test_rdf3x')
     print(" Launch the test default...")
     cmd = trident_exec + ' testti -l debug -i ' + dbdir + '/yago_default --testqueryfile ' + dbdir + '/queries_shuffled > ' + resultsdir + '/test_default'
-    exec_cmd(cmd)
+    journal.run(resultsdir + '/test_default', exec_cmd, cmd, profile=resultsdir + '/test_default' + resources.SUFFIX,
+                timeout=suite_timeout, log=resultsdir + '/test_default')
+    results_store.record(resultsdir + '/test_default')
     print(" Launch the test row...")
     cmd = trident_exec + ' testti -l debug -i ' + dbdir + '/yago_row --testqueryfile ' + dbdir + '/queries_shuffled > ' + resultsdir + '/test_row'
-    exec_cmd(cmd)
+    journal.run(resultsdir + '/test_row', exec_cmd, cmd, profile=resultsdir + '/test_row' + resources.SUFFIX,
+                timeout=suite_timeout, log=resultsdir + '/test_row')
+    results_store.record(resultsdir + '/test_row')
     #print(" Launch the test cluster...") -- takes too long
     #cmd = trident_exec + ' testti -l debug -i ' + dbdir + '/yago_cluster --testqueryfile ' + dbdir + '/queries_shuffled > ' + resultsdir + '/test_cluster'
     #exec_cmd(cmd)
     print(" Launch the test column...")
     cmd = trident_exec + ' testti -l debug -i ' + dbdir + '/yago_column --testqueryfile ' + dbdir + '/queries_shuffled > ' + resultsdir + '/test_column'
-    exec_cmd(cmd)
+    journal.run(resultsdir + '/test_column', exec_cmd, cmd, profile=resultsdir + '/test_column' + resources.SUFFIX,
+                timeout=suite_timeout, log=resultsdir + '/test_column')
+    results_store.record(resultsdir + '/test_column')
     print(" Launch the test aggr...")
     cmd = trident_exec + ' testti -l debug -i ' + dbdir + '/yago_aggr --testqueryfile ' + dbdir + '/queries_shuffled > ' + resultsdir + '/test_aggr'
-    exec_cmd(cmd)
+    journal.run(resultsdir + '/test_aggr', exec_cmd, cmd, profile=resultsdir + '/test_aggr' + resources.SUFFIX,
+                timeout=suite_timeout, log=resultsdir + '/test_aggr')
+    results_store.record(resultsdir + '/test_aggr')
     print(" Launch the test skipped...")
     cmd = trident_exec + ' testti -l debug -i ' + dbdir + '/yago_skipped --testqueryfile ' + dbdir + '/queries_shuffled > ' + resultsdir + '/test_skipped'
-    exec_cmd(cmd)
+    journal.run(resultsdir + '/test_skipped', exec_cmd, cmd, profile=resultsdir + '/test_skipped' + resources.SUFFIX,
+                timeout=suite_timeout, log=resultsdir + '/test_skipped')
+    results_store.record(resultsdir + '/test_skipped')
 
 
-def test2(inputdir, queriesdir, outputdir):
-    # Load lubm1b, btc2012, uniprot, dbpedia, wikidata and launch the queries with trident (query and query_native), and with RDF3X
-    outputdir = outputdir + "/test2"
-    dbdir = outputdir + "/db"
-    # Does it already exist?
-    if not os.path.exists(dbdir):
-        os.makedirs(dbdir)
-    if not os.path.exists(dbdir + '/lubm1b'):
-        outputdb = dbdir + '/lubm1b'
-        load_db(inputdir + '/lubm1b', outputdb, extraopts)
-    if not os.path.exists(dbdir + '/btc2012'):
-        outputdb = dbdir + '/btc2012'
-        load_db(inputdir + '/btc2012', outputdb, extraopts)
-    if not os.path.exists(dbdir + '/uniprot'):
-        outputdb = dbdir + '/uniprot'
-        load_db(inputdir + '/uniprot', outputdb, extraopts)
-    if not os.path.exists(dbdir + '/dbpedia'):
-        outputdb = dbdir + '/dbpedia'
-        load_db(inputdir + '/dbpedia', outputdb, extraopts)
-    if not os.path.exists(dbdir + '/wikidata'):
-        outputdb = dbdir + '/wikidata'
-        load_db(inputdir + '/wikidata', outputdb, extraopts)
-    if not os.path.exists(dbdir + '/lubm1b_rdf3x'):
-        load_db_rdf3x(inputdir + '/lubm1b_raw', dbdir + '/lubm1b_rdf3x')
-    if not os.path.exists(dbdir + '/btc2012_rdf3x'):
-        load_db_rdf3x(inputdir + '/btc2012_raw', dbdir + '/btc2012_rdf3x')
-    if not os.path.exists(dbdir + '/uniprot_rdf3x'):
-        load_db_rdf3x(inputdir + '/uniprot/uniprot-sample.nt', dbdir + '/uniprot_rdf3x')
-    if not os.path.exists(dbdir + '/dbpedia_rdf3x'):
-        load_db_rdf3x(inputdir + '/dbpedia_raw_data', dbdir + '/dbpedia_rdf3x')
-    if not os.path.exists(dbdir + '/wikidata_rdf3x'):
-        load_db_rdf3x(inputdir + '/wikidata_raw', dbdir + '/wikidata_rdf3x')
-
-    # Now the directory for sure exist
-    resultsdir = outputdir + "/" + getResultsName()
-    os.makedirs(resultsdir)
-
-    # Launch all the tests
-    print(" Launch the LUBM queries (native) ...")
-    query(dbdir + '/lubm1b', queriesdir + '/lubm', resultsdir + '/lubm1b-native', extraopts, 'query_native')
-    print(" Launch the LUBM queries  ...")
-    query(dbdir + '/lubm1b', queriesdir + '/lubm', resultsdir + '/lubm1b', extraopts, 'query')
-    print(" Launch the BTC2012 queries (native) ...")
-    query(dbdir + '/btc2012', queriesdir + '/btc2012', resultsdir + '/btc2012-native', extraopts, 'query_native')
-    print(" Launch the BTC2012 queries ...")
-    query(dbdir + '/btc2012', queriesdir + '/btc2012', resultsdir + '/btc2012', extraopts, 'query')
-    print(" Launch the Uniprot queries (native) ...")
-    query(dbdir + '/uniprot', queriesdir + '/uniprot', resultsdir + '/uniprot-native', extraopts, 'query_native')
-    print(" Launch the Uniprot queries  ...")
-    query(dbdir + '/uniprot', queriesdir + '/uniprot', resultsdir + '/uniprot', extraopts, 'query')
-    print(" Launch the DBpedia queries (native) ...")
-    query(dbdir + '/dbpedia', queriesdir + '/dbpedia-examples', resultsdir + '/dbpedia-native', extraopts, 'query_native')
-    print(" Launch the DBpedia queries ...")
-    query(dbdir + '/dbpedia', queriesdir + '/dbpedia-examples', resultsdir + '/dbpedia', extraopts, 'query')
-    print(" Launch the Wikidata queries (native) ...")
-    query(dbdir + '/wikidata', queriesdir + '/wikidata', resultsdir + '/wikidata-native', extraopts, 'query_native')
-    print(" Launch the Wikidata queries ...")
-    query(dbdir + '/wikidata', queriesdir + '/wikidata', resultsdir + '/wikidata', extraopts, 'query')
-
-    print(" Launch the LUBM queries with RDF3X ...")
-    query_rdf3x(dbdir + '/lubm1b_rdf3x/outputdb', queriesdir + '/lubm', resultsdir + 'lubm1b-rdf3x')
-    print(" Launch the BTC2012 queries with RDF3X ...")
-    query_rdf3x(dbdir + '/btc2012_rdf3x/outputdb', queriesdir + '/btc2012', resultsdir + 'btc2012-rdf3x')
-    print(" Launch the Uniprot queries with RDF3X ...")
-    query_rdf3x(dbdir + '/uniprot_rdf3x/outputdb', queriesdir + '/uniprot', resultsdir + '/uniprot-rdf3x')
-    print(" Launch the DBpedia queries with RDF3X ...")
-    query_rdf3x(dbdir + '/dbpedia_rdf3x/outputdb', queriesdir + '/dbpedia-examples', resultsdir + '/dbpedia-rdf3x')
-    print(" Launch the Wikidata queries with RDF3x ...")
-    query_rdf3x(dbdir + '/wikidata_rdf3x/outputdb', queriesdir + '/wikidata', resultsdir + '/wikidata-rdf3x')
-
 def test3(inputdir, queriesdir, outputdir):
     print("TODO")
 
@@ -302,37 +665,46 @@ def test4(inputdir, outputdir):
     # Create the trident databases if not existing
     outputdir = outputdir + "/test4"
     dbdir = outputdir + '/db'
-    if not os.path.exists(dbdir): # Load the trident databases
+    if not os.path.exists(dbdir):
         os.makedirs(dbdir)
-        load_db(inputdir + '/snap-orig/astro/astro.gz', dbdir + '/astro', '--inputformat snap --flatTree 1')
-        load_db(inputdir + '/snap-orig/web/web.gz', dbdir + '/web', '--inputformat snap --flatTree 1')
-        load_db(inputdir + '/snap-orig/twitter/twitter.gz', dbdir + '/twitter', '--inputformat snap --flatTree 1')
+    # Load the trident databases
+    jobs = []
+    for name in ['astro', 'web', 'twitter']:
+        jobs.append(load_db_job(inputdir + '/snap-orig/' + name + '/' + name + '.gz', dbdir + '/' + name, '--inputformat snap --flatTree 1'))
+    run_jobs(jobs, outputdir)
 
     # Launch tests with SNAP
     print(" Launching test snap program...")
     resultsdir = outputdir + '/snap'
-    if os.path.exists(resultsdir):
+    if os.path.exists(resultsdir) and not journal.any_started(resultsdir + '/'):
         print('Removing ' + resultsdir)
         shutil.rmtree(resultsdir)
-    os.makedirs(resultsdir)
+    os.makedirs(resultsdir, exist_ok=True)
     dirdbs = ['astro', 'web', 'twitter']
     # dirdbs = ['astro']
     for i in range(len(dirdbs)):
         dirinput = inputdir + '/snap-orig/' + dirdbs[i] + '/'
         cmd = testsnap_exec + ' ' + dirinput + dirdbs[i] + '.gz ' + dirinput + 'output ' + dirinput + 'terms_snap ' + dirinput + 'terms_snap_p'
+        if journal.done(resultsdir + '/results_' + dirdbs[i]):
+            print(" Skip " + cmd + ", done in an earlier attempt")
+            continue
+        journal.start(resultsdir + '/results_' + dirdbs[i])
         fout = open(resultsdir + '/results_' + dirdbs[i], 'wt')
         ferr = open(resultsdir + '/results_' + dirdbs[i] + '-err', 'wt')
-        exec_cmd(cmd, o=fout, e=ferr)
+        exec_cmd(cmd, o=fout, e=ferr, profile=resultsdir + '/results_' + dirdbs[i] + resources.SUFFIX,
+                 timeout=analytics_timeout, log=fout)
         fout.close()
         ferr.close()
+        results_store.record(resultsdir + '/results_' + dirdbs[i])
+        journal.finish(resultsdir + '/results_' + dirdbs[i])
 
     # Launch tests with Trident
     print(" Launching test trident program...")
     resultsdir = outputdir + '/trident'
-    if os.path.exists(resultsdir):
+    if os.path.exists(resultsdir) and not journal.any_started(resultsdir + '/'):
         print('Removing ' + resultsdir)
         shutil.rmtree(resultsdir)
-    os.makedirs(resultsdir)
+    os.makedirs(resultsdir, exist_ok=True)
     for i in range(len(dirdbs)):
         nodes = inputdir + '/snap-orig/' + dirdbs[i] + '/terms_trident'
         pairs = inputdir + '/snap-orig/' + dirdbs[i] + '/terms_trident_p'
@@ -344,17 +716,26 @@ def test4(inputdir, outputdir):
             if parameters[j] != '':
                 oparg2 = ' --oparg2 ' + parameters[j]
             cmd = trident_exec + ' analytics -i ' + dbdir + '/' + dirdbs[i] + ' -l info ' + oparg2 + ' --op ' + operations[j]
+            if journal.done(resultsdir + '/' + dirdbs[i] + '_' + operations[j]):
+                print(" Skip " + cmd + ", done in an earlier attempt")
+                continue
+            journal.start(resultsdir + '/' + dirdbs[i] + '_' + operations[j])
             ferr = open(resultsdir + '/' + dirdbs[i] + '_' + operations[j], 'wt')
             fout = open(resultsdir + '/' + dirdbs[i] + '_' + operations[j] + '_stdout', 'wt')
-            exec_cmd(cmd, o=fout, e=ferr)
+            exec_cmd(cmd, o=fout, e=ferr, profile=resultsdir + '/' + dirdbs[i] + '_' + operations[j] + resources.SUFFIX,
+                     timeout=analytics_timeout)
             fout.close()
             ferr.close();
+            results_store.record(resultsdir + '/' + dirdbs[i] + '_' + operations[j])
+            journal.finish(resultsdir + '/' + dirdbs[i] + '_' + operations[j])
 
 
 def test5(inputdir, queriesdir, outputdir):
     datasets = [ 1, 2, 5, 10, 20, 50, 100 ] # 1%, 2%, 20%, etc. of lubm10B
     outputdir = outputdir + "/test5"
     dbdir = outputdir + "/db/scale"
+    # Databases derived from the previous percentage with add/merge
+    incrdir = outputdir + "/db/scale_incr"
     # Load different LUBM databases of different sizes
     if not os.path.exists(dbdir):
         os.makedirs(dbdir)
@@ -365,31 +746,149 @@ def test5(inputdir, queriesdir, outputdir):
     if len(allfiles) == 0:
         raise 'No files to load! Test aborted'
 
-    for dataset in datasets:
-        dir_db = dbdir + '/lubm_perc_' + str(dataset)
-        if not os.path.exists(dir_db):
-            # Create a temporary directory with a subset of the files
-            tmpinput = outputdir + '/scale_inputdataset_' + str(dataset)
-            if os.path.exists(tmpinput):
-                print("Removing", tmpinput, '...')
-                shutil.rmtree(tmpinput)
-            print(' Creating', tmpinput)
-            os.makedirs(tmpinput)
-            filestocopy = int(len(allfiles) * dataset / 100)
-            print(' Linking', filestocopy, ' files to the directory ', tmpinput)
-            for i in range(filestocopy):
-                os.symlink(inputdir + '/' + allfiles[i], tmpinput + '/' + allfiles[i])
-            # Create the database
-            load_db(tmpinput, dir_db, test5_extraopts)
-            # Remove the directory
-            print("Removing", tmpinput)
+    def nfiles(dataset):
+        return int(len(allfiles) * dataset / 100)
+
+    # Build a database with func(directory) from the files first..last-1,
+    # linked in a temporary directory
+    def with_subset(name, first, last, func):
+        # Create a temporary directory with a subset of the files
+        tmpinput = outputdir + '/scale_inputdataset_' + name
+        if os.path.exists(tmpinput):
+            print("Removing", tmpinput, '...')
             shutil.rmtree(tmpinput)
-    # Execute 5 LUBM queries on larger datasets
+        print(' Creating', tmpinput)
+        os.makedirs(tmpinput)
+        print(' Linking', last - first, ' files to the directory ', tmpinput)
+        for i in range(first, last):
+            os.symlink(inputdir + '/' + allfiles[i], tmpinput + '/' + allfiles[i])
+        # Create the database
+        ret = func(tmpinput)
+        # Remove the directory
+        print("Removing", tmpinput)
+        shutil.rmtree(tmpinput)
+        return ret
+
+    # Load a database from the first 'dataset' percent of the files
+    def load_subset(dataset, dir_db):
+        return with_subset(str(dataset), 0, nfiles(dataset), lambda d: load_db(d, dir_db, test5_extraopts))
+
+    # Time to build every database, per mode ('scratch' or 'incremental')
+    # and step ('total', 'copy', 'add', 'merge'), kept across runs
+    timesfile = outputdir + '/db/build_times'
+    buildtimes = {}
+    if os.path.exists(timesfile):
+        for line in open(timesfile, 'rt'):
+            tokens = line.split('\t')
+            buildtimes[(tokens[0], int(tokens[1]), tokens[2])] = float(tokens[3])
+
+    def save_times():
+        with open(timesfile + '.tmp', 'wt') as fout:
+            for k in sorted(buildtimes.keys()):
+                fout.write('%s\t%d\t%s\t%.3f\n' % (k[0], k[1], k[2], buildtimes[k]))
+        os.replace(timesfile + '.tmp', timesfile)
+
     resultsdir = outputdir + "/" + getResultsName()
-    os.makedirs(resultsdir)
-    # Launch the queries on the given dataset
+    os.makedirs(resultsdir, exist_ok=True)
+
+    # Build job of every database, by percentage, in the series that is queried
+    builds = {}
+    if test5_mode in ['scratch', 'both']:
+        jobs = []
+        for dataset in datasets:
+            dir_db = dbdir + '/lubm_perc_' + str(dataset)
+            files = [inputdir + '/' + f for f in allfiles[:nfiles(dataset)]]
+            disk = sum([input_size(f) for f in files]) * load_job_diskfactor
+            jobs.append(cached_job(dir_db, files, [trident_exec], 'load ' + test5_extraopts,
+                                   lambda target, dataset=dataset: load_subset(dataset, target),
+                                   cpus=load_cpus(test5_extraopts), ram=load_job_ram, disk=disk))
+            builds[dataset] = jobs[-1]
+        # Builds that were cache hits keep the time of an earlier run
+        for job in run_jobs(jobs, resultsdir):
+            if job.returncode == 0 and job.description != '':
+                dataset = int(job.name[job.name.rfind('_') + 1:])
+                buildtimes[('scratch', dataset, 'total')] = job.walltime()
+        save_times()
+
+    if test5_mode in ['incremental', 'both']:
+        # Every database is a copy (reflinked if the filesystem can) of the
+        # previous one, to which only the extra files are added and merged.
+        # Every build depends on the previous one, so that the series stops
+        # at the first build that fails.
+        if not os.path.exists(incrdir):
+            os.makedirs(incrdir)
+
+        def build_incremental(dataset, prev):
+            dir_db = incrdir + '/lubm_perc_' + str(dataset)
+            tmpdb = dir_db + '.tmp'
+            if os.path.exists(tmpdb):
+                shutil.rmtree(tmpdb)
+            if prev is None:
+                start = time.time()
+                ret = load_subset(dataset, tmpdb)
+                buildtimes[('incremental', dataset, 'load')] = time.time() - start
+            else:
+                start = time.time()
+                ret = run_process('cp -a --reflink=auto ' + incrdir + '/lubm_perc_' + str(prev) + ' ' + tmpdb)
+                buildtimes[('incremental', dataset, 'copy')] = time.time() - start
+                if ret == 0:
+                    start = time.time()
+                    ret = with_subset(str(dataset) + '_add', nfiles(prev), nfiles(dataset),
+                                      lambda d: add_db(d, tmpdb, test5_extraopts, str(dataset)))
+                    buildtimes[('incremental', dataset, 'add')] = time.time() - start
+                if ret == 0:
+                    start = time.time()
+                    ret = merge_db(tmpdb, test5_extraopts, str(dataset))
+                    buildtimes[('incremental', dataset, 'merge')] = time.time() - start
+            if ret != 0:
+                print(" Incremental build of " + dir_db + " failed, the series stops here")
+                return ret
+            buildtimes[('incremental', dataset, 'total')] = sum(
+                [buildtimes.get(('incremental', dataset, step), 0) for step in ['load', 'copy', 'add', 'merge']])
+            os.rename(tmpdb, dir_db)
+            # The logs, profiles, ... follow the database
+            for f in os.listdir(incrdir):
+                if f.startswith(os.path.basename(tmpdb) + '.'):
+                    os.rename(incrdir + '/' + f, dir_db + f[len(os.path.basename(tmpdb)):])
+            save_times()
+            return 0
+
+        jobs = []
+        prev = None
+        for dataset in datasets:
+            dir_db = incrdir + '/lubm_perc_' + str(dataset)
+            if not os.path.exists(dir_db):
+                deps = [incrdir + '/lubm_perc_' + str(prev)] if prev is not None else []
+                jobs.append(Job(dir_db, build_incremental, (dataset, prev), cpus=load_cpus(test5_extraopts),
+                                ram=load_job_ram, deps=deps))
+                if test5_mode == 'incremental':
+                    builds[dataset] = jobs[-1]
+            prev = dataset
+        run_jobs(jobs)
+
+    # Execute 5 LUBM queries on larger datasets
+    # Report the time to build every step of the series
+    with open(resultsdir + '/build_times', 'wt') as fout:
+        fout.write('PERC\tSCRATCH_S\tINCREMENTAL_S\tCOPY_S\tADD_S\tMERGE_S\n')
+        for dataset in datasets:
+            row = [str(dataset)]
+            for mode, step in [('scratch', 'total'), ('incremental', 'total'), ('incremental', 'copy'),
+                               ('incremental', 'add'), ('incremental', 'merge')]:
+                if (mode, dataset, step) in buildtimes:
+                    row.append('%.1f' % buildtimes[(mode, dataset, step)])
+                else:
+                    row.append('-')
+            fout.write('\t'.join(row) + '\n')
+    print(open(resultsdir + '/build_times', 'rt').read())
+    if test5_mode == 'incremental':
+        dbdir = incrdir
+    # Launch the queries on the given dataset, unless its build failed or
+    # was skipped
     for dataset in datasets:
         dbdir2 = dbdir + '/lubm_perc_' + str(dataset)
+        if dataset in builds and builds[dataset].returncode != 0:
+            print(" Skipping the queries on " + dbdir2 + ": its build failed")
+            continue
         if not os.path.exists(resultsdir + '/lubm_native'):
             os.makedirs(resultsdir + '/lubm_native')
         query(dbdir2, queriesdir + '/lubm/', resultsdir + '/lubm_native/' + str(dataset), extraopts, 'query_native')
@@ -400,279 +899,587 @@ def test5(inputdir, queriesdir, outputdir):
 def test6(inputdir, outputdir):
     dbdir = outputdir + "/db/"
     dbname = dbdir + '/hypergraph'
+    if journal.interrupted(dbname + ': load') and os.path.exists(dbname):
+        print(' Removing the interrupted build ' + dbname)
+        shutil.rmtree(dbname)
     if not os.path.exists(dbname):
         if not os.path.exists(dbdir):
             os.makedirs(dbdir)
         print(' Load database...')
         inputfiles = inputdir + '/hypergraph'
-        cmd = trident_exec + ' load -l debug --comprinput ' + inputfiles + '/part-r-00 -i ' + dbname + ' --logfile ' + dbname + '.log ' + test6_extraopts
-        process = subprocess.Popen(shlex.split(cmd), stdout=subprocess.PIPE)
-        process.wait()
+        journal.run(dbname + ': load', load_db_compr, inputfiles + '/part-r-00', None, dbname, test6_extraopts)
     print(' Launch PageRank...')
     outputdir = outputdir + '/test6'
     if not os.path.exists(outputdir):
         os.makedirs(outputdir)
     cmd = trident_exec + ' analytics -i ' + dbname + ' -l info --op pagerank'
+    if journal.done(outputdir + '/pagerank.log'):
+        print(" Skip " + cmd + ", done in an earlier attempt")
+        return
+    journal.start(outputdir + '/pagerank.log')
     fout = open(outputdir + '/pagerank.log', 'wt')
-    process = subprocess.Popen(shlex.split(cmd), stderr=fout)
-    process.wait()
-
-
-# lubm1b_parts/part7950 consists of the bulk of lubm1b, everything except for the last 50  universities
-# lubm1b_parts/partX-Y is Y-X universities, starting from UniversityX
-def test7(inputdir, queriesdir, outputdir):
-    addparts = [ '7950-7960', '7960-7970', '7970-7980', '7980-7990', '7990-8000' ]
-    rmparts = [ '100-110', '200-210', '300-310', '400-410', '500-510' ]
-    outputdir = outputdir + "/test7"
-    dbdir = outputdir + "/db"
-    # Does it already exist?
-    if not os.path.exists(dbdir):
-        os.makedirs(dbdir)
-    outputdb = dbdir + '/lubm1b_updates'
+    ret = run_process(cmd, stdout=None, stderr=fout, profile=outputdir + '/pagerank.log' + resources.SUFFIX,
+                      timeout=analytics_timeout)
+    fout.close()
+    journal.finish(outputdir + '/pagerank.log', ret)
+
+
+# Database of a series of updates (an 'updates' test of the matrix): it is
+# loaded if it does not exist, and otherwise reset to its last merged state
+# (without _diff), unless the series is resumed
+def updates_db(inputdir, outputdb, opts):
+    if journal.interrupted(outputdb + ': load') and os.path.exists(outputdb):
+        print(' Removing the interrupted build ' + outputdb)
+        shutil.rmtree(outputdb)
     if not os.path.exists(outputdb):
-        load_db(inputdir + '/lubm1b_parts/part7950', outputdb, extraopts)
-    else:
+        journal.run(outputdb + ': load', load_db, inputdir, outputdb, opts)
+    elif not journal.any_started(outputdb + ': '):
         if os.path.exists(outputdb + '/_diff'):
             shutil.rmtree(outputdb + '/_diff')
 
-    # Now the directory for sure exist
+# Checkpoint of a database before an update, with update_checkpoint: the
+# part of the database that the update modifies (_diff, or the whole
+# database for a merge) is copied, reflinked if the filesystem can, or
+# restored from the copy if the update was interrupted.
+def checkpoint_update(step, db, whole):
+    step = db + ': ' + step
+    if not update_checkpoint or journal.done(step):
+        return
+    part = db if whole else db + '/_diff'
+    ckpt = db + '.ckpt'
+    if journal.interrupted(step) and os.path.exists(ckpt):
+        print(" Restore " + part + " as it was before the interrupted " + step)
+        if os.path.exists(part):
+            shutil.rmtree(part)
+        if os.path.exists(ckpt + '/part'):
+            run_process('cp -a --reflink=auto ' + ckpt + '/part ' + part)
+    else:
+        if os.path.exists(ckpt):
+            shutil.rmtree(ckpt)
+        os.makedirs(ckpt)
+        if os.path.exists(part) and run_process('cp -a --reflink=auto ' + part + ' ' + ckpt + '/part') != 0:
+            print(" Could not copy " + part + ", " + step + " cannot be resumed if it is interrupted")
+            shutil.rmtree(ckpt)
+
+# Update a database in place (add, rm or merge) as a step of the journal,
+# after its checkpoint (see checkpoint_update()), unless the caller took it
+# already. Without update_checkpoint an interrupted update is run again on
+# the database as the interruption left it.
+def update_step(step, db, whole, func, *args, checkpointed=False):
+    if not checkpointed:
+        checkpoint_update(step, db, whole)
+    step = db + ': ' + step
+    if journal.done(step):
+        print(" Skip " + step + ", done in an earlier attempt")
+        return journal.returncode(step)
+    ckpt = db + '.ckpt'
+    ret = journal.run(step, func, *args)
+    if os.path.exists(ckpt):
+        shutil.rmtree(ckpt)
+    return ret
+
+
+# Build the databases of some query, throughput, templates and replay tests
+# of the matrix, each once, concurrently within the build budget. A database
+# that several tests load with the same options is built for the first one
+# and linked for the others.
+def matrix_builds(tests, inputdir, outputdir):
+    builds, runs = experiments.expand(tests)
+    jobs = []
+    for b in builds:
+        paths = [outputdir + '/' + p for p in b.paths]
+        for p in paths:
+            if not os.path.exists(os.path.dirname(p)):
+                os.makedirs(os.path.dirname(p))
+        if b.kind == 'rdf3x':
+            jobs.append(load_db_rdf3x_job(inputdir + '/' + b.input, paths[0], links=paths[1:]))
+        else:
+            jobs.append(load_db_job(inputdir + '/' + b.input, paths[0], b.opts, links=paths[1:]))
+    # The builds are reported with the first test that needs them
+    for job in run_jobs(jobs):
+        if job.returncode == 0 and job.description != '':
+            testdir = job.name[:job.name.rfind('/db/')]
+            os.makedirs(testdir + '/' + getResultsName(), exist_ok=True)
+            results_store.record_build(testdir + '/' + getResultsName(), job.name, job.description, job.walltime())
+    return runs
+
+# Results of the query runs of this invocation, by key of the run, so that a
+# run shared by several tests happens once
+matrix_results = {}
+
+# A 'queries' test of the matrix: every query run in its order, on the
+# databases built by matrix_builds()
+def query_test(name, runs, queriesdir, outputdir):
+    dbdir = outputdir
+    outputdir = outputdir + "/test" + name
     resultsdir = outputdir + "/" + getResultsName()
-    os.makedirs(resultsdir)
-
-    print(" Launch the LUBM queries  ...")
-    query(outputdb, queriesdir + '/lubm-test', resultsdir + '/lubm7950', extraopts, 'query')
-
-    count = 0
-    for addpart in addparts:
-        count = count + 1
-        print("Adding 10 universities")
-        add_db(inputdir + '/lubm1b_parts/part' + addpart, outputdb, extraopts, addpart)
-
-        print(" Launch the LUBM queries  ...")
-        query(outputdb, queriesdir + '/lubm-test', resultsdir + '/parts-added-' + str(count), extraopts, 'query')
-
-    print("Merging updates")
-    merge_db(outputdb, extraopts, 'add')
-
-    print(" Launch the LUBM queries  ...")
-    query(outputdb, queriesdir + '/lubm-test', resultsdir + '/parts-merged-after-add', extraopts, 'query')
-
-    count = 0
-    for rmpart in rmparts:
-        count = count + 1
-        print("Removing 10 universities")
-        rm_db(inputdir + '/lubm1b_parts/part' + rmpart, outputdb, extraopts, rmpart)
-
-        print(" Launch the LUBM queries  ...")
-        query(outputdb, queriesdir + '/lubm-test', resultsdir + '/parts-removed-' + str(count), extraopts, 'query')
-
-    print("Merging updates")
-    merge_db(outputdb, extraopts, 'db')
-
-    print(" Launch the LUBM queries  ...")
-    query(outputdb, queriesdir + '/lubm-test', resultsdir + '/parts-merged-after-rm', extraopts, 'query')
-
-# Similar to test7, smaller dataset
-def test8(inputdir, queriesdir, outputdir):
-    addparts = [ '995', '996', '997', '998', '999' ]
-    rmparts = [ '100', '200', '300', '400', '500' ]
-    outputdir = outputdir + "/test8"
+    os.makedirs(resultsdir, exist_ok=True)
+    for r in runs:
+        output = resultsdir + '/' + r.output
+        if r.key() in matrix_results:
+            print(" Reuse the results of " + matrix_results[r.key()] + " for " + output)
+            if os.path.exists(output):
+                shutil.rmtree(output)
+            shutil.copytree(matrix_results[r.key()], output, symlinks=True)
+            results_store.ingest(output)
+            continue
+        print(" Launch the " + r.queries + " queries on " + r.dataset + " with " + r.engine + " ...")
+        if r.engine == 'rdf3x':
+            query_rdf3x(dbdir + '/' + r.db + '/outputdb', queriesdir + '/' + r.queries, output)
+        else:
+            query(dbdir + '/' + r.db, queriesdir + '/' + r.queries, output, r.opts,
+                  'query_native' if r.engine == 'trident-native' else 'query')
+        matrix_results[r.key()] = output
+    if experiments.queries[name]['check']:
+        check_answers(resultsdir)
+    if heatmap_on:
+        heatmap.report([resultsdir], resultsdir + '/heatmap')
+        print(" Regions of the databases touched by the queries:")
+        print(open(resultsdir + '/heatmap.txt', 'rt').read())
+
+# Command that runs a query once with an engine, for the clients of a
+# throughput test. Like the measured runs of query(), trident does not
+# decode the answer.
+def client_cmd(engine, db, opts):
+    if engine == 'rdf3x':
+        return lambda query: [rdf3xquery_exec, db + '/outputdb', query, '1']
+    query_type = 'query_native' if engine == 'trident-native' else 'query'
+    return lambda query: shlex.split(trident_exec + ' ' + query_type + ' -i ' + db + ' -q ' + query + ' -l info --decodeoutput false ' + opts)
+
+# A 'throughput' test of the matrix: every query run of the test by a sweep
+# of concurrent clients, each level a step of the journal, on the databases
+# built by matrix_builds() (see throughput.py). The clients are watched for
+# the query timeout only: a watchdog with the RSS limit would scan /proc
+# every second for every client, on the machine being measured.
+def throughput_test(name, runs, queriesdir, outputdir):
+    t = experiments.throughputs[name]
+    resultsdir = outputdir + "/test" + name + "/" + getResultsName()
+    os.makedirs(resultsdir, exist_ok=True)
+    table = []
+    for r in runs:
+        output = resultsdir + '/' + r.output
+        queries = queriesdir + '/' + r.queries
+        fqueries = sorted([queries + '/' + q for q in os.listdir(queries) if not q.startswith('.')])
+        cmd = client_cmd(r.engine, outputdir + '/' + r.db, r.opts)
+        patterns = logparse.RDF3X if r.engine == 'rdf3x' else logparse.TRIDENT
+        for n in throughput.levels(t['clients']):
+            print(" Launch the " + r.queries + " queries on " + r.dataset + " with " + r.engine + ", " + str(n) +
+                  " clients ...")
+            journal.run(output + ': clients ' + str(n), throughput.level, output + '/clients-' + str(n), cmd,
+                        fqueries, n, t['duration'], t['warmup'], t['pin'], query_timeout, 0, patterns)
+        table += throughput.rows(r.dataset, r.engine, output)
+    with open(resultsdir + '/' + throughput.TABLE, 'wt') as fout:
+        throughput.write_table(table, fout)
+    with open(resultsdir + '/' + throughput.TABLE + '_peaks', 'wt') as fout:
+        throughput.peaks(table, fout)
+    print(open(resultsdir + '/' + throughput.TABLE, 'rt').read())
+    print(open(resultsdir + '/' + throughput.TABLE + '_peaks', 'rt').read())
+
+# A 'replay' test of the matrix: the queries of a dataset replayed as an
+# open-loop workload at every rate, on the database built by
+# matrix_builds(), each rate a step of the journal (see replay.py). The
+# queries run like the measured runs of query(), without decoding the
+# answer, and are watched for the query timeout only: a watchdog with the
+# RSS limit would scan /proc every second for every query in flight.
+def replay_test(name, runs, queriesdir, outputdir):
+    r = experiments.replays[name]
+    run = runs[0]
+    db = outputdir + '/' + run.db
+    output = outputdir + "/test" + name + "/" + getResultsName() + '/' + run.output
+    os.makedirs(output, exist_ok=True)
+    queries = queriesdir + '/' + run.queries
+    fqueries = sorted([queries + '/' + q for q in os.listdir(queries) if not q.startswith('.')])
+    trace = None
+    if r['arrival'] == 'trace':
+        trace = replay.load_trace(r['trace'], queries)
+
+    def cmd(query):
+        return shlex.split(trident_exec + ' query -i ' + db + ' -q ' + query + ' -l info --decodeoutput false ' +
+                           run.opts)
+
+    def replay_rate(rate):
+        rng = random.Random(r['seed'])
+        schedule = replay.arrivals(rate, r['duration'], fqueries, rng, trace)
+        print(" Replay " + str(len(schedule)) + " queries at " + '%g' % rate + " queries/s ...")
+        rows = replay.run(cmd, schedule, r['concurrency'], query_timeout, 0)
+        replay.save(output + '/' + replay.PREFIX + '%g' % rate, rows)
+        return 0
+
+    for rate in r['rates']:
+        journal.run(output + ': rate %g' % rate, replay_rate, rate)
+    knee = replay.report(output, r['duration'], r['warmup'])
+    print(" Latency and throughput per rate:")
+    print(open(output + '/' + replay.CURVE, 'rt').read())
+    print(" Knee of the p99 latency at " + ('%g queries/s' % knee if knee is not None else 'no rate'))
+
+# A 'templates' test of the matrix: the queries of every suite as templates
+# (see templates.py), on the databases built by matrix_builds(). The
+# bindings of the parameters of a template are the answers of a query on the
+# database; the instances drawn from them run once each, a template a step
+# of the journal. The runtimes per template and class of selectivity are in
+# <results>/<suite>/templates_summary.
+def templates_test(name, runs, queriesdir, outputdir):
+    t = experiments.templates[name]
+    resultsdir = outputdir + "/test" + name + "/" + getResultsName()
+    for r in runs:
+        db = outputdir + '/' + r.db
+        output = resultsdir + '/' + r.output
+        os.makedirs(output, exist_ok=True)
+
+        # The answers of the binding queries are read, those of the
+        # instances are not decoded, as in the measured runs of query()
+        def cmd(query, decode=True):
+            return trident_exec + ' query -i ' + db + ' -q ' + query + ' -l info ' + \
+                ('' if decode else '--decodeoutput false ') + r.opts
+
+        def instantiate(template):
+            tpldir = output + '/instances/' + template.name
+            os.makedirs(tpldir, exist_ok=True)
+            counts = []
+            for g in range(len(template.groups)):
+                fquery = tpldir + '/bindings_' + str(g)
+                with open(fquery, 'wt') as fout:
+                    fout.write(template.binding_query(g))
+                with open(fquery + '.answers', 'wb') as fout:
+                    run_process(cmd(fquery), stdout=fout, stderr=subprocess.DEVNULL, timeout=query_timeout)
+                with open(fquery + '.answers', 'rb') as fin:
+                    counts.append(templates.count_bindings(fin, len(template.groups[g][1])))
+                os.remove(fquery + '.answers')
+                print("  " + str(len(counts[g])) + " bindings of " + ' '.join(template.groups[g][1]))
+            rng = random.Random(t['seed'])
+            drawn = templates.instances(template, counts, t['instances'], t['draw'], rng, t['zipf'])
+            rows = []
+            for i in range(len(drawn)):
+                values, answers = drawn[i]
+                fquery = tpldir + '/' + str(i)
+                with open(fquery, 'wt') as fout:
+                    fout.write(template.instance(values))
+                start, end, execms, ret = mixedload.execute(shlex.split(cmd(fquery, False)), query_timeout, rss_limit)
+                rows.append({'instance': i, 'binding': values, 'answers': answers,
+                             'class': templates.selectivity_class(answers), 'latency_ms': (end - start) * 1000,
+                             'exec_ms': execms, 'ret': ret})
+            templates.save_instances(output + '/instances_' + template.name, rows)
+            return 0
+
+        for template in templates.load_suite(queriesdir + '/' + r.queries):
+            if len(template.params) == 0:
+                print(" " + template.name + " of " + r.queries + " has no constants to draw, skipped")
+                continue
+            print(" Run " + str(t['instances']) + " instances of " + template.name + " of " + r.queries + " on " +
+                  r.dataset + " ...")
+            journal.run(output + ': ' + template.name, instantiate, template)
+        with open(output + '/' + templates.SUMMARY, 'wt') as fout:
+            templates.summary(output, fout)
+        print(" Runtimes of the instances of " + r.queries + " per template and class of selectivity:")
+        print(open(output + '/' + templates.SUMMARY, 'rt').read())
+
+# Input of an update of some parts: the part itself, or a directory that
+# links the files of all the parts
+def update_input(inputdir, pattern, parts, tmpinput):
+    if len(parts) == 1:
+        return inputdir + '/' + pattern.format(parts[0])
+    if os.path.exists(tmpinput):
+        shutil.rmtree(tmpinput)
+    os.makedirs(tmpinput)
+    for part in parts:
+        path = inputdir + '/' + pattern.format(part)
+        files = [path]
+        if os.path.isdir(path):
+            files = [path + '/' + f for f in sorted(os.listdir(path)) if not f.startswith('.')]
+        for f in files:
+            os.symlink(f, tmpinput + '/' + part + '_' + os.path.basename(f))
+    return tmpinput
+
+# An 'updates' test of the matrix: the queries run on the database as it is
+# loaded and after every step of the schedule of updates and merges. The
+# trace of the test (<results>/updates) has, after every step, the updates
+# pending in _diff, the size of _diff, the time of the step and the latency
+# of the queries; the merge policies simulated from it are compared in
+# <results>/merge_policies (see mergepolicy.py).
+def updates_test(name, inputdir, queriesdir, outputdir):
+    u = experiments.updates[name]
+    outputdir = outputdir + "/test" + name
     dbdir = outputdir + "/db"
     # Does it already exist?
     if not os.path.exists(dbdir):
         os.makedirs(dbdir)
-    outputdb = dbdir + '/lubm1000_updates'
-    if not os.path.exists(outputdb):
-        load_db(inputdir + '/lubm1000_parts/lubm995', outputdb, extraopts)
-    else:
-        if os.path.exists(outputdb + '/_diff'):
-            shutil.rmtree(outputdb + '/_diff')
-
-    # Now the directory for sure exist
+    outputdb = dbdir + '/' + u['db']
+    updates_db(inputdir + '/' + u['base'], outputdb, u['load'])
     resultsdir = outputdir + "/" + getResultsName()
-    os.makedirs(resultsdir)
-
-    print(" Launch the LUBM queries  ...")
-    query(outputdb, queriesdir + '/lubm-test', resultsdir + '/lubm995', extraopts, 'query')
-
-    count = 0
-    for addpart in addparts:
-        count = count + 1
-        print("Adding 1 university")
-        add_db(inputdir + '/lubm1000_parts/lubm-u' + addpart, outputdb, extraopts, addpart)
-
-        print(" Launch the LUBM queries  ...")
-        query(outputdb, queriesdir + '/lubm-test', resultsdir + '/parts-added-' + str(count), extraopts, 'query')
-
-    print("Merging updates")
-    merge_db(outputdb, extraopts, 'add')
-
-    print(" Launch the LUBM queries  ...")
-    query(outputdb, queriesdir + '/lubm-test', resultsdir + '/parts-merged-after-add', extraopts, 'query')
-
-    count = 0
-    for rmpart in rmparts:
-        count = count + 1
-        print("Removing 1 universities")
-        rm_db(inputdir + '/lubm1000_parts/lubm-u' + rmpart, outputdb, extraopts, rmpart)
-
-        print(" Launch the LUBM queries  ...")
-        query(outputdb, queriesdir + '/lubm-test', resultsdir + '/parts-removed-' + str(count), extraopts, 'query')
-
-    print("Merging updates")
-    merge_db(outputdb, extraopts, 'db')
-
-    print(" Launch the LUBM queries  ...")
-    query(outputdb, queriesdir + '/lubm-test', resultsdir + '/parts-merged-after-rm', extraopts, 'query')
-
-# Similar to test7, but with wikidata
-def test9(inputdir, queriesdir, outputdir):
-    addparts = [ '54', '42', '14', '34', '61' ]
-    rmparts = [ '55', '10', '49', '47', '60' ]
-    outputdir = outputdir + "/test9"
+    os.makedirs(resultsdir, exist_ok=True)
+    queries = queriesdir + '/' + u['queries']
+    # The steps of an earlier attempt keep their row
+    trace = {}
+    for r in mergepolicy.load_trace(resultsdir + '/' + mergepolicy.TRACE):
+        trace[r['step']] = r
+
+    def record(step, op, parts, pending, seconds, output):
+        diff = 0
+        if os.path.exists(outputdb + '/_diff'):
+            diff = input_size(outputdb + '/_diff') * 1024
+        trace[step] = {'step': step, 'op': op, 'parts': parts, 'pending': pending, 'diff_mb': diff,
+                       'op_s': seconds or 0, 'latency_ms': mergepolicy.round_latency(output)}
+        mergepolicy.save_trace(resultsdir + '/' + mergepolicy.TRACE, list(trace.values()))
+
+    print(" Launch the queries  ...")
+    query(outputdb, queries, resultsdir + '/' + u['first'], u['query'], 'query')
+    record(0, 'load', '-', 0, 0, resultsdir + '/' + u['first'])
+    pending = 0
+    steps = experiments.schedule(name)
+    for i in range(len(steps)):
+        op, parts, output, label = steps[i]
+        resumed = journal.done(outputdb + ': ' + op + ' ' + label)
+        if op == 'merge':
+            print("Merging updates")
+            update_step('merge ' + label, outputdb, True, merge_db, outputdb, u['load'], label)
+            pending = 0
+        else:
+            print(("Adding " if op == 'add' else "Removing ") + ' '.join(parts))
+            pattern = u['add_input'] if op == 'add' else u['rm_input']
+            tmpinput = outputdir + '/update_input'
+            input = update_input(inputdir, pattern, parts, tmpinput)
+            update_step(op + ' ' + label, outputdb, False, add_db if op == 'add' else rm_db, input, outputdb,
+                        u['load'], label)
+            if os.path.exists(tmpinput):
+                shutil.rmtree(tmpinput)
+            pending += 1
+        print(" Launch the queries  ...")
+        query(outputdb, queries, resultsdir + '/' + output, u['query'], 'query')
+        # The size of _diff after a step of an earlier attempt is lost
+        if not (resumed and i + 1 in trace):
+            record(i + 1, op, label, pending, journal.seconds(outputdb + ': ' + op + ' ' + label),
+                   resultsdir + '/' + output)
+
+    # Compare the merge policies
+    policies = [p.strip() for p in u['policies'].split(',') if p.strip() != '']
+    model, report = mergepolicy.evaluate(list(trace.values()), policies, u['policy_updates'], u['policy_queries'])
+    with open(resultsdir + '/merge_policies', 'wt') as fout:
+        mergepolicy.print_report(model, report, fout)
+    print(" Merge policies, the cheapest first:")
+    print(open(resultsdir + '/merge_policies', 'rt').read())
+
+# An 'updates' test of the matrix with clients: the clients query the
+# database while the steps of the schedule run, and for some idle time
+# before and after them (see mixedload.py). A resumed test keeps the
+# queries of the phases that were complete.
+def mixed_updates_test(name, inputdir, queriesdir, outputdir):
+    u = experiments.updates[name]
+    outputdir = outputdir + "/test" + name
     dbdir = outputdir + "/db"
-    # Does it already exist?
     if not os.path.exists(dbdir):
         os.makedirs(dbdir)
-    outputdb = dbdir + '/wikidata_updates'
-    if not os.path.exists(outputdb):
-        load_db(inputdir + '/wikidata.parts/db', outputdb, extraopts)
-    else:
-        if os.path.exists(outputdb + '/_diff'):
-            shutil.rmtree(outputdb + '/_diff')
-
-    # Now the directory for sure exist
+    outputdb = dbdir + '/' + u['db']
+    resumed = journal.any_started(outputdb + ': ')
+    updates_db(inputdir + '/' + u['base'], outputdb, u['load'])
     resultsdir = outputdir + "/" + getResultsName()
-    os.makedirs(resultsdir)
-
-    print(" Launch the Wikidata queries  ...")
-    query(outputdb, queriesdir + '/wikidata', resultsdir + '/wikidata-', extraopts, 'query')
-
-    count = 0
-    for addpart in addparts:
-        count = count + 1
-        print("Adding 1MB facts")
-        add_db(inputdir + '/wikidata.parts/head' + addpart, outputdb, extraopts, str(count))
-
-        print(" Launch the Wikidata queries  ...")
-        query(outputdb, queriesdir + '/wikidata', resultsdir + '/parts-added-' + str(count), extraopts, 'query')
-
-    print("Merging updates")
-    merge_db(outputdb, extraopts, 'add')
-
-    print(" Launch the Wikidata queries  ...")
-    query(outputdb, queriesdir + '/wikidata', resultsdir + '/parts-merged-after-add', extraopts, 'query')
-
-    count = 0
-    for rmpart in rmparts:
-        count = count + 1
-        print("Removing 1MB facts")
-        rm_db(inputdir + '/wikidata.parts/head' + rmpart, outputdb, extraopts, str(count))
-
-        print(" Launch the Wikidata queries  ...")
-        query(outputdb, queriesdir + '/wikidata', resultsdir + '/parts-removed-' + str(count), extraopts, 'query')
-
-    print("Merging updates")
-    merge_db(outputdb, extraopts, 'db')
-
-    print(" Launch the Wikidata queries  ...")
-    query(outputdb, queriesdir + '/wikidata', resultsdir + '/parts-merged-after-rm', extraopts, 'query')
-
-def test10(inputdir, queriesdir, outputdir):
-    # Load lubm1b, btc2012, uniprot, dbpedia, wikidata and launch the queries with trident (query and query_native). This is like test2, but using the skipTables option.
-    outputdir = outputdir + "/test10"
+    os.makedirs(resultsdir, exist_ok=True)
+    queries = queriesdir + '/' + u['queries']
+    fqueries = sorted([queries + '/' + q for q in os.listdir(queries) if not q.startswith('.')])
+    rows, phases = [], []
+    if resumed:
+        rows, phases = mixedload.load(resultsdir)
+        done = [p[0] for p in phases]
+        rows = [r for r in rows if r['phase'] in done]
+    t0 = time.time() - (phases[-1][2] if len(phases) > 0 else 0)
+
+    def cmd(query, client):
+        return shlex.split(trident_exec + ' query -i ' + outputdb + ' -q ' + query + ' -l info --decodeoutput false ' +
+                           u['query'])
+
+    def save(clients, complete):
+        mixedload.save(resultsdir, rows + [r for r in clients.rows if r['phase'] in complete],
+                       phases + clients.phases[:len(complete)])
+
+    print(" Launch " + str(u['clients']) + " clients on " + outputdb)
+    # As in throughput_test(), the clients are watched for the timeout only
+    clients = mixedload.Clients(cmd, fqueries, u['clients'], query_timeout, 0, t0)
+    clients.start('idle-before' if len(phases) == 0 else 'idle-resume-' + str(len(phases)))
+    try:
+        time.sleep(u['idle'])
+        for op, parts, output, label in experiments.schedule(name):
+            step = op + ' ' + label
+            if journal.done(outputdb + ': ' + step):
+                continue
+            # The copy of the checkpoint is a phase of its own, so that it
+            # is not part of the duration of the update nor of the latency of
+            # the queries during it
+            if update_checkpoint:
+                clients.phase('checkpoint ' + step)
+                checkpoint_update(step, outputdb, op == 'merge')
+            clients.phase(step)
+            save(clients, [p[0] for p in clients.phases[:-1]])
+            if op == 'merge':
+                print("Merging updates")
+                update_step(step, outputdb, True, merge_db, outputdb, u['load'], label, checkpointed=True)
+            else:
+                print(("Adding " if op == 'add' else "Removing ") + ' '.join(parts))
+                pattern = u['add_input'] if op == 'add' else u['rm_input']
+                tmpinput = outputdir + '/update_input'
+                input = update_input(inputdir, pattern, parts, tmpinput)
+                update_step(step, outputdb, False, add_db if op == 'add' else rm_db, input, outputdb, u['load'],
+                            label, checkpointed=True)
+                if os.path.exists(tmpinput):
+                    shutil.rmtree(tmpinput)
+        clients.phase('idle-after')
+        time.sleep(u['idle'])
+    finally:
+        clients.stop()
+    save(clients, [p[0] for p in clients.phases])
+    mixedload.report(resultsdir, u['bucket'])
+    print(" Queries per phase:")
+    print(open(resultsdir + '/' + mixedload.SUMMARY, 'rt').read())
+
+
+def test11(inputdir, outputdir):
+    # Load a sample of an input with every combination of loader options, and
+    # recommend the fastest one that fits in the RAM of the machine
+    outputdir = outputdir + "/test11"
     dbdir = outputdir + "/db"
-    # Does it already exist?
-    if not os.path.exists(dbdir):
-        os.makedirs(dbdir)
-    if not os.path.exists(dbdir + '/lubm1b'):
-        outputdb = dbdir + '/lubm1b'
-        load_db(inputdir + '/lubm1b', outputdb, '--skipTables true')
-    if not os.path.exists(dbdir + '/btc2012'):
-        outputdb = dbdir + '/btc2012'
-        load_db(inputdir + '/btc2012', outputdb, '--skipTables true')
-    if not os.path.exists(dbdir + '/uniprot'):
-        outputdb = dbdir + '/uniprot'
-        load_db(inputdir + '/uniprot', outputdb, '--skipTables true')
-    if not os.path.exists(dbdir + '/dbpedia'):
-        outputdb = dbdir + '/dbpedia'
-        load_db(inputdir + '/dbpedia', outputdb, '--skipTables true')
-    if not os.path.exists(dbdir + '/wikidata'):
-        outputdb = dbdir + '/wikidata'
-        load_db(inputdir + '/wikidata', outputdb, '--skipTables true')
-
-    # Now the directory for sure exist
     resultsdir = outputdir + "/" + getResultsName()
-    os.makedirs(resultsdir)
+    os.makedirs(resultsdir, exist_ok=True)
+    inputdir = inputdir + '/' + tune_input
+    allfiles = [f for f in os.listdir(inputdir) if not f.startswith('.')]
+    allfiles.sort()
+    if len(allfiles) == 0:
+        raise Exception('No files to load! Test aborted')
+
+    settings = []
+    for threads in tune_threads:
+        for readthreads in tune_readthreads:
+            if readthreads > threads:
+                continue
+            for layout in tune_layouts:
+                opts = '--maxThreads ' + str(threads) + ' --readThreads ' + str(readthreads)
+                if layout != 'default':
+                    opts += ' ' + layout
+                settings.append((threads, readthreads, layout, (opts + ' ' + tune_extraopts).strip()))
+
+    # Samples of the rounds, growing up to tune_sample
+    if tune_search == 'halving' and len(settings) > 1:
+        rounds = int(math.ceil(math.log(len(settings), tune_eta)))
+        samples = [tune_sample / tune_eta ** (rounds - r) for r in range(rounds + 1)]
+    else:
+        samples = [tune_sample]
 
-    # Launch all the tests
-    print(" Launch the LUBM queries (native) ...")
-    query(dbdir + '/lubm1b', queriesdir + '/lubm', resultsdir + '/lubm1b-native', extraopts, 'query_native')
-    print(" Launch the LUBM queries  ...")
-    query(dbdir + '/lubm1b', queriesdir + '/lubm', resultsdir + '/lubm1b', extraopts, 'query')
-    print(" Launch the BTC2012 queries (native) ...")
-    query(dbdir + '/btc2012', queriesdir + '/btc2012', resultsdir + '/btc2012-native', extraopts, 'query_native')
-    print(" Launch the BTC2012 queries ...")
-    query(dbdir + '/btc2012', queriesdir + '/btc2012', resultsdir + '/btc2012', extraopts, 'query')
-    print(" Launch the Uniprot queries (native) ...")
-    query(dbdir + '/uniprot', queriesdir + '/uniprot', resultsdir + '/uniprot-native', extraopts, 'query_native')
-    print(" Launch the Uniprot queries  ...")
-    query(dbdir + '/uniprot', queriesdir + '/uniprot', resultsdir + '/uniprot', extraopts, 'query')
-    print(" Launch the DBpedia queries (native) ...")
-    query(dbdir + '/dbpedia', queriesdir + '/dbpedia-examples', resultsdir + '/dbpedia-native', extraopts, 'query_native')
-    print(" Launch the DBpedia queries ...")
-    query(dbdir + '/dbpedia', queriesdir + '/dbpedia-examples', resultsdir + '/dbpedia', extraopts, 'query')
-    print(" Launch the Wikidata queries (native) ...")
-    query(dbdir + '/wikidata', queriesdir + '/wikidata', resultsdir + '/wikidata-native', extraopts, 'query_native')
-    print(" Launch the Wikidata queries ...")
-    query(dbdir + '/wikidata', queriesdir + '/wikidata', resultsdir + '/wikidata', extraopts, 'query')
-
-if test == 'all' or test == '1':
-    print("*** Begin Test 1 ***")
-    test1(datasets_dir, results_dir)
-    print("*** End Test 1 ***")
-
-if test == 'all' or test == '2':
-    print("*** Begin Test 2 ***")
-    test2(datasets_dir, queries_dir, results_dir)
-    print("*** End Test 2 ***")
-
-if test == 'all' or test == '3':
-    print("*** Begin Test 3 ***")
-    test3(datasets_dir, queries_dir, results_dir)
-    print("*** End Test 3 ***")
-
-if test == 'all' or test == '4':
-    print("*** Begin Test 4 ***")
-    test4(datasets_dir, results_dir)
-    print("*** End Test 4 ***")
-
-if test == 'all' or test == '5':
-    print("*** Begin Test 5 ***")
-    test5(datasets_dir, queries_dir, results_dir)
-    print("*** End Test 5 ***")
-
-if test == 'all' or test == '6':
-    print("*** Begin Test 6 ***")
-    test6(datasets_dir, results_dir)
-    print("*** End Test 6 ***")
-
-if test == 'all' or test == '7':
-    print("*** Begin Test 7 ***")
-    test7(datasets_dir, queries_dir, results_dir)
-    print("*** End Test 7 ***")
-
-if test == 'all' or test == '8':
-    print("*** Begin Test 8 ***")
-    test8(datasets_dir, queries_dir, results_dir)
-    print("*** End Test 8 ***")
-
-if test == 'all' or test == '9':
-    print("*** Begin Test 9 ***")
-    test9(datasets_dir, queries_dir, results_dir)
-    print("*** End Test 9 ***")
-
-if test == 'all' or test == '10':
-    print("*** Begin Test 10 ***")
-    test10(datasets_dir, queries_dir, results_dir)
-    print("*** End Test 10 ***")
+    # Load the first nfiles files with some options. Returns the wall time, the
+    # peak RSS (GB) and the size of the database (GB), or None on a failure.
+    def measure(opts, nfiles, name):
+        tmpinput = outputdir + '/tune_input'
+        if os.path.exists(tmpinput):
+            shutil.rmtree(tmpinput)
+        os.makedirs(tmpinput)
+        for f in allfiles[:nfiles]:
+            os.symlink(inputdir + '/' + f, tmpinput + '/' + f)
+        db = dbdir + '/' + name + '/' + tune_input
+        if os.path.exists(dbdir + '/' + name):
+            shutil.rmtree(dbdir + '/' + name)
+        os.makedirs(dbdir + '/' + name)
+        flushCache([inputdir + '/' + f for f in allfiles[:nfiles]])
+        start = time.time()
+        ret = load_db(tmpinput, db, opts)
+        wall = time.time() - start
+        shutil.rmtree(tmpinput)
+        if ret != 0:
+            shutil.rmtree(dbdir + '/' + name)
+            return None
+        results_store.record_build(resultsdir, db, 'load ' + opts, wall)
+        peak = float('nan')
+        if os.path.exists(db + resources.SUFFIX):
+            interval, series = resources.load(db + resources.SUFFIX)
+            peak = resources.summary(series).get('rss', float('nan')) / (1024 ** 3)
+        size = input_size(db)
+        shutil.rmtree(dbdir + '/' + name)
+        return wall, peak, size
+
+    fout = open(resultsdir + '/tune', 'wt')
+    fout.write('ROUND\tFILES\tMAXTHREADS\tREADTHREADS\tLAYOUT\tLOAD_S\tPEAK_RSS_GB\tDB_GB\n')
+    candidates = settings
+    results = {}
+    for r in range(len(samples)):
+        nfiles = max(1, int(len(allfiles) * samples[r]))
+        print(" Round " + str(r) + ": " + str(len(candidates)) + " settings on " + str(nfiles) + " files")
+        results = {}
+        for i in range(len(candidates)):
+            threads, readthreads, layout, opts = candidates[i]
+            m = measure(opts, nfiles, 'r' + str(r) + '_' + str(i))
+            row = [str(r), str(nfiles), str(threads), str(readthreads), layout]
+            if m is None:
+                row += ['FAILED', '-', '-']
+            else:
+                results[candidates[i]] = m
+                row += ['%.1f' % m[0], '%.2f' % m[1], '%.2f' % m[2]]
+            fout.write('\t'.join(row) + '\n')
+            fout.flush()
+        # Keep the fastest settings for the next round
+        ranked = sorted(results.keys(), key=lambda c: results[c][0])
+        candidates = ranked[:max(1, int(math.ceil(len(ranked) / tune_eta)))]
+        if len(candidates) == 0:
+            break
+    fout.close()
+    print(open(resultsdir + '/tune', 'rt').read())
+
+    # Settings of the last round that fit in the RAM of the machine: the
+    # fastest of each layout, and the fastest overall
+    fits = [c for c in results if not results[c][1] > build_ram]
+    fout = open(resultsdir + '/recommendation', 'wt')
+    for layout in tune_layouts:
+        best = sorted([c for c in fits if c[2] == layout], key=lambda c: results[c][0])
+        if len(best) > 0:
+            fout.write(layout + '\t' + best[0][3] + '\n')
+    best = sorted(fits, key=lambda c: results[c][0])
+    if len(best) > 0:
+        fout.write('best\t' + best[0][3] + '\n')
+    else:
+        fout.write('best\tnone of the settings succeeded within ' + '%.0f' % build_ram + 'GB of RAM\n')
+    fout.close()
+    print(" Recommended settings:")
+    print(open(resultsdir + '/recommendation', 'rt').read())
+
+
+# Tests written as functions; the others are expanded from the matrix. Test
+# 11, and the tests of the matrix with 'in_all = no', run only when they are
+# asked for.
+functions = {'1': lambda: test1(datasets_dir, results_dir),
+             '3': lambda: test3(datasets_dir, queries_dir, results_dir),
+             '4': lambda: test4(datasets_dir, results_dir),
+             '5': lambda: test5(datasets_dir, queries_dir, results_dir),
+             '6': lambda: test6(datasets_dir, results_dir),
+             '11': lambda: test11(datasets_dir, results_dir)}
+alltests = sorted([t for t in list(functions.keys()) + experiments.tests()
+                   if t != '11' and t not in experiments.optional], key=int)
+tests = alltests
+if test != 'all':
+    if test not in functions and test not in experiments.tests():
+        print("Unknown test " + test)
+        exit(1)
+    tests = [test]
+
+# Tests that are done in a resumed run are skipped
+tests = [t for t in tests if not journal.done('test' + t)]
+# The databases of all the query, throughput, templates and replay tests of
+# the matrix are built first, in parallel, each once
+matrix_runs = {}
+built = list(experiments.queries.keys()) + list(experiments.throughputs.keys()) + list(experiments.replays.keys()) + \
+        list(experiments.templates.keys())
+if any([t in built for t in tests]):
+    matrix_runs = matrix_builds([t for t in tests if t in built], datasets_dir, results_dir)
+
+for t in tests:
+    print("*** Begin Test " + t + " ***")
+    journal.start('test' + t)
+    if t in functions:
+        functions[t]()
+    elif t in experiments.queries:
+        query_test(t, matrix_runs[t], queries_dir, results_dir)
+    elif t in experiments.throughputs:
+        throughput_test(t, matrix_runs[t], queries_dir, results_dir)
+    elif t in experiments.templates:
+        templates_test(t, matrix_runs[t], queries_dir, results_dir)
+    elif t in experiments.replays:
+        replay_test(t, matrix_runs[t], queries_dir, results_dir)
+    elif experiments.updates[t]['clients'] > 0:
+        mixed_updates_test(t, datasets_dir, queries_dir, results_dir)
+    else:
+        updates_test(t, datasets_dir, queries_dir, results_dir)
+    journal.finish('test' + t)
+    print("*** End Test " + t + " ***")
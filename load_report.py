@@ -0,0 +1,132 @@
+import os
+import re
+import sys
+import json
+import shlex
+import argparse
+import numpy as np
+
+import logparse
+
+# Breakdown of the database builds by phase (encoding, sorting, tree, binary
+# tables, permutations). Every <db>.log written by a trident load is found
+# under the given directories, and for every phase the report gives the wall
+# time, its share of the build, the average CPU load, the peak RAM (GB, as
+# trident reports it) and the MB/s read and written, from the STATS lines of
+# the log. The phase that takes the largest share of a build is marked with
+# '*'.
+
+# Options of the load command that only name its input and output
+PATH_OPTIONS = ['-f', '-i', '--logfile', '--comprinput', '--comprdict', '-l']
+
+
+# Options of a load, from the command saved next to the log (<db>.cmd) or
+# from the description of the cache entry
+def options(db):
+    if os.path.exists(db + '.cmd'):
+        tokens = shlex.split(open(db + '.cmd', 'rt').read())
+        opts = []
+        i = 2  # skip the executable and 'load'
+        while i < len(tokens):
+            if tokens[i] in PATH_OPTIONS:
+                i += 2
+            else:
+                opts.append(tokens[i])
+                i += 1
+        return ' '.join(opts)
+    meta = os.path.join(os.path.dirname(os.path.realpath(db)), 'meta.json')
+    if os.path.exists(meta):
+        description = json.load(open(meta, 'rt'))['description']
+        return description[description.find(': ') + 2:]
+    return ''
+
+
+# The logs of all the loads under a directory, one per build: a database
+# that is linked from the cache in several places is reported once, under
+# the name of one of its links
+def find_logs(roots):
+    builds = {}
+    for root in roots:
+        for dirpath, dirs, files in os.walk(root):
+            dirs.sort()
+            for f in sorted(files):
+                path = os.path.join(dirpath, f)
+                if not f.endswith('.log') or not os.path.isdir(path[:-4]):
+                    continue
+                real = os.path.realpath(path)
+                # Prefer a link to the name of the cache entry ('db')
+                if real not in builds or os.path.basename(builds[real]) == 'db.log':
+                    builds[real] = path
+    return sorted(builds.values())
+
+
+def test_of(path):
+    for part in reversed(os.path.abspath(path).split(os.sep)):
+        if re.match(r'^test\d+$', part):
+            return part[4:]
+    return ''
+
+
+# Rows of the report for one build
+def breakdown(log):
+    db = log[:-4]
+    name = os.path.basename(db)
+    opts = options(db)
+    if name == 'db':
+        # A cache entry that is not linked anywhere: its description says
+        # where it was built for
+        meta = os.path.join(os.path.dirname(log), 'meta.json')
+        if os.path.exists(meta):
+            description = json.load(open(meta, 'rt'))['description']
+            name = os.path.basename(description[:description.find(': ')])
+    phases = logparse.load_phases(log)
+    stats = logparse.load_stats(log)
+    if len(phases) == 0:
+        return []
+    total = phases[-1][2] - phases[0][1]
+    longest = max([end - start for phase, start, end in phases])
+    rows = []
+    for phase, start, end in phases:
+        wall = end - start
+        # A STATS line reports the interval that ends with it
+        sel = (stats['time'] > start) & (stats['time'] <= end)
+        if start == phases[0][1]:
+            sel |= stats['time'] == start
+        cpu = peak = read = write = float('nan')
+        if np.any(sel):
+            cpu = np.mean(stats['cpu'][sel])
+            peak = np.max(stats['mem'][sel])
+            if wall > 0:
+                read = np.sum(stats['diskr'][sel]) / wall
+                write = np.sum(stats['diskw'][sel]) / wall
+        share = wall / total * 100 if total > 0 else float('nan')
+        rows.append([test_of(log), name, opts, phase + ('*' if wall == longest else ''), wall, share, cpu, peak,
+                     read, write])
+    rows.append([test_of(log), name, opts, 'total', total, 100.0, float('nan'), float('nan'), float('nan'),
+                 float('nan')])
+    return rows
+
+
+def fmt(v):
+    if isinstance(v, str):
+        return v
+    if v != v:
+        return '-'
+    return '%.1f' % v
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Report the phases of all the database builds under some directories')
+    parser.add_argument('dirs', nargs='+', help='directories to scan (e.g. the output directory of the experiments)')
+    parser.add_argument('--dataset', help='only the builds whose name contains this string')
+    args = parser.parse_args()
+
+    print('TEST\tDATASET\tOPTIONS\tPHASE\tWALL_S\tSHARE_%\tAVG_CPU_%\tPEAK_RAM_GB\tREAD_MB/S\tWRITE_MB/S')
+    rows = []
+    for log in find_logs(args.dirs):
+        rows += [r for r in breakdown(log) if args.dataset is None or args.dataset in r[1]]
+    rows.sort(key=lambda r: (r[0], r[1], r[2]))
+    for r in rows:
+        print('\t'.join([fmt(v) for v in r]))
+    if len(rows) == 0:
+        sys.exit(1)
@@ -0,0 +1,249 @@
+import re
+import numpy as np
+from datetime import datetime, timezone
+
+# Streaming parser for the logs written by trident, rdf3x and SNAP. A log is
+# read once, line by line, and every line that reports a metric becomes a
+# record (line number, metric, value). Metrics are found with precompiled
+# patterns rather than at fixed offsets, so that they do not depend on the
+# width of the log prefix.
+
+RECORD = np.dtype([('line', 'i8'), ('metric', 'U16'), ('value', 'f8')])
+
+NUMBER = r'([-+]?(?:[0-9]+\.?[0-9]*|\.[0-9]+)(?:[eE][-+]?[0-9]+)?)'
+
+# Line appended to the log of a command that the watchdog killed
+WATCHDOG = [
+    ('timeout', r'WATCHDOG: TIMEOUT after\s*'),
+    ('oom', r'WATCHDOG: OOM at RSS GB\s*'),
+]
+
+# Line written to the log of a query with the percentage of the files of the
+# database in the page cache before a run (see pagecache.py)
+CACHE = [
+    ('resident', r'CACHE: resident\s*'),
+]
+
+# Lines written to the log of a query by the heat map instrumentation (see
+# heatmap.py)
+HEAT = [
+    ('touched', r'HEAT: touched MB\s*'),
+    ('minflt', r'FAULTS: minflt\s*'),
+    ('majflt', r'FAULTS: majflt\s*'),
+]
+
+# Metric lines of 'trident query' and 'trident query_native'
+TRIDENT = WATCHDOG + CACHE + HEAT + [
+    ('total', r'Runtime totalexec:\s*'),
+    ('queryexec', r'Runtime queryexec:\s*'),
+    ('queryopti', r'Runtime queryopti:\s*'),
+    ('maxmem', r'Max memory[^:=]*[:=]\s*'),
+    ('rows', r'# rows\s*[:=]?\s*'),
+    ('ioread', r'Process IO Read bytes[^:=0-9]*[:=]?\s*'),
+    ('iowrite', r'Process IO Write bytes[^:=0-9]*[:=]?\s*'),
+]
+
+# Metric lines of 'trident analytics'
+ANALYTICS = WATCHDOG + [
+    ('runtime', r'Runtime[^:]*:\s*'),
+]
+
+# Metric lines of rdf3xquery
+RDF3X = WATCHDOG + CACHE + [
+    ('total', r'Time total[^:]*:\s*'),
+    ('query', r'Time query[^:]*:\s*'),
+    ('optimizer', r'Time optimizer[^:]*:\s*'),
+    ('maxmem', r'Max mem[^:]*:\s*'),
+    ('ioread', r'IO Read bytes[^:]*:\s*'),
+]
+
+# Metric lines of testSnap, named after the trident analytics operations
+SNAP = WATCHDOG + [
+    ('hits', r'\bHits[^:]*:\s*'),
+    ('pagerank', r'\bPR\b[^:]*:\s*'),
+    ('clustcoef', r'\bClusterCoeff[^:]*:\s*'),
+    ('triangles', r'\bTriangles[^:]*:\s*'),
+    ('diameter', r'\bDiameter[^:]*:\s*'),
+    ('maxwcc', r'\bMaxWcc[^:]*:\s*'),
+    ('maxscc', r'\bMaxScc[^:]*:\s*'),
+    ('rw', r'\bRandomWalk[^:]*:\s*'),
+    ('bfs', r'\bBFS[^:]*:\s*'),
+    ('mod', r'\bMod[^:]*:\s*'),
+    ('betcentr', r'\bBetCentr[^:]*:\s*'),
+]
+
+_compiled = {}
+
+
+# All the patterns of a set in one regular expression. The number of every
+# pattern is a group named after its metric, so that a single search per
+# line finds both the metric (lastgroup) and its value.
+def _compile(patterns):
+    key = id(patterns)
+    if key not in _compiled:
+        alternatives = ['(?:%s(?P<%s>%s))' % (p, metric, NUMBER[1:-1]) for metric, p in patterns]
+        _compiled[key] = re.compile('|'.join(alternatives))
+    return _compiled[key]
+
+
+# Parse a log in a single pass and return its records, in order of
+# appearance, as a NumPy structured array of dtype RECORD
+def parse(path, patterns):
+    regex = _compile(patterns)
+    records = []
+    with open(path, 'rt', errors='replace') as fin:
+        for lineno, line in enumerate(fin):
+            m = regex.search(line)
+            if m is not None:
+                records.append((lineno, m.lastgroup, float(m.group(m.lastgroup))))
+    return np.array(records, dtype=RECORD)
+
+
+# Match a single line, e.g. while a log is being written. Returns (metric,
+# value) or None.
+def match(line, patterns):
+    m = _compile(patterns).search(line)
+    if m is None:
+        return None
+    return m.lastgroup, float(m.group(m.lastgroup))
+
+
+# Values of a metric, optionally only those after a given line
+def values(records, metric, after=-1):
+    sel = (records['metric'] == metric) & (records['line'] > after)
+    return records['value'][sel]
+
+
+# First value of a metric, or 'default' if the log does not report it
+def first(records, metric, default=-1):
+    v = values(records, metric)
+    if len(v) == 0:
+        return default
+    return v[0]
+
+
+# Last value of a metric, or 'default' if the log does not report it
+def last(records, metric, default=-1):
+    v = values(records, metric)
+    if len(v) == 0:
+        return default
+    return v[-1]
+
+
+# Line of the first record of a metric, or -1
+def first_line(records, metric):
+    lines = records['line'][records['metric'] == metric]
+    if len(lines) == 0:
+        return -1
+    return lines[0]
+
+
+# Print a value as an integer when it is one
+def fmt(v):
+    if np.isfinite(v) and v == int(v):
+        return str(int(v))
+    return str(v)
+
+
+# Phases of a trident load and the log message that starts each of them.
+# The encoding of the input starts with the log.
+LOAD_PHASES = [
+    ('encoding', None),
+    ('sorting', 'Starting the loading'),
+    ('tree', 'Start creating the tree...'),
+    ('tables', 'Start inserting...'),
+    ('permutations', 'Start process generating new permutation'),
+]
+
+TIMESTAMP = re.compile(r'(\d{4}-\d\d-\d\d \d\d:\d\d:\d\d)')
+
+
+# Time of a log line in seconds since the epoch, taking the time of the log
+# as UTC (the logs do not say their time zone)
+def timestamp(line):
+    m = TIMESTAMP.search(line)
+    if m is None:
+        return None
+    return datetime.strptime(m.group(1), '%Y-%m-%d %H:%M:%S').replace(tzinfo=timezone.utc).timestamp()
+
+
+# Phases of a load log as (phase, start, end) with times in seconds since
+# the epoch. Phases whose message does not appear in the log are left out.
+def load_phases(path):
+    starts = []
+    nextphase = 1
+    end = None
+    with open(path, 'rt', errors='replace') as fin:
+        for line in fin:
+            t = timestamp(line)
+            if t is None:
+                continue
+            if end is None:
+                starts.append(('encoding', t))
+            end = t
+            for i in range(nextphase, len(LOAD_PHASES)):
+                if LOAD_PHASES[i][1] in line:
+                    starts.append((LOAD_PHASES[i][0], t))
+                    nextphase = i + 1
+                    break
+    phases = []
+    for i in range(len(starts)):
+        phaseend = starts[i + 1][1] if i + 1 < len(starts) else end
+        phases.append((starts[i][0], starts[i][1], phaseend))
+    return phases
+
+
+# Columns of the STATS lines that trident writes while it loads, by position
+# of their 'label=value' field
+STATS_FIELDS = [('mem', 1), ('cpu', 2), ('diskr', 5), ('diskw', 6)]
+
+STATS_RECORD = np.dtype([('time', 'f8')] + [(name, 'f8') for name, pos in STATS_FIELDS])
+
+# Number of STATS lines converted at once
+STATS_CHUNK = 1 << 16
+
+
+def _stats_chunk(lines):
+    out = np.empty(len(lines), dtype=STATS_RECORD)
+    out['time'] = np.array([TIMESTAMP.search(l).group(1).replace(' ', 'T') for l in lines],
+                           dtype='datetime64[s]').astype('f8')
+    fields = [l.rstrip('\n').split('\t') for l in lines]
+    for name, pos in STATS_FIELDS:
+        out[name] = np.array([f[pos][f[pos].find('=') + 1:] for f in fields]).astype('f8')
+    return out
+
+
+# STATS records of a load log as an array of dtype STATS_RECORD, with the
+# time in seconds since the epoch. The log is streamed and the records are
+# converted by chunks, so that only the STATS lines of one chunk are in
+# memory as text.
+def load_stats(path):
+    chunks = []
+    lines = []
+    with open(path, 'rt', errors='replace') as fin:
+        for line in fin:
+            if 'STATS' in line and TIMESTAMP.search(line) is not None and line.count('\t') >= 6:
+                lines.append(line)
+                if len(lines) == STATS_CHUNK:
+                    chunks.append(_stats_chunk(lines))
+                    lines = []
+    if len(lines) > 0:
+        chunks.append(_stats_chunk(lines))
+    if len(chunks) == 0:
+        return np.empty(0, dtype=STATS_RECORD)
+    return np.concatenate(chunks)
+
+
+# Reduce a series to at most 2 * buckets points, keeping the minimum and the
+# maximum of every bucket (in their order), so that peaks are not lost
+def minmax_downsample(x, y, buckets):
+    x = np.asarray(x)
+    y = np.asarray(y)
+    if len(x) <= 2 * buckets:
+        return x, y
+    edges = np.linspace(0, len(x), buckets + 1).astype(int)
+    starts = edges[:-1]
+    lows = starts + np.array([np.argmin(y[s:e]) for s, e in zip(starts, edges[1:])])
+    highs = starts + np.array([np.argmax(y[s:e]) for s, e in zip(starts, edges[1:])])
+    idx = np.unique(np.concatenate([lows, highs]))
+    return x[idx], y[idx]
@@ -0,0 +1,291 @@
+import random
+import configparser
+
+# Experiment matrix: the experiments that only differ in their datasets,
+# engines, load options and query suites are declared in an INI file
+# (experiments.matrix) instead of being written as test functions. It has
+# six kinds of sections:
+#
+#   [dataset <name>]  the input of the trident load and of the rdf3x load
+#                     (relative to 'input' of the config) and the query
+#                     suite (relative to 'queries')
+#   [queries <N>]     test N: every dataset x engine, on databases loaded
+#                     with the 'load' options, queried with the 'query'
+#                     options
+#   [updates <N>]     test N: a database loaded from 'base', which
+#                     receives a schedule of additions, removals and
+#                     merges, and is queried after every step of it
+#   [throughput <N>]  test N: like a queries test, but every suite is run by
+#                     a sweep of concurrent 'clients' ('auto' for 1, 2, 4
+#                     ... up to the cpus), each for 'warmup' and 'duration'
+#                     seconds, optionally pinned to cpus with 'pin'
+#                     (taskset or numactl, see throughput.py)
+#   [templates <N>]   test N: the queries of some 'suites'
+#                     ('<dataset>:<suite>') as templates, each run with
+#                     'instances' bindings drawn from the database of the
+#                     dataset ('draw': uniform, zipf with exponent 'zipf',
+#                     or selectivity; see templates.py)
+#   [replay <N>]      test N: the 'queries' of a dataset replayed as an
+#                     open-loop workload at every rate of 'rates' (queries
+#                     per second) for 'duration' seconds, with Poisson
+#                     arrivals or those of a 'trace', and at most
+#                     'concurrency' queries at a time (see replay.py)
+#
+# The schedule of an updates test is, by default, every part of 'add'
+# added one at a time, a merge, every part of 'rm' removed one at a time
+# and a merge. It can be given instead as 'schedule', operations separated
+# by ';' ('add <parts>', 'rm <parts>' or 'merge'), or as a random mix of
+# 'mix' updates, of which a fraction 'add_ratio' are additions, each of
+# 'batch' parts ('min-max'), with a merge every 'merge_every' updates (0
+# for none before the final merge).
+#
+# With 'clients' > 0, the queries are not run between the steps: that many
+# clients loop over the queries during the whole schedule, and for 'idle'
+# seconds before and after it, and their latency and throughput are
+# reported per step and per 'bucket' seconds (see mixedload.py).
+#
+# A test with 'in_all = no' runs only when it is asked for, not as part of
+# 'all' (e.g. the long workloads of the replay tests).
+#
+# The values can refer to the options of the config that are passed as
+# defaults, e.g. %(extraopts)s.
+#
+# The expansion of the query tests is deduplicated: a database that several
+# tests load with the same options is built once, and a query suite that
+# several tests run on the same database with the same options runs once.
+
+ENGINES = ['trident-native', 'trident', 'rdf3x']
+
+# Name of the results of a dataset for each engine
+SUFFIXES = {'trident-native': '-native', 'trident': '', 'rdf3x': '-rdf3x'}
+
+
+def _list(value):
+    return value.split()
+
+
+# A database to build: kind 'trident' or 'rdf3x', the dataset, the input
+# (relative to the input dir), the load options, and the paths (relative to
+# the output dir) where the tests expect it
+class Build:
+    def __init__(self, kind, dataset, input, opts):
+        self.kind = kind
+        self.dataset = dataset
+        self.input = input
+        self.opts = opts
+        self.paths = []
+
+    def key(self):
+        return (self.kind, self.input, ' '.join(self.opts.split()))
+
+
+# A query suite to run: the engine, the dataset, the build of the database
+# and where the test links it (relative to the output dir), the queries
+# (relative to the queries dir), the options and where the results go
+# (relative to the results dir of the test)
+class QueryRun:
+    def __init__(self, engine, dataset, build, db, queries, opts, output):
+        self.engine = engine
+        self.dataset = dataset
+        self.build = build
+        self.db = db
+        self.queries = queries
+        self.opts = opts
+        self.output = output
+
+    def key(self):
+        return (self.engine, self.build.key(), self.queries, ' '.join(self.opts.split()))
+
+
+class Matrix:
+    def __init__(self, path, defaults):
+        parser = configparser.ConfigParser(defaults=defaults)
+        if len(parser.read(path)) == 0:
+            raise Exception('Cannot read the experiment matrix ' + path)
+        self.datasets = {}
+        self.queries = {}
+        self.updates = {}
+        self.replays = {}
+        self.throughputs = {}
+        self.templates = {}
+        # Tests that are not part of 'all'
+        self.optional = set()
+        for section in parser.sections():
+            tokens = section.split()
+            if len(tokens) != 2:
+                raise Exception('Unknown section [' + section + '] in ' + path)
+            kind, name = tokens
+            s = parser[section]
+            if kind != 'dataset' and not s.getboolean('in_all', True):
+                self.optional.add(name)
+            if kind == 'dataset':
+                self.datasets[name] = {'input': s.get('input', name), 'rdf3x': s.get('rdf3x', ''),
+                                       'queries': s.get('queries', name)}
+            elif kind == 'queries':
+                engines = _list(s.get('engines', ' '.join(ENGINES)))
+                for e in engines:
+                    if e not in ENGINES:
+                        raise Exception('Unknown engine ' + e + ' in [' + section + ']')
+                self.queries[name] = {'datasets': _list(s['datasets']), 'engines': engines,
+                                      'load': s.get('load', ''), 'query': s.get('query', ''),
+                                      'check': s.getboolean('check', False)}
+            elif kind == 'updates':
+                self.updates[name] = {'base': s['base'], 'db': s['db'], 'queries': s['queries'],
+                                      'first': s['first'], 'load': s.get('load', ''), 'query': s.get('query', ''),
+                                      'add_input': s['add_input'], 'add': _list(s.get('add', '')),
+                                      'rm_input': s['rm_input'], 'rm': _list(s.get('rm', '')),
+                                      'schedule': s.get('schedule', ''), 'mix': s.getint('mix', 0),
+                                      'add_ratio': s.getfloat('add_ratio', 0.5), 'batch': s.get('batch', '1'),
+                                      'merge_every': s.getint('merge_every', 0), 'seed': s.getint('seed', 0),
+                                      'policies': s.get('policies', ''),
+                                      'policy_updates': s.getint('policy_updates', 0),
+                                      'policy_queries': s.getfloat('policy_queries', 1),
+                                      'clients': s.getint('clients', 0), 'idle': s.getfloat('idle', 30),
+                                      'bucket': s.getfloat('bucket', 10)}
+            elif kind == 'throughput':
+                engines = _list(s.get('engines', ' '.join(ENGINES)))
+                for e in engines:
+                    if e not in ENGINES:
+                        raise Exception('Unknown engine ' + e + ' in [' + section + ']')
+                pin = s.get('pin', 'none')
+                if pin not in ['none', 'taskset', 'numactl']:
+                    raise Exception('Unknown pin ' + pin + ' in [' + section + ']')
+                self.throughputs[name] = {'datasets': _list(s['datasets']), 'engines': engines,
+                                          'load': s.get('load', ''), 'query': s.get('query', ''),
+                                          'clients': s.get('clients', 'auto'), 'duration': s.getfloat('duration', 60),
+                                          'warmup': s.getfloat('warmup', 10), 'pin': pin}
+            elif kind == 'templates':
+                how = s.get('draw', 'uniform')
+                if how not in ['uniform', 'zipf', 'selectivity']:
+                    raise Exception('Unknown draw ' + how + ' in [' + section + ']')
+                suites = []
+                for pair in _list(s['suites']):
+                    if ':' not in pair:
+                        raise Exception('Suite ' + pair + ' in [' + section + '] is not <dataset>:<suite>')
+                    suites.append(tuple(pair.split(':', 1)))
+                self.templates[name] = {'suites': suites, 'load': s.get('load', ''), 'query': s.get('query', ''),
+                                        'instances': s.getint('instances', 1000), 'draw': how,
+                                        'zipf': s.getfloat('zipf', 1.0), 'seed': s.getint('seed', 0)}
+            elif kind == 'replay':
+                arrival = s.get('arrival', 'poisson')
+                if arrival not in ['poisson', 'trace']:
+                    raise Exception('Unknown arrival ' + arrival + ' in [' + section + ']')
+                self.replays[name] = {'dataset': s['dataset'], 'queries': s.get('queries', ''),
+                                      'load': s.get('load', ''), 'query': s.get('query', ''),
+                                      'rates': [float(r) for r in _list(s['rates'])],
+                                      'duration': s.getfloat('duration', 60), 'warmup': s.getfloat('warmup', 0),
+                                      'concurrency': s.getint('concurrency', 4), 'arrival': arrival,
+                                      'trace': s.get('trace', ''), 'seed': s.getint('seed', 0)}
+            else:
+                raise Exception('Unknown section [' + section + '] in ' + path)
+        for name, t in self.templates.items():
+            for d, suite in t['suites']:
+                if d not in self.datasets:
+                    raise Exception('Test ' + name + ' instantiates templates on the unknown dataset ' + d)
+        for name, r in self.replays.items():
+            if r['dataset'] not in self.datasets:
+                raise Exception('Test ' + name + ' replays queries on the unknown dataset ' + r['dataset'])
+        for name, q in list(self.queries.items()) + list(self.throughputs.items()):
+            for d in q['datasets']:
+                if d not in self.datasets:
+                    raise Exception('Test ' + name + ' queries the unknown dataset ' + d)
+
+    # Names of the tests that the matrix declares
+    def tests(self):
+        return sorted(list(self.queries.keys()) + list(self.updates.keys()) + list(self.replays.keys()) +
+                      list(self.throughputs.keys()) + list(self.templates.keys()), key=lambda t: (len(t), t))
+
+    # The databases needed by some query, throughput, templates and replay
+    # tests, each once. Returns the builds and, for every test, its query
+    # runs in the order in which they run (for a replay, the run of its
+    # queries on its database; for templates, a run per suite).
+    def expand(self, tests):
+        builds = {}
+        runs = {}
+
+        def build(kind, dataset, input, opts, path):
+            b = Build(kind, dataset, input, opts)
+            if b.key() not in builds:
+                builds[b.key()] = b
+            b = builds[b.key()]
+            if path not in b.paths:
+                b.paths.append(path)
+            return b, path
+
+        for test in tests:
+            if test in self.templates:
+                t = self.templates[test]
+                runs[test] = []
+                for d, suite in t['suites']:
+                    b, path = build('trident', d, self.datasets[d]['input'], t['load'], 'test' + test + '/db/' + d)
+                    runs[test].append(QueryRun('trident', d, b, path, suite, t['query'], suite))
+                continue
+            if test in self.replays:
+                r = self.replays[test]
+                dataset = self.datasets[r['dataset']]
+                b, path = build('trident', r['dataset'], dataset['input'], r['load'],
+                                'test' + test + '/db/' + r['dataset'])
+                runs[test] = [QueryRun('trident', r['dataset'], b, path, r['queries'] or dataset['queries'],
+                                       r['query'], r['dataset'])]
+                continue
+            if test not in self.queries and test not in self.throughputs:
+                continue
+            q = self.queries.get(test) or self.throughputs[test]
+            runs[test] = []
+            for d in q['datasets']:
+                dataset = self.datasets[d]
+                for engine in q['engines']:
+                    if engine == 'rdf3x':
+                        if dataset['rdf3x'] == '':
+                            continue
+                        b, path = build('rdf3x', d, dataset['rdf3x'], '', 'test' + test + '/db/' + d + '_rdf3x')
+                    else:
+                        b, path = build('trident', d, dataset['input'], q['load'], 'test' + test + '/db/' + d)
+                    runs[test].append(QueryRun(engine, d, b, path, dataset['queries'], q['query'],
+                                               d + SUFFIXES[engine]))
+        return list(builds.values()), runs
+
+    # Schedule of an updates test: a list of (operation, parts, name of the
+    # results of the queries after it, label of its logs), where the
+    # operation is 'add', 'rm' or 'merge'
+    def schedule(self, name):
+        u = self.updates[name]
+        steps = []
+        if u['schedule'] != '':
+            for op in [o.split() for o in u['schedule'].split(';') if o.strip() != '']:
+                if op[0] not in ['add', 'rm', 'merge'] or (op[0] == 'merge') != (len(op) == 1):
+                    raise Exception('Wrong operation ' + ' '.join(op) + ' in the schedule of test ' + name)
+                label = 's' + str(len(steps) + 1)
+                steps.append((op[0], op[1:], 'step-%02d-%s' % (len(steps) + 1, op[0]), label))
+            return steps
+        if u['mix'] > 0:
+            rng = random.Random(u['seed'])
+            pools = {'add': list(u['add']), 'rm': list(u['rm'])}
+            rng.shuffle(pools['add'])
+            rng.shuffle(pools['rm'])
+            bounds = [int(b) for b in u['batch'].split('-')]
+            pending = 0
+            for i in range(u['mix']):
+                op = 'add' if rng.random() < u['add_ratio'] else 'rm'
+                if len(pools[op]) == 0:
+                    op = 'rm' if op == 'add' else 'add'
+                if len(pools[op]) == 0:
+                    break
+                k = rng.randint(bounds[0], bounds[-1])
+                parts = pools[op][:k]
+                pools[op] = pools[op][k:]
+                steps.append((op, parts, 'step-%02d-%s' % (len(steps) + 1, op), 's' + str(len(steps) + 1)))
+                pending += 1
+                if u['merge_every'] > 0 and pending == u['merge_every']:
+                    steps.append(('merge', [], 'step-%02d-merge' % (len(steps) + 1), 's' + str(len(steps) + 1)))
+                    pending = 0
+            if pending > 0:
+                steps.append(('merge', [], 'step-%02d-merge' % (len(steps) + 1), 's' + str(len(steps) + 1)))
+            return steps
+        for count, part in enumerate(u['add'], 1):
+            steps.append(('add', [part], 'parts-added-' + str(count), part))
+        steps.append(('merge', [], 'parts-merged-after-add', 'add'))
+        for count, part in enumerate(u['rm'], 1):
+            steps.append(('rm', [part], 'parts-removed-' + str(count), part))
+        steps.append(('merge', [], 'parts-merged-after-rm', 'db'))
+        return steps
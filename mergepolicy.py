@@ -0,0 +1,202 @@
+import os
+import sys
+import math
+import argparse
+import statistics
+
+import logparse
+import repstats
+
+# Evaluation of the policies that decide when to merge the updates of a
+# trident database. An updates test writes a trace (<results>/updates) with,
+# after every step of its schedule, the number of updates pending in _diff,
+# the size of _diff, the time of the step and the latency of a round of the
+# queries. From the trace a model is fitted: the latency of a round and the
+# size of _diff grow linearly with the pending updates, a merge costs a
+# fixed time plus a time per pending update, and an update costs its mean
+# time. Every policy is then simulated on a workload of some updates with
+# some rounds of queries between two updates, and its total cost (updates,
+# merges and queries, in seconds) is reported.
+#
+# Policies: 'never', 'every:N' (merge after N updates), 'latency:X' (merge
+# when the latency of a round is more than X times higher than when
+# merged) and 'delta:MB' (merge when _diff is larger than MB).
+
+TRACE = 'updates'
+COLUMNS = ['STEP', 'OP', 'PARTS', 'PENDING', 'DIFF_MB', 'OP_S', 'LATENCY_MS']
+
+
+# Latency (ms) of a round of queries: the sum over the queries of the median
+# of their warm runs (the first run of a log is the results pass). NaN if a
+# query has no runs, e.g. because the watchdog killed it.
+def round_latency(output):
+    total = 0
+    n = 0
+    for f in sorted(os.listdir(output)):
+        if not f.startswith('logs_') or f.endswith('_results') or f.endswith('.resources'):
+            continue
+        runtimes = list(logparse.values(logparse.parse(os.path.join(output, f), logparse.TRIDENT), 'total'))[1:]
+        if len(runtimes) == 0:
+            return float('nan')
+        total += statistics.median(repstats.warm(runtimes))
+        n += 1
+    if n == 0:
+        return float('nan')
+    return total
+
+
+def load_trace(path):
+    rows = []
+    if not os.path.exists(path):
+        return rows
+    for line in open(path, 'rt'):
+        tokens = line.rstrip('\n').split('\t')
+        if tokens[0] == 'STEP':
+            continue
+        rows.append({'step': int(tokens[0]), 'op': tokens[1], 'parts': tokens[2], 'pending': int(tokens[3]),
+                     'diff_mb': float(tokens[4]), 'op_s': float(tokens[5]), 'latency_ms': float(tokens[6])})
+    return rows
+
+
+def save_trace(path, rows):
+    with open(path + '.tmp', 'wt') as fout:
+        fout.write('\t'.join(COLUMNS) + '\n')
+        for r in sorted(rows, key=lambda r: r['step']):
+            fout.write('%d\t%s\t%s\t%d\t%.3f\t%.3f\t%.3f\n' % (r['step'], r['op'], r['parts'], r['pending'],
+                                                              r['diff_mb'], r['op_s'], r['latency_ms']))
+    os.replace(path + '.tmp', path)
+
+
+# Least squares line a + b * x. With a single distinct x the line is flat.
+def _fit(xs, ys):
+    if len(xs) == 0:
+        return float('nan'), 0.0
+    mx = statistics.mean(xs)
+    my = statistics.mean(ys)
+    sxx = sum([(x - mx) ** 2 for x in xs])
+    if sxx == 0:
+        return my, 0.0
+    b = sum([(x - mx) * (y - my) for x, y in zip(xs, ys)]) / sxx
+    return my - b * mx, b
+
+
+class Model:
+    def __init__(self, rows):
+        measured = [r for r in rows if r['latency_ms'] == r['latency_ms']]
+        self.latency = _fit([r['pending'] for r in measured], [r['latency_ms'] for r in measured])
+        # Size of _diff per pending update
+        pending = [r for r in rows if r['pending'] > 0]
+        self.delta_mb = 0.0
+        if len(pending) > 0:
+            self.delta_mb = sum([r['diff_mb'] for r in pending]) / sum([r['pending'] for r in pending])
+        # A merge applies the updates pending before it
+        merges = []
+        for prev, r in zip(rows, rows[1:]):
+            if r['op'] == 'merge':
+                merges.append((prev['pending'], r['op_s']))
+        self.merge = _fit([m[0] for m in merges], [m[1] for m in merges])
+        updates = [r['op_s'] for r in rows if r['op'] in ['add', 'rm']]
+        self.update_s = statistics.mean(updates) if len(updates) > 0 else 0.0
+
+    def latency_ms(self, pending):
+        return max(self.latency[0] + self.latency[1] * pending, 0)
+
+    def merge_s(self, pending):
+        return max(self.merge[0] + self.merge[1] * pending, 0)
+
+    def diff_mb(self, pending):
+        return self.delta_mb * pending
+
+
+def parse_policy(policy):
+    tokens = policy.split(':')
+    if tokens[0] == 'never' and len(tokens) == 1:
+        return tokens[0], 0
+    if tokens[0] in ['every', 'latency', 'delta'] and len(tokens) == 2:
+        return tokens[0], float(tokens[1])
+    raise ValueError('Unknown merge policy ' + policy)
+
+
+def _merge_now(model, kind, value, pending):
+    if kind == 'every':
+        return pending >= value
+    if kind == 'latency':
+        return model.latency_ms(pending) > (1 + value) * model.latency_ms(0)
+    if kind == 'delta':
+        return model.diff_mb(pending) > value
+    return False
+
+
+# Cost of a policy on 'updates' updates, with 'queries' rounds of queries
+# after each of them. Returns the number of merges and the seconds spent in
+# updates, merges and queries.
+def simulate(model, policy, updates, queries):
+    kind, value = parse_policy(policy)
+    pending = 0
+    merges = 0
+    merge_s = 0.0
+    query_s = 0.0
+    for i in range(updates):
+        pending += 1
+        if _merge_now(model, kind, value, pending):
+            merges += 1
+            merge_s += model.merge_s(pending)
+            pending = 0
+        query_s += queries * model.latency_ms(pending) / 1000
+    return merges, updates * model.update_s, merge_s, query_s
+
+
+# Policies worth comparing for a model
+def default_policies(model):
+    policies = ['never'] + ['every:%d' % n for n in [1, 2, 5, 10, 20, 50]]
+    policies += ['latency:%g' % x for x in [0.1, 0.25, 0.5, 1]]
+    if model.delta_mb > 0:
+        policies += ['delta:%g' % float('%.2g' % (model.delta_mb * n)) for n in [2, 5, 10, 20]]
+    return policies
+
+
+# Rows of the report, the cheapest policy first
+def evaluate(rows, policies=None, updates=0, queries=1):
+    model = Model(rows)
+    if updates <= 0:
+        updates = max(len([r for r in rows if r['op'] in ['add', 'rm']]), 1)
+    if policies is None or len(policies) == 0:
+        policies = default_policies(model)
+    report = []
+    for policy in policies:
+        merges, update_s, merge_s, query_s = simulate(model, policy, updates, queries)
+        report.append([policy, merges, update_s, merge_s, query_s, update_s + merge_s + query_s])
+    report.sort(key=lambda r: (r[5] if r[5] == r[5] else math.inf))
+    return model, report
+
+
+def print_report(model, report, out=sys.stdout):
+    out.write('# latency_ms = %.3f + %.3f * pending, merge_s = %.3f + %.3f * pending, update_s = %.3f, '
+              'diff_mb = %.3f * pending\n' % (model.latency[0], model.latency[1], model.merge[0], model.merge[1],
+                                              model.update_s, model.delta_mb))
+    out.write('POLICY\tMERGES\tUPDATE_S\tMERGE_S\tQUERY_S\tTOTAL_S\n')
+    for r in report:
+        out.write('%s\t%d\t%.1f\t%.1f\t%.1f\t%.1f\n' % tuple(r))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Simulate merge policies on the trace of an updates test')
+    parser.add_argument('trace', help='trace written by the test (<results>/' + TRACE + ') or its results directory')
+    parser.add_argument('--policies', help='comma separated policies (default: a range of every, latency and delta)')
+    parser.add_argument('--updates', type=int, default=0,
+                        help='updates of the simulated workload (default: as many as in the trace)')
+    parser.add_argument('--queries', type=float, default=1,
+                        help='rounds of queries after every update (default 1)')
+    args = parser.parse_args()
+    path = args.trace
+    if os.path.isdir(path):
+        path = os.path.join(path, TRACE)
+    rows = load_trace(path)
+    if len(rows) == 0:
+        print('No trace in ' + path)
+        sys.exit(1)
+    policies = None
+    if args.policies is not None:
+        policies = args.policies.split(',')
+    model, report = evaluate(rows, policies, args.updates, args.queries)
+    print_report(model, report)
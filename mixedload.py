@@ -0,0 +1,227 @@
+import os
+import sys
+import time
+import argparse
+import threading
+import subprocess
+
+import logparse
+import repstats
+import watchdog
+
+# Mixed workload: a pool of clients loops over the queries of a suite while
+# the database is updated. Every client runs one query at a time (a closed
+# loop), starting from a different query of the suite, until it is stopped.
+# The run is divided into phases (e.g. idle, the add of some part, a merge),
+# and every query is assigned to the phase in which it started.
+#
+# Files written in the results dir of a test:
+#   mixed_queries   one row per query: client, query, start and end (seconds
+#                   since the start of the run), latency seen by the client
+#                   (ms), runtime reported by trident (ms, NaN if none),
+#                   return code and phase
+#   mixed_phases    one row per phase: name, start and end
+#   mixed_summary   per phase: duration, queries, throughput, latency
+#                   percentiles and failed queries
+#   mixed_timeline  the same per interval of 'bucket' seconds
+
+QUERIES = 'mixed_queries'
+PHASES = 'mixed_phases'
+SUMMARY = 'mixed_summary'
+TIMELINE = 'mixed_timeline'
+
+QUERY_COLUMNS = ['CLIENT', 'QUERY', 'START', 'END', 'LATENCY_MS', 'EXEC_MS', 'RET', 'PHASE']
+PHASE_COLUMNS = ['PHASE', 'START', 'END']
+PERCENTILES = [0.5, 0.95, 0.99]
+
+
+# Run a query once, under a watchdog. 'started' is called with the
+# watchdog once the query runs, so that it can be killed. Returns the start
+# and end times, the runtime reported by the engine (ms, NaN if none; the
+# 'total' metric of 'patterns') and the return code.
+def execute(args, timeout=0, rsslimit=0, started=None, patterns=logparse.TRIDENT):
+    start = time.time()
+    process = subprocess.Popen(args, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True,
+                               start_new_session=True)
+    wd = watchdog.Watchdog(process, timeout, rsslimit)
+    if started is not None:
+        started(wd)
+    execms = float('nan')
+    for line in process.stderr:
+        m = logparse.match(line, patterns)
+        if m is not None and m[0] == 'total':
+            execms = m[1]
+    process.wait()
+    ret = wd.stop()
+    return start, time.time(), execms, ret
+
+
+class Clients:
+    # cmd(query, client) returns the command (a list) that runs a query once
+    def __init__(self, cmd, queries, clients, timeout=0, rsslimit=0, t0=None, patterns=logparse.TRIDENT):
+        self.cmd = cmd
+        self.queries = queries
+        self.clients = clients
+        self.timeout = timeout
+        self.rsslimit = rsslimit
+        self.patterns = patterns
+        self.t0 = t0 if t0 is not None else time.time()
+        self.rows = []
+        self.phases = []
+        self.current = None
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.running = {}
+        self.threads = []
+
+    def _client(self, client):
+        i = client
+        while not self.stopped.is_set():
+            query = self.queries[i % len(self.queries)]
+            i += 1
+            with self.lock:
+                phase = self.current
+
+            def started(wd):
+                with self.lock:
+                    self.running[client] = wd
+            start, end, execms, ret = execute(self.cmd(query, client), self.timeout, self.rsslimit, started,
+                                              self.patterns)
+            with self.lock:
+                del self.running[client]
+                # A query killed because the run stopped is not a measure
+                if self.stopped.is_set() and ret != 0:
+                    return
+                self.rows.append({'client': client, 'query': os.path.basename(query), 'start': start - self.t0,
+                                  'end': end - self.t0, 'latency_ms': (end - start) * 1000, 'exec_ms': execms,
+                                  'ret': ret, 'phase': phase})
+
+    # Start the clients in a first phase
+    def start(self, phase):
+        self.phase(phase)
+        for client in range(self.clients):
+            t = threading.Thread(target=self._client, args=(client,), daemon=True)
+            t.start()
+            self.threads.append(t)
+
+    # End the current phase and start another one
+    def phase(self, name):
+        now = time.time() - self.t0
+        with self.lock:
+            if self.current is not None:
+                self.phases[-1][2] = now
+            self.current = name
+            self.phases.append([name, now, now])
+
+    # Stop the clients, killing the queries that are running
+    def stop(self):
+        self.stopped.set()
+        now = time.time() - self.t0
+        with self.lock:
+            if len(self.phases) > 0:
+                self.phases[-1][2] = now
+            for wd in self.running.values():
+                wd.kill()
+        for t in self.threads:
+            t.join()
+        self.threads = []
+
+
+def save(resultsdir, rows, phases):
+    with open(os.path.join(resultsdir, QUERIES) + '.tmp', 'wt') as fout:
+        fout.write('\t'.join(QUERY_COLUMNS) + '\n')
+        for r in sorted(rows, key=lambda r: r['start']):
+            fout.write('%d\t%s\t%.3f\t%.3f\t%.3f\t%.3f\t%d\t%s\n' % (r['client'], r['query'], r['start'], r['end'],
+                                                                 r['latency_ms'], r['exec_ms'], r['ret'],
+                                                                 r['phase']))
+    os.replace(os.path.join(resultsdir, QUERIES) + '.tmp', os.path.join(resultsdir, QUERIES))
+    with open(os.path.join(resultsdir, PHASES) + '.tmp', 'wt') as fout:
+        fout.write('\t'.join(PHASE_COLUMNS) + '\n')
+        for p in phases:
+            fout.write('%s\t%.3f\t%.3f\n' % tuple(p))
+    os.replace(os.path.join(resultsdir, PHASES) + '.tmp', os.path.join(resultsdir, PHASES))
+
+
+def load(resultsdir):
+    rows = []
+    phases = []
+    path = os.path.join(resultsdir, QUERIES)
+    if os.path.exists(path):
+        for line in open(path, 'rt'):
+            tokens = line.rstrip('\n').split('\t')
+            if tokens[0] == 'CLIENT':
+                continue
+            rows.append({'client': int(tokens[0]), 'query': tokens[1], 'start': float(tokens[2]),
+                         'end': float(tokens[3]), 'latency_ms': float(tokens[4]), 'exec_ms': float(tokens[5]),
+                         'ret': int(tokens[6]), 'phase': tokens[7]})
+    path = os.path.join(resultsdir, PHASES)
+    if os.path.exists(path):
+        for line in open(path, 'rt'):
+            tokens = line.rstrip('\n').split('\t')
+            if tokens[0] == 'PHASE':
+                continue
+            phases.append([tokens[0], float(tokens[1]), float(tokens[2])])
+    return rows, phases
+
+
+# Queries, throughput (completed queries per second), latency percentiles
+# and failed queries of the rows of an interval of 'seconds'
+def _stats(rows, seconds):
+    ok = [r['latency_ms'] for r in rows if r['ret'] == 0]
+    stats = [len(rows), len(ok) / seconds if seconds > 0 else float('nan')]
+    for p in PERCENTILES:
+        stats.append(repstats.percentile(ok, p) if len(ok) > 0 else float('nan'))
+    stats.append(len(rows) - len(ok))
+    return stats
+
+
+def _header(first):
+    return '\t'.join(first + ['QUERIES', 'QPS'] + ['P%g_MS' % (p * 100) for p in PERCENTILES] + ['FAILED'])
+
+
+def _fmt(stats):
+    return '\t'.join(['%d' % stats[0], '%.2f' % stats[1]] + ['%.1f' % v for v in stats[2:-1]] + ['%d' % stats[-1]])
+
+
+# Per phase: its duration, which for an update is its duration under the
+# load of the clients, and the statistics of the queries that started in it
+def summary(rows, phases, out):
+    out.write(_header(['PHASE', 'SECONDS']) + '\n')
+    for name, start, end in phases:
+        out.write(name + '\t%.1f\t' % (end - start) + _fmt(_stats([r for r in rows if r['phase'] == name],
+                                                                   end - start)) + '\n')
+
+
+# Per interval of 'bucket' seconds, by the end of the queries, with the phase
+# in which the interval starts
+def timeline(rows, phases, bucket, out):
+    out.write(_header(['TIME', 'PHASE']) + '\n')
+    if len(phases) == 0:
+        return
+    t = phases[0][1]
+    while t < phases[-1][2]:
+        phase = [p[0] for p in phases if p[1] <= t][-1]
+        seconds = min(bucket, phases[-1][2] - t)
+        out.write('%.0f\t%s\t' % (t, phase) + _fmt(_stats([r for r in rows if t <= r['end'] < t + bucket],
+                                                          seconds)) + '\n')
+        t += bucket
+
+
+def report(resultsdir, bucket):
+    rows, phases = load(resultsdir)
+    with open(os.path.join(resultsdir, SUMMARY), 'wt') as fout:
+        summary(rows, phases, fout)
+    with open(os.path.join(resultsdir, TIMELINE), 'wt') as fout:
+        timeline(rows, phases, bucket, fout)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Summarize the queries of a mixed read/write test')
+    parser.add_argument('results', help='results dir of the test')
+    parser.add_argument('--bucket', type=float, default=10, help='seconds of an interval of the timeline (default 10)')
+    args = parser.parse_args()
+    if not os.path.exists(os.path.join(args.results, QUERIES)):
+        print('No ' + QUERIES + ' in ' + args.results)
+        sys.exit(1)
+    report(args.results, args.bucket)
+    print(open(os.path.join(args.results, SUMMARY), 'rt').read())
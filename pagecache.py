@@ -0,0 +1,190 @@
+import os
+import sys
+import mmap
+import ctypes
+import ctypes.util
+import argparse
+
+# Control of the page cache for the files of a database, so that the cold
+# and warm runs of a query can be reproduced on any Linux machine without
+# root: instead of dropping the whole page cache (drop_caches), only the
+# pages of the files of the database are evicted, with
+# posix_fadvise(POSIX_FADV_DONTNEED), or read in advance (pre-warm). The
+# residency of the files (the fraction of their pages in the page cache) is
+# measured with mincore(2).
+#
+# Pages that are dirty or mapped by a running process cannot be evicted, so
+# the files are synced first, and the residency after an eviction tells
+# whether it worked.
+
+# Line written to the log of a query with the residency of the database
+# before a run (see logparse.CACHE)
+PREFIX = 'CACHE: resident '
+
+CHUNK = 1 << 20
+
+# mincore sets the lowest bit of the byte of a page that is resident
+_LOWBIT = bytes([i & 1 for i in range(256)])
+
+_libc = None
+
+
+def _load_libc():
+    global _libc
+    if _libc is None:
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        libc.mmap.restype = ctypes.c_void_p
+        libc.mmap.argtypes = [ctypes.c_void_p, ctypes.c_size_t, ctypes.c_int, ctypes.c_int, ctypes.c_int,
+                              ctypes.c_long]
+        libc.munmap.argtypes = [ctypes.c_void_p, ctypes.c_size_t]
+        libc.mincore.argtypes = [ctypes.c_void_p, ctypes.c_size_t, ctypes.c_void_p]
+        _libc = libc
+    return _libc
+
+
+# The regular files of a path (a file or a directory, recursively)
+def files(path):
+    if os.path.isfile(path):
+        return [path]
+    result = []
+    for root, dirs, names in os.walk(path):
+        dirs.sort()
+        for name in sorted(names):
+            f = os.path.join(root, name)
+            if os.path.isfile(f) and not os.path.islink(f):
+                result.append(f)
+    return result
+
+
+# Evict the pages of the files of some paths from the page cache
+def evict(paths):
+    for path in paths:
+        for f in files(path):
+            try:
+                fd = os.open(f, os.O_RDONLY)
+            except OSError:
+                continue
+            try:
+                os.fdatasync(fd)
+                os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+            except OSError:
+                pass
+            finally:
+                os.close(fd)
+
+
+# Read the files of some paths sequentially, so that they are in the page
+# cache (as far as they fit) before a warm run
+def prewarm(paths):
+    for path in paths:
+        for f in files(path):
+            try:
+                fd = os.open(f, os.O_RDONLY)
+            except OSError:
+                continue
+            try:
+                os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_SEQUENTIAL)
+                os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_WILLNEED)
+                while len(os.read(fd, CHUNK)) == CHUNK:
+                    pass
+            finally:
+                os.close(fd)
+
+
+# Residency of the pages of a file: a byte per page, 1 if it is in the
+# page cache
+def pages(path):
+    size = os.path.getsize(path)
+    page = mmap.PAGESIZE
+    if size == 0:
+        return b''
+    n = (size + page - 1) // page
+    libc = _load_libc()
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        addr = libc.mmap(None, size, mmap.PROT_READ, mmap.MAP_SHARED, fd, 0)
+        if addr is None or addr == ctypes.c_void_p(-1).value:
+            raise OSError(ctypes.get_errno(), 'mmap failed for ' + path)
+        try:
+            vec = (ctypes.c_ubyte * n)()
+            if libc.mincore(addr, size, vec) != 0:
+                raise OSError(ctypes.get_errno(), 'mincore failed for ' + path)
+        finally:
+            libc.munmap(addr, size)
+    finally:
+        os.close(fd)
+    return bytes(vec).translate(_LOWBIT)
+
+
+# Pages of a file in the page cache, and pages of the file
+def file_residency(path):
+    vec = pages(path)
+    return vec.count(1), len(vec)
+
+
+# Residency of the pages of every file of some paths, by path of the file
+def snapshot(paths):
+    snap = {}
+    for path in paths:
+        for f in files(path):
+            try:
+                snap[f] = pages(f)
+            except OSError:
+                continue
+    return snap
+
+
+# Bytes that were brought into the page cache between two snapshots, per
+# file and region of 'region' bytes: {file: {region: bytes}}, only the
+# regions with some bytes
+def touched(before, after, region):
+    per = max(region // mmap.PAGESIZE, 1)
+    result = {}
+    for f, vec in after.items():
+        old = before.get(f, b'')
+        regions = {}
+        for r in range((len(vec) + per - 1) // per):
+            new = vec[r * per:(r + 1) * per]
+            if new.count(1) == 0:
+                continue
+            # Pages resident after and not before, a bit per page
+            bits = int.from_bytes(new, 'little') & ~int.from_bytes(old[r * per:(r + 1) * per], 'little')
+            if bits != 0:
+                regions[r] = bin(bits).count('1') * mmap.PAGESIZE
+        if len(regions) > 0:
+            result[f] = regions
+    return result
+
+
+# Bytes of the files of some paths in the page cache, and bytes of the files
+def residency(paths):
+    resident = 0
+    total = 0
+    for path in paths:
+        for f in files(path):
+            try:
+                r, n = file_residency(f)
+            except OSError:
+                continue
+            resident += r * mmap.PAGESIZE
+            total += n * mmap.PAGESIZE
+    return resident, total
+
+
+# Line for the log of a run with the residency of some paths
+def report(paths):
+    resident, total = residency(paths)
+    percent = 100.0 * resident / total if total > 0 else 0.0
+    return PREFIX + '%.1f%% of %.3f GB\n' % (percent, total / (1024 ** 3))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Evict, pre-warm or measure the pages of files in the page cache')
+    parser.add_argument('action', choices=['evict', 'prewarm', 'residency'])
+    parser.add_argument('paths', nargs='+', help='files or directories (e.g. a database)')
+    args = parser.parse_args()
+    if args.action == 'evict':
+        evict(args.paths)
+    elif args.action == 'prewarm':
+        prewarm(args.paths)
+    sys.stdout.write(report(args.paths))
@@ -0,0 +1,234 @@
+import os
+import sys
+import math
+import time
+import queue
+import argparse
+import threading
+
+import repstats
+import mixedload
+
+# Open-loop replay of a query set: the queries arrive at a given rate,
+# independently of how fast the earlier ones complete, and are run by at
+# most 'concurrency' workers; a query that arrives while all of them are
+# busy waits. Its latency is measured from its arrival, so that it includes
+# the wait, as a user would see it. The arrivals are a Poisson process
+# (exponential inter-arrival times, queries drawn at random) or follow a
+# trace: lines '<seconds> <query>', scaled to the rate.
+#
+# A sweep replays the set at several rates, and reports for every rate the
+# throughput it sustained and the latency percentiles, overall and per
+# query. The knee of the curve of the p99 latency against the offered load
+# is the rate after which the latency grows fastest (the point farthest
+# from the line between the first and the last point, both axes
+# normalized).
+#
+# Files written in the output dir of a replay:
+#   replay_<rate>   one row per query: arrival, start and end (seconds since
+#                   the start), latency (ms, from the arrival), service time
+#                   (ms, from the start), runtime reported by trident (ms),
+#                   return code
+#   replay_summary  per rate and query (and ALL): queries, failed,
+#                   throughput and latency percentiles
+#   replay_curve    per rate: offered and achieved throughput, latency
+#                   percentiles, and the knee
+
+PREFIX = 'replay_'
+SUMMARY = 'replay_summary'
+CURVE = 'replay_curve'
+
+COLUMNS = ['QUERY', 'ARRIVAL', 'START', 'END', 'LATENCY_MS', 'SERVICE_MS', 'EXEC_MS', 'RET']
+PERCENTILES = [0.5, 0.95, 0.99, 0.999]
+
+
+# Arrival times and queries of a replay at 'rate' queries per second for
+# 'duration' seconds. 'trace' is a list of (seconds, query) or None for
+# Poisson arrivals over 'queries'.
+def arrivals(rate, duration, queries, rng, trace=None):
+    result = []
+    if trace is None:
+        t = rng.expovariate(rate)
+        while t < duration:
+            result.append((t, rng.choice(queries)))
+            t += rng.expovariate(rate)
+        return result
+    if len(trace) == 0:
+        return result
+    # The trace is repeated, and its times scaled to the rate
+    span = trace[-1][0] - trace[0][0]
+    scale = 1.0
+    if span > 0 and len(trace) > 1:
+        scale = (len(trace) - 1) / span / rate
+    offset = 0.0
+    while True:
+        for seconds, query in trace:
+            t = offset + (seconds - trace[0][0]) * scale
+            if t >= duration:
+                return result
+            result.append((t, query))
+        offset = t + 1.0 / rate
+
+
+# A trace file: lines '<seconds> <query>', the queries relative to a dir
+def load_trace(path, queriesdir):
+    trace = []
+    for line in open(path, 'rt'):
+        tokens = line.split()
+        if len(tokens) < 2 or tokens[0].startswith('#'):
+            continue
+        trace.append((float(tokens[0]), os.path.join(queriesdir, tokens[1])))
+    trace.sort()
+    return trace
+
+
+# Replay some arrivals. cmd(query) returns the command (a list) that runs a
+# query once. Returns a row per query.
+def run(cmd, schedule, concurrency, timeout=0, rsslimit=0):
+    pending = queue.Queue()
+    rows = []
+    lock = threading.Lock()
+    t0 = time.time()
+
+    def worker():
+        while True:
+            item = pending.get()
+            if item is None:
+                return
+            arrival, query = item
+            start, end, execms, ret = mixedload.execute(cmd(query), timeout, rsslimit)
+            with lock:
+                rows.append({'query': os.path.basename(query), 'arrival': arrival, 'start': start - t0,
+                             'end': end - t0, 'latency_ms': (end - t0 - arrival) * 1000,
+                             'service_ms': (end - start) * 1000, 'exec_ms': execms, 'ret': ret})
+
+    workers = [threading.Thread(target=worker, daemon=True) for i in range(concurrency)]
+    for w in workers:
+        w.start()
+    for arrival, query in schedule:
+        delay = t0 + arrival - time.time()
+        if delay > 0:
+            time.sleep(delay)
+        pending.put((arrival, query))
+    for w in workers:
+        pending.put(None)
+    for w in workers:
+        w.join()
+    return rows
+
+
+def save(path, rows):
+    with open(path + '.tmp', 'wt') as fout:
+        fout.write('\t'.join(COLUMNS) + '\n')
+        for r in sorted(rows, key=lambda r: r['arrival']):
+            fout.write('%s\t%.3f\t%.3f\t%.3f\t%.3f\t%.3f\t%.3f\t%d\n' % (r['query'], r['arrival'], r['start'],
+                                                                       r['end'], r['latency_ms'], r['service_ms'],
+                                                                       r['exec_ms'], r['ret']))
+    os.replace(path + '.tmp', path)
+
+
+def load(path):
+    rows = []
+    for line in open(path, 'rt'):
+        tokens = line.rstrip('\n').split('\t')
+        if tokens[0] == 'QUERY':
+            continue
+        rows.append({'query': tokens[0], 'arrival': float(tokens[1]), 'start': float(tokens[2]),
+                     'end': float(tokens[3]), 'latency_ms': float(tokens[4]), 'service_ms': float(tokens[5]),
+                     'exec_ms': float(tokens[6]), 'ret': int(tokens[7])})
+    return rows
+
+
+# The replays of an output dir, by rate
+def find(outputdir):
+    result = {}
+    for f in os.listdir(outputdir):
+        if f.startswith(PREFIX) and f not in [SUMMARY, CURVE] and not f.endswith('.tmp'):
+            try:
+                result[float(f[len(PREFIX):])] = load(os.path.join(outputdir, f))
+            except ValueError:
+                continue
+    return result
+
+
+# Queries, failed queries and latency percentiles of the rows that arrived
+# in the window [start, end) of a replay, and the throughput it sustained:
+# the queries that completed in the window per second
+def stats(rows, start, end):
+    arrived = [r for r in rows if start <= r['arrival'] < end]
+    ok = [r['latency_ms'] for r in arrived if r['ret'] == 0]
+    completed = len([r for r in rows if r['ret'] == 0 and start <= r['end'] < end])
+    result = [len(arrived), len(arrived) - len(ok), completed / (end - start) if end > start else float('nan')]
+    for p in PERCENTILES:
+        result.append(repstats.percentile(ok, p) if len(ok) > 0 else float('nan'))
+    return result
+
+
+# Index of the knee of a curve (xs increasing): the point farthest from the
+# line between the first and the last point, both axes scaled to [0, 1].
+# None with less than 3 points or a flat curve.
+def knee(xs, ys):
+    points = [(x, y) for x, y in zip(xs, ys) if y == y]
+    if len(points) < 3:
+        return None
+    x0, x1 = points[0][0], points[-1][0]
+    y0, y1 = min([p[1] for p in points]), max([p[1] for p in points])
+    if x1 == x0 or y1 == y0:
+        return None
+    norm = [((x - x0) / (x1 - x0), (y - y0) / (y1 - y0)) for x, y in points]
+    # Distance below the chord: the knee of a convex curve is where it
+    # starts to rise
+    ax, ay = norm[0]
+    bx, by = norm[-1]
+    dists = [((bx - ax) * (ay - y) - (ax - x) * (by - ay)) / math.hypot(bx - ax, by - ay) for x, y in norm]
+    best = max(range(len(dists)), key=lambda i: dists[i])
+    if dists[best] <= 0:
+        return None
+    return xs.index(points[best][0])
+
+
+def _header(first):
+    return '\t'.join(first + ['QUERIES', 'FAILED', 'QPS'] + ['P%g_MS' % (p * 100) for p in PERCENTILES])
+
+
+def _fmt(s):
+    return '\t'.join(['%d' % s[0], '%d' % s[1], '%.2f' % s[2]] + ['%.1f' % v for v in s[3:]])
+
+
+# Write the summary and the curve of the replays of an output dir, each of
+# 'duration' seconds of which the first 'warmup' are left out. Returns the
+# rate of the knee, or None.
+def report(outputdir, duration, warmup=0):
+    replays = find(outputdir)
+    rates = sorted(replays.keys())
+    curve = []
+    with open(os.path.join(outputdir, SUMMARY), 'wt') as fout:
+        fout.write(_header(['RATE', 'QUERY']) + '\n')
+        for rate in rates:
+            rows = replays[rate]
+            s = stats(rows, warmup, duration)
+            curve.append((rate, s))
+            fout.write('%g\tALL\t' % rate + _fmt(s) + '\n')
+            for q in sorted(set([r['query'] for r in rows if warmup <= r['arrival'] < duration])):
+                fout.write('%g\t%s\t' % (rate, q) + _fmt(stats([r for r in rows if r['query'] == q], warmup,
+                                                                duration)) + '\n')
+    k = knee([c[0] for c in curve], [c[1][5] for c in curve])
+    with open(os.path.join(outputdir, CURVE), 'wt') as fout:
+        fout.write(_header(['RATE']) + '\tKNEE\n')
+        for i in range(len(curve)):
+            fout.write('%g\t' % curve[i][0] + _fmt(curve[i][1]) + '\t' + ('*' if i == k else '') + '\n')
+    return rates[k] if k is not None else None
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Summarize the replays of a query set at several rates')
+    parser.add_argument('output', help='output dir of the replays (replay_<rate> files)')
+    parser.add_argument('--duration', type=float, required=True, help='seconds of every replay')
+    parser.add_argument('--warmup', type=float, default=0, help='seconds at the start of a replay left out')
+    args = parser.parse_args()
+    if len(find(args.output)) == 0:
+        print('No replays in ' + args.output)
+        sys.exit(1)
+    k = report(args.output, args.duration, args.warmup)
+    print(open(os.path.join(args.output, CURVE), 'rt').read())
+    print('Knee at ' + ('%g queries/s' % k if k is not None else 'none found'))
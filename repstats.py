@@ -0,0 +1,94 @@
+import math
+import random
+import statistics
+
+# Statistics over the runtimes of the repetitions of a query
+
+
+# Value below which a fraction p (0..1) of the values fall, interpolating
+# linearly between the closest ranks
+def percentile(values, p):
+    values = sorted(values)
+    if len(values) == 0:
+        return float('nan')
+    pos = (len(values) - 1) * p
+    low = int(pos)
+    high = min(low + 1, len(values) - 1)
+    return values[low] + (values[high] - values[low]) * (pos - low)
+
+
+# Number of leading warm-up runs. A run is taken as warm-up as long as it
+# is slower than the median of the runs after it by more than k times
+# their (scaled) median absolute deviation. At most half of the runs are
+# discarded.
+def warmup(values, k=3.0):
+    n = 0
+    while n < len(values) // 2:
+        rest = values[n + 1:]
+        med = statistics.median(rest)
+        mad = statistics.median([abs(v - med) for v in rest])
+        scale = max(1.4826 * mad, 0.01 * abs(med))
+        if values[n] <= med + k * scale:
+            break
+        n += 1
+    return n
+
+
+# The runs after the warm-up
+def warm(values):
+    return values[warmup(values):]
+
+
+# Bootstrap confidence interval of a statistic (by default the median)
+def bootstrap_ci(values, stat=statistics.median, confidence=0.95, resamples=1000, seed=0):
+    if len(values) == 0:
+        return float('nan'), float('nan')
+    rng = random.Random(seed)
+    stats = sorted([stat(rng.choices(values, k=len(values))) for i in range(resamples)])
+    low = stats[int((1 - confidence) / 2 * resamples)]
+    high = stats[min(resamples - 1, int((1 + confidence) / 2 * resamples))]
+    return low, high
+
+
+# Summary of the warm runs of a query: number of runs, number of warm-up
+# runs, median, 95th percentile and confidence interval of the median
+def summary(values):
+    values = list(values)
+    n = warmup(values)
+    w = values[n:]
+    if len(w) == 0:
+        nan = float('nan')
+        return {'runs': len(values), 'warmup': n, 'median': nan, 'p95': nan, 'ci_low': nan, 'ci_high': nan}
+    low, high = bootstrap_ci(w)
+    return {'runs': len(values), 'warmup': n, 'median': statistics.median(w), 'p95': percentile(w, 0.95),
+            'ci_low': low, 'ci_high': high}
+
+
+# Two-sided Mann-Whitney U test of whether the values of a and b come from
+# the same distribution. Returns the p-value, from the normal approximation
+# with tie and continuity correction.
+def mannwhitney(a, b):
+    n1 = len(a)
+    n2 = len(b)
+    n = n1 + n2
+    if n1 == 0 or n2 == 0:
+        return float('nan')
+    values = sorted([(v, 0) for v in a] + [(v, 1) for v in b])
+    # Rank sum of a, ties get the average of their ranks
+    r1 = 0
+    ties = 0
+    i = 0
+    while i < n:
+        j = i
+        while j + 1 < n and values[j + 1][0] == values[i][0]:
+            j += 1
+        rank = (i + j) / 2 + 1
+        r1 += rank * len([k for k in range(i, j + 1) if values[k][1] == 0])
+        ties += (j - i + 1) ** 3 - (j - i + 1)
+        i = j + 1
+    u = r1 - n1 * (n1 + 1) / 2
+    sigma = math.sqrt(n1 * n2 / 12 * ((n + 1) - ties / (n * (n - 1))))
+    if sigma == 0:
+        return 1.0
+    z = max(abs(u - n1 * n2 / 2) - 0.5, 0) / sigma
+    return min(1.0, math.erfc(z / math.sqrt(2)))
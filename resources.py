@@ -0,0 +1,159 @@
+import os
+import time
+import array
+import threading
+
+# Resource usage of a command over time, sampled from /proc for the whole
+# tree of processes that the command starts (e.g. a shell and the program
+# it runs). Every series is kept in an array of doubles, and a profile is
+# saved next to the log of the command with the suffix SUFFIX: a text
+# header followed by the columns, one after the other, as native doubles.
+
+SUFFIX = '.resources'
+
+# time: seconds since the start; rss: bytes; cpu: percent of one cpu since
+# the previous sample; read/write: bytes read from and written to storage
+# so far; majflt: major page faults so far; threads: number of threads
+COLUMNS = ['time', 'rss', 'cpu', 'read', 'write', 'majflt', 'threads']
+
+CLOCK_TICKS = os.sysconf('SC_CLK_TCK')
+PAGE_SIZE = os.sysconf('SC_PAGE_SIZE')
+
+
+def _stat(pid):
+    with open('/proc/%d/stat' % pid, 'rt') as fin:
+        line = fin.read()
+    # The name of the command is in parentheses and may contain spaces
+    fields = line[line.rfind(')') + 2:].split()
+    return {'ppid': int(fields[1]), 'majflt': int(fields[9]),
+            'cpu': (int(fields[11]) + int(fields[12])) / CLOCK_TICKS,
+            'threads': int(fields[17]), 'starttime': int(fields[19]), 'rss': int(fields[21]) * PAGE_SIZE}
+
+
+def _io(pid):
+    io = {'read': 0, 'write': 0}
+    try:
+        with open('/proc/%d/io' % pid, 'rt') as fin:
+            for line in fin:
+                key, value = line.split(':')
+                if key == 'read_bytes':
+                    io['read'] = int(value)
+                elif key == 'write_bytes':
+                    io['write'] = int(value)
+    except (OSError, ValueError):
+        pass
+    return io
+
+
+# Statistics of the processes in the tree rooted at 'root'
+def _tree(root):
+    stats = {}
+    for name in os.listdir('/proc'):
+        if name.isdigit():
+            try:
+                stats[int(name)] = _stat(int(name))
+            except (OSError, ValueError, IndexError):
+                pass
+    children = {}
+    for pid, st in stats.items():
+        children.setdefault(st['ppid'], []).append(pid)
+    tree = {}
+    todo = [root]
+    while len(todo) > 0:
+        pid = todo.pop()
+        if pid in stats:
+            st = stats[pid]
+            st.update(_io(pid))
+            tree[pid] = st
+            todo += children.get(pid, [])
+    return tree
+
+
+class Sampler:
+    def __init__(self, pid, interval):
+        self.pid = pid
+        self.interval = interval
+        self.series = {}
+        for c in COLUMNS:
+            self.series[c] = array.array('d')
+        # Last values of the cumulative counters of every process, so that
+        # the counters of the processes that exit are not lost
+        self.counters = {}
+        self.lastcpu = 0
+        self.start = time.time()
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def _sample(self):
+        now = time.time() - self.start
+        tree = _tree(self.pid)
+        if len(tree) == 0:
+            return
+        for pid, st in tree.items():
+            self.counters[(pid, st['starttime'])] = (st['cpu'], st['read'], st['write'], st['majflt'])
+        totals = [sum(c[i] for c in self.counters.values()) for i in range(4)]
+        s = self.series
+        elapsed = now - s['time'][-1] if len(s['time']) > 0 else now
+        cpu = 0.0
+        if elapsed > 0:
+            cpu = max(totals[0] - self.lastcpu, 0) / elapsed * 100
+        self.lastcpu = totals[0]
+        s['time'].append(now)
+        s['rss'].append(sum(st['rss'] for st in tree.values()))
+        s['cpu'].append(cpu)
+        s['read'].append(totals[1])
+        s['write'].append(totals[2])
+        s['majflt'].append(totals[3])
+        s['threads'].append(sum(st['threads'] for st in tree.values()))
+
+    def _run(self):
+        while True:
+            self._sample()
+            if self.stopped.wait(self.interval):
+                break
+
+    # Stop sampling, to be called once the command has terminated
+    def stop(self):
+        self.stopped.set()
+        self.thread.join()
+        return self.series
+
+    def save(self, path):
+        save(path, self.series, self.interval)
+
+
+def save(path, series, interval):
+    with open(path + '.tmp', 'wb') as fout:
+        fout.write(('# resources %g %d %s\n' % (interval, len(series['time']), ' '.join(COLUMNS))).encode())
+        for c in COLUMNS:
+            series[c].tofile(fout)
+    os.replace(path + '.tmp', path)
+
+
+# Read a profile saved by save(). Returns the sampling interval and the
+# series by column.
+def load(path):
+    with open(path, 'rb') as fin:
+        header = fin.readline().decode().split()
+        interval = float(header[2])
+        n = int(header[3])
+        series = {}
+        for c in header[4:]:
+            series[c] = array.array('d')
+            series[c].fromfile(fin, n)
+    return interval, series
+
+
+# Summary of a profile: peak RSS (bytes), cpu time (s), bytes read and
+# written, major faults and peak number of threads
+def summary(series):
+    if len(series['time']) == 0:
+        return {}
+    cputime = 0.0
+    prev = 0.0
+    for t, cpu in zip(series['time'], series['cpu']):
+        cputime += cpu / 100 * (t - prev)
+        prev = t
+    return {'rss': max(series['rss']), 'cputime': cputime, 'read': series['read'][-1],
+            'write': series['write'][-1], 'majflt': series['majflt'][-1], 'threads': max(series['threads'])}
@@ -0,0 +1,267 @@
+import os
+import re
+import sqlite3
+import hashlib
+from multiprocessing import Pool
+
+import logparse
+import resources
+
+# Embedded store of all the measurements of the experiments. Every value
+# that a log reports becomes a row indexed by run, test, dataset, engine,
+# query, config and repetition. A run is the absolute path of the directory
+# that holds the results of one execution of a test (e.g.
+# <output>/test2/results-01-02-20-10:00:00).
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS measurements (
+    run TEXT, test TEXT, dataset TEXT, engine TEXT, query TEXT, config TEXT,
+    repetition INTEGER, metric TEXT, value REAL, source TEXT);
+CREATE INDEX IF NOT EXISTS measurements_idx ON measurements
+    (run, test, dataset, engine, query, config, repetition);
+CREATE INDEX IF NOT EXISTS measurements_source ON measurements (source);
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY, mtime REAL, size INTEGER, hash TEXT);
+"""
+
+# A results directory whose name got glued to the name of the engine
+# results, e.g. 'results-01-02-20-10:00:00lubm1b-rdf3x'
+GLUED = re.compile(r'^(results(?:-\d\d-\d\d-\d\d-\d\d:\d\d:\d\d)?)(.+)$')
+
+
+def _engine(name):
+    for suffix, engine in [('native', 'trident-native'), ('rdf3x', 'rdf3x')]:
+        for sep in ['-', '_']:
+            if name.endswith(sep + suffix):
+                return name[:-len(suffix) - 1], engine
+    return name, 'trident'
+
+
+# Describe a file written by launch_experiments.py from its path, or return
+# None if it holds no measurements. The description has the keys run, test,
+# dataset, engine, query, config and kind (the parser to use).
+def describe(path):
+    if path.endswith(resources.SUFFIX):
+        # The resources used by the command that wrote a log
+        desc = describe(path[:-len(resources.SUFFIX)])
+        if desc is not None:
+            desc['kind'] = 'resources'
+        return desc
+    parts = os.path.abspath(path).split(os.sep)
+    t = None
+    for i in range(len(parts) - 1, -1, -1):
+        if re.match(r'^test\d+$', parts[i]):
+            t = i
+            break
+    if t is None:
+        return None
+    testdir = os.sep.join(parts[:t + 1])
+    test = parts[t][4:]
+    rest = parts[t + 1:]
+    filename = rest[-1]
+    desc = {'test': test, 'query': '', 'config': '', 'run': None}
+    if test == '1':
+        if len(rest) != 2 or not filename.startswith('test_'):
+            return None
+        conf = filename[5:]
+        desc.update(run=os.path.join(testdir, rest[0]), dataset='yago', config=conf, kind='test1',
+                    engine='rdf3x' if conf == 'rdf3x' else 'trident')
+        return desc
+    if test == '4':
+        if len(rest) != 2 or filename.endswith('_stdout') or filename.endswith('-err'):
+            return None
+        if rest[0] == 'snap' and filename.startswith('results_'):
+            desc.update(run=testdir, dataset=filename[8:], engine='snap', kind='snap')
+            return desc
+        if rest[0] == 'trident' and '_' in filename:
+            pos = filename.find('_')
+            desc.update(run=testdir, dataset=filename[:pos], engine='trident', query=filename[pos + 1:],
+                        kind='analytics')
+            return desc
+        return None
+    if not filename.startswith('logs_') or filename.endswith('_results') or len(rest) < 2:
+        return None
+    names = rest[1:-1]
+    run = rest[0]
+    if len(names) == 0:
+        m = GLUED.match(run)
+        if m is None:
+            return None
+        run, names = m.group(1), [m.group(2)]
+    dataset, engine = _engine(names[0])
+    desc.update(run=os.path.join(testdir, run), dataset=dataset, engine=engine, query=filename[5:],
+                config='/'.join(names[1:]), kind='rdf3x' if engine == 'rdf3x' else 'trident')
+    return desc
+
+
+# Parse a file described by describe() into (query, metric, repetition,
+# value) tuples. The repetition is the index of the value among those of the
+# same query and metric in the file.
+def parse_file(path, desc):
+    measurements = []
+    counts = {}
+
+    def add(query, metric, value):
+        rep = counts.get((query, metric), 0)
+        counts[(query, metric)] = rep + 1
+        measurements.append((query, metric, rep, value))
+
+    if desc['kind'] == 'test1':
+        # Tab separated, one line per scan, the warm runtime in the 6th column
+        for line in open(path, 'rt'):
+            if line.startswith('PERM'):
+                continue
+            m = logparse.match(line, logparse.WATCHDOG)
+            if m is not None:
+                add('all', m[0], m[1])
+                continue
+            tokens = line.split('\t')
+            if len(tokens) > 5:
+                add(tokens[0] + '-' + tokens[1], 'warm', float(tokens[5]))
+        return measurements
+    if desc['kind'] == 'resources':
+        interval, series = resources.load(path)
+        for metric, value in sorted(resources.summary(series).items()):
+            add(desc['query'], 'res_' + metric, value)
+        return measurements
+    patterns = {'trident': logparse.TRIDENT, 'rdf3x': logparse.RDF3X,
+                'analytics': logparse.ANALYTICS, 'snap': logparse.SNAP}[desc['kind']]
+    for r in logparse.parse(path, patterns):
+        if desc['kind'] == 'snap' and str(r['metric']) in [m for m, p in logparse.WATCHDOG]:
+            add('all', str(r['metric']), float(r['value']))
+        elif desc['kind'] == 'snap':
+            # One file holds all the operations
+            add(str(r['metric']), 'runtime', float(r['value']))
+        else:
+            add(desc['query'], str(r['metric']), float(r['value']))
+    return measurements
+
+
+def _parse(args):
+    return parse_file(*args)
+
+
+def _hash(path):
+    h = hashlib.sha1()
+    with open(path, 'rb') as fin:
+        for block in iter(lambda: fin.read(1 << 20), b''):
+            h.update(block)
+    return h.hexdigest()
+
+
+class ResultsDB:
+    def __init__(self, path):
+        self.path = path
+        self.conn = sqlite3.connect(path)
+        self.conn.executescript(SCHEMA)
+
+    def close(self):
+        self.conn.close()
+
+    def _store(self, path, desc, measurements, st, digest):
+        with self.conn:
+            self.conn.execute('DELETE FROM measurements WHERE source = ?', (path,))
+            self.conn.executemany(
+                'INSERT INTO measurements VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                [(desc['run'], desc['test'], desc['dataset'], desc['engine'], q, desc['config'], rep, metric,
+                  value, path) for q, metric, rep, value in measurements])
+            self.conn.execute('INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?)',
+                              (path, st.st_mtime, st.st_size, digest))
+
+    # Whether a file has changed since it was ingested. Files whose mtime
+    # changed but whose content did not are marked as up to date.
+    def _changed(self, path):
+        st = os.stat(path)
+        row = self.conn.execute('SELECT mtime, size, hash FROM files WHERE path = ?', (path,)).fetchone()
+        if row is None:
+            return True
+        if row[0] == st.st_mtime and row[1] == st.st_size:
+            return False
+        if row[1] == st.st_size and row[2] == _hash(path):
+            with self.conn:
+                self.conn.execute('UPDATE files SET mtime = ? WHERE path = ?', (st.st_mtime, path))
+            return False
+        return True
+
+    # Store the measurements of one file, as soon as it is written
+    def record(self, path):
+        path = os.path.abspath(path)
+        desc = describe(path)
+        if desc is None or not os.path.exists(path) or not self._changed(path):
+            return 0
+        measurements = parse_file(path, desc)
+        self._store(path, desc, measurements, os.stat(path), _hash(path))
+        return len(measurements)
+
+    # Ingest all the results under a directory, skipping the files that did
+    # not change since the last ingest. With parallel, the files are parsed
+    # by a pool of processes, which re-import the __main__ module of the
+    # caller unless the start method is fork: only scripts whose work is
+    # under an "if __name__ == '__main__'" guard may ask for it.
+    def ingest(self, root, parallel=False):
+        todo = []
+        for dirpath, dirs, files in os.walk(os.path.abspath(root)):
+            dirs.sort()
+            for f in sorted(files):
+                path = os.path.join(dirpath, f)
+                desc = describe(path)
+                if desc is not None and self._changed(path):
+                    todo.append((path, desc))
+        if len(todo) == 0:
+            return 0
+        if parallel:
+            with Pool() as pool:
+                parsed = pool.map(_parse, todo)
+        else:
+            parsed = [_parse(args) for args in todo]
+        for (path, desc), measurements in zip(todo, parsed):
+            self._store(path, desc, measurements, os.stat(path), _hash(path))
+        return len(todo)
+
+    # Store the wall time of a database build done by a run and, if the build
+    # wrote a log next to the database (<db>.log), the duration of every
+    # phase of the load, and the summary of its resource profile. The rows
+    # have query 'load', the options of the build as config and metrics
+    # 'load_wall', 'load_<phase>' and 'load_res_<resource>'.
+    def record_build(self, run, dbpath, opts, walltime):
+        run = os.path.abspath(run)
+        dbpath = os.path.abspath(dbpath)
+        test = ''
+        for part in run.split(os.sep):
+            if re.match(r'^test\d+$', part):
+                test = part[4:]
+        engine = 'rdf3x' if opts.startswith('rdf3xload') else 'trident'
+        measurements = [('load', 'load_wall', 0, walltime)]
+        if os.path.exists(dbpath + '.log'):
+            for phase, start, end in logparse.load_phases(dbpath + '.log'):
+                measurements.append(('load', 'load_' + phase, 0, end - start))
+        if os.path.exists(dbpath + resources.SUFFIX):
+            interval, series = resources.load(dbpath + resources.SUFFIX)
+            for metric, value in sorted(resources.summary(series).items()):
+                measurements.append(('load', 'load_res_' + metric, 0, value))
+        source = 'build:' + run + ':' + dbpath
+        with self.conn:
+            self.conn.execute('DELETE FROM measurements WHERE source = ?', (source,))
+            self.conn.executemany(
+                'INSERT INTO measurements VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                [(run, test, os.path.basename(dbpath), engine, q, opts, rep, metric, value, source)
+                 for q, metric, rep, value in measurements])
+        return len(measurements)
+
+    # Store the outcome of the comparison of the answers of the engines of a
+    # run, as (dataset, engine, query, config, 1 or 0) tuples
+    def record_matches(self, run, matches):
+        source = 'check:' + run
+        test = ''
+        for part in run.split(os.sep):
+            if re.match(r'^test\d+$', part):
+                test = part[4:]
+        with self.conn:
+            self.conn.execute('DELETE FROM measurements WHERE source = ?', (source,))
+            self.conn.executemany(
+                'INSERT INTO measurements VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                [(run, test, dataset, engine, query, config, 0, 'result_match', value, source)
+                 for dataset, engine, query, config, value in matches])
+
+    def select(self, sql, args=()):
+        return self.conn.execute(sql, args).fetchall()
@@ -0,0 +1,207 @@
+import os
+import re
+import sys
+import gzip
+import math
+import array
+import random
+import shutil
+import hashlib
+import argparse
+import subprocess
+
+import watchdog
+
+# Sink for the decoded answer of a query. The answer is read from a pipe and
+# never written to disk: only its number of rows and a checksum of the
+# multiset of its rows are kept, in <output>.summary, and optionally a
+# uniform sample of the rows in <output>.sample.gz. The checksum is the sum
+# (mod 2^64) of a 64-bit hash of every row, so it does not depend on the
+# order in which the rows are produced. Rows are hashed in a normalized form
+# (see normalize()) so that the checksums of different engines can be
+# compared. With partitions > 0 the hashes are also written, partitioned by
+# hash, to <output>.hashes/<partition>, so that check_results.py can count
+# the rows that differ one partition at a time.
+
+SUFFIX = '.summary'
+SAMPLE_SUFFIX = '.sample.gz'
+HASHES_SUFFIX = '.hashes'
+
+# Words of the lines that the engines print around the answer, which are
+# not rows (see not_row())
+NOT_ROWS = [b'cardinality', b'<empty result']
+
+BLOCK = 1 << 22
+
+
+# A term: an IRI, a literal with its language or type, or anything else
+# up to the next blank
+TERM = re.compile(rb'<[^>]*>|"(?:[^"\\]|\\.)*"(?:@[A-Za-z0-9-]+|\^\^<[^>]*>)?|\S+')
+
+
+# Whether a line is one that an engine prints around the answer: the
+# '<empty result>' of trident, or a line of RDF3X with a 'cardinality'
+# word. The words are looked for outside of the terms, so that a row with a
+# literal that contains them is still a row.
+def not_row(line):
+    if line.lstrip().startswith(b'<empty result'):
+        return True
+    if b'cardinality' not in line:
+        return False
+    return any(t.startswith(b'cardinality') for t in TERM.findall(line))
+
+
+# A row as its terms separated by tabs, without the brackets of the IRIs
+# and without a final '.', whatever the separators the engine prints
+def normalize(row):
+    terms = TERM.findall(row)
+    if len(terms) > 0 and terms[-1] == b'.':
+        terms.pop()
+    return b'\t'.join([t[1:-1] if t[:1] == b'<' and t[-1:] == b'>' else t for t in terms])
+
+
+def _hash(row):
+    return int.from_bytes(hashlib.blake2b(normalize(row), digest_size=8).digest(), 'little')
+
+
+# Uniform sample of k rows of a stream, by reservoir sampling with
+# geometric jumps (Li's algorithm L), so that the random numbers are drawn
+# only for the rows that enter the sample
+class Reservoir:
+    def __init__(self, k, seed=0):
+        self.k = k
+        self.rows = []
+        self.rng = random.Random(seed)
+        self.w = math.exp(math.log(self.rng.random()) / k) if k > 0 else 0
+        # Index of the next row that enters the sample
+        self.next = k - 1 + self._skip()
+
+    def _skip(self):
+        if self.k == 0:
+            return float('inf')
+        return int(math.log(self.rng.random()) / math.log(1 - self.w)) + 1
+
+    # Offer the rows of index first, first+1, ...
+    def add(self, first, rows):
+        i = 0
+        while len(self.rows) < self.k and i < len(rows):
+            self.rows.append(rows[i])
+            i += 1
+        while self.next - first < len(rows):
+            self.rows[self.rng.randrange(self.k)] = rows[self.next - first]
+            self.w *= math.exp(math.log(self.rng.random()) / self.k)
+            self.next += self._skip()
+
+
+# Consume a binary stream. Returns the number of rows and the checksum, and
+# writes them to output + SUFFIX.
+def sink(stream, output, sample=0, partitions=0):
+    rows = 0
+    nbytes = 0
+    checksum = 0
+    reservoir = Reservoir(sample)
+    rest = b''
+    parts = []
+    if partitions > 0:
+        if os.path.exists(output + HASHES_SUFFIX):
+            shutil.rmtree(output + HASHES_SUFFIX)
+        os.makedirs(output + HASHES_SUFFIX)
+        parts = [open(output + HASHES_SUFFIX + '/%03d' % i, 'wb') for i in range(partitions)]
+
+    def add(lines):
+        hashes = list(map(_hash, lines))
+        if len(parts) > 0:
+            buckets = [array.array('Q') for p in parts]
+            for h in hashes:
+                buckets[h % partitions].append(h)
+            for i in range(partitions):
+                buckets[i].tofile(parts[i])
+        return sum(hashes)
+
+    while True:
+        block = stream.read(BLOCK)
+        if not block:
+            break
+        nbytes += len(block)
+        block = rest + block
+        lines = block.split(b'\n')
+        rest = lines.pop()
+        if any(m in block for m in NOT_ROWS):
+            lines = [l for l in lines if not not_row(l)]
+        checksum += add(lines)
+        reservoir.add(rows, lines)
+        rows += len(lines)
+    if rest != b'' and not not_row(rest):
+        checksum += add([rest])
+        reservoir.add(rows, [rest])
+        rows += 1
+    for f in parts:
+        f.close()
+    checksum %= 1 << 64
+    with open(output + SUFFIX + '.tmp', 'wt') as fout:
+        fout.write('rows\t%d\nchecksum\t%016x\nbytes\t%d\npartitions\t%d\n' % (rows, checksum, nbytes, partitions))
+    os.replace(output + SUFFIX + '.tmp', output + SUFFIX)
+    if sample > 0:
+        with gzip.open(output + SAMPLE_SUFFIX, 'wb') as fout:
+            for r in reservoir.rows:
+                fout.write(r + b'\n')
+    return rows, checksum
+
+
+# Launch a command and sink its standard output. Returns its return code,
+# or watchdog.TIMEOUT/OOM if it ran longer than 'timeout' seconds or used
+# more than 'rsslimit' GB (0 for no limit), in which case the summary covers
+# the rows read until then.
+def run(args, output, stderr=None, sample=0, partitions=0, timeout=0, rsslimit=0):
+    process = subprocess.Popen(args, stdout=subprocess.PIPE, stderr=stderr, start_new_session=True)
+    wd = watchdog.Watchdog(process, timeout, rsslimit)
+    try:
+        sink(process.stdout, output, sample, partitions)
+        process.stdout.close()
+        process.wait()
+    except KeyboardInterrupt:
+        wd.kill()
+        raise
+    ret = wd.stop()
+    wd.report(stderr if stderr is not None else sys.stderr)
+    return ret
+
+
+# Remove what sink() wrote for an output, e.g. when the answer is incomplete
+def discard(output):
+    for path in [output + SUFFIX, output + SAMPLE_SUFFIX]:
+        if os.path.exists(path):
+            os.remove(path)
+    if os.path.exists(output + HASHES_SUFFIX):
+        shutil.rmtree(output + HASHES_SUFFIX)
+
+
+# Summary written by sink(), as a dictionary, or None if there is none
+def read_summary(output):
+    if not os.path.exists(output + SUFFIX):
+        return None
+    summary = {}
+    for line in open(output + SUFFIX, 'rt'):
+        key, value = line.rstrip('\n').split('\t')
+        summary[key] = value
+    summary['rows'] = int(summary['rows'])
+    summary['partitions'] = int(summary.get('partitions', 0))
+    return summary
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Run a command and keep only the row count and checksum of its output')
+    parser.add_argument('--sample', type=int, default=0, help='rows to keep in <output>' + SAMPLE_SUFFIX)
+    parser.add_argument('--partitions', type=int, default=0,
+                        help='partitions of the hashes written to <output>' + HASHES_SUFFIX + ' (0 for none)')
+    parser.add_argument('--timeout', type=float, default=0, help='seconds after which the command is killed (0 for none)')
+    parser.add_argument('--rsslimit', type=float, default=0,
+                        help='GB of RSS above which the command is killed (0 for none)')
+    parser.add_argument('output', help='the summary is written to <output>' + SUFFIX)
+    parser.add_argument('cmd', nargs=argparse.REMAINDER, help='command, or nothing to read the standard input')
+    args = parser.parse_args()
+    if len(args.cmd) == 0:
+        sink(sys.stdin.buffer, args.output, args.sample, args.partitions)
+        sys.exit(0)
+    sys.exit(run(args.cmd, args.output, sample=args.sample, partitions=args.partitions, timeout=args.timeout,
+                 rsslimit=args.rsslimit))
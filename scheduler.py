@@ -0,0 +1,120 @@
+import threading
+import time
+
+
+# A unit of work for the Scheduler, typically the build of one database.
+# func(*args) must return a return code (0 means success). cpus, ram and
+# disk (GB) are the resources the job is expected to use while it runs, and
+# deps are the names of the jobs that must have succeeded before it starts.
+# description says what the job does (e.g. the options of a build).
+class Job:
+    def __init__(self, name, func, args=(), cpus=1, ram=0, disk=0, deps=(), description=''):
+        self.name = name
+        self.description = description
+        self.func = func
+        self.args = args
+        self.cpus = cpus
+        self.ram = ram
+        self.disk = disk
+        self.deps = list(deps)
+        self.returncode = None
+        self.start = None
+        self.end = None
+
+    def walltime(self):
+        if self.start is None or self.end is None:
+            return 0
+        return self.end - self.start
+
+
+# Runs jobs concurrently, starting as many of them as the given budget of
+# cpus, RAM and disk (GB) allows. A job that asks for more than the whole
+# budget is clamped to it, so that it still runs (alone).
+class Scheduler:
+    def __init__(self, cpus, ram, disk):
+        self.cpus = cpus
+        self.ram = ram
+        self.disk = disk
+        self.jobs = []
+        self.cond = threading.Condition()
+
+    def add(self, job):
+        if job.name in [j.name for j in self.jobs]:
+            raise ValueError('Job ' + job.name + ' is added twice')
+        self.jobs.append(job)
+        return job
+
+    def _demand(self, job):
+        return (min(job.cpus, self.cpus), min(job.ram, self.ram), min(job.disk, self.disk))
+
+    def _fits(self, job, used):
+        demand = self._demand(job)
+        return used[0] + demand[0] <= self.cpus and used[1] + demand[1] <= self.ram \
+            and used[2] + demand[2] <= self.disk
+
+    def _execute(self, job):
+        try:
+            job.returncode = job.func(*job.args)
+        except Exception as e:
+            print(" Job " + job.name + " raised an exception: " + str(e))
+            job.returncode = -1
+        job.end = time.time()
+        with self.cond:
+            self.cond.notify_all()
+
+    # Run all jobs and return them with their return code and wall time.
+    # Raises ValueError if a job depends on an unknown job or the
+    # dependencies form a cycle.
+    def run(self):
+        byname = {}
+        for job in self.jobs:
+            byname[job.name] = job
+        for job in self.jobs:
+            for dep in job.deps:
+                if dep not in byname:
+                    raise ValueError('Job ' + job.name + ' depends on unknown job ' + dep)
+        pending = list(self.jobs)
+        running = []
+        used = [0, 0, 0]
+        with self.cond:
+            while len(pending) > 0 or len(running) > 0:
+                # Collect the jobs that have terminated
+                for job in [j for j in running if j.end is not None]:
+                    running.remove(job)
+                    demand = self._demand(job)
+                    for i in range(3):
+                        used[i] -= demand[i]
+                    if job.returncode != 0:
+                        print(" Job " + job.name + " failed with return code " + str(job.returncode))
+                # Skip the jobs whose dependencies failed
+                for job in list(pending):
+                    failed = [d for d in job.deps if byname[d].end is not None and byname[d].returncode != 0]
+                    if len(failed) > 0:
+                        print(" Skipping job " + job.name + ": dependency " + failed[0] + " failed")
+                        job.returncode = -1
+                        job.start = job.end = time.time()
+                        pending.remove(job)
+                # Start every job that is ready and fits in the budget
+                for job in list(pending):
+                    ready = all(byname[d].end is not None for d in job.deps)
+                    if ready and (len(running) == 0 or self._fits(job, used)):
+                        pending.remove(job)
+                        running.append(job)
+                        demand = self._demand(job)
+                        for i in range(3):
+                            used[i] += demand[i]
+                        job.start = time.time()
+                        threading.Thread(target=self._execute, args=(job,), daemon=True).start()
+                if len(running) > 0:
+                    self.cond.wait(1)
+                elif len(pending) > 0:
+                    # Nothing runs and nothing can start: the dependencies
+                    # of the pending jobs form a cycle
+                    raise ValueError('Jobs ' + ', '.join([j.name for j in pending]) +
+                                     ' wait for each other (cyclic dependencies)')
+        return self.jobs
+
+    def report(self):
+        print(" %-60s %10s %12s" % ('JOB', 'RETURNCODE', 'WALLTIME(s)'))
+        for job in self.jobs:
+            print(" %-60s %10s %12.1f" % (job.name, str(job.returncode), job.walltime()))
@@ -0,0 +1,272 @@
+import os
+import re
+import sys
+import math
+import argparse
+
+import repstats
+import resultsink
+
+# Query templates: the constants of a query become parameters, so that the
+# same query runs with many bindings, drawn from the database, instead of
+# hitting the same index ranges at every repetition.
+#
+# The parameters of a query are the IRIs written in full (<...>) in its
+# body: the suites write their vocabulary with prefixed names and only the
+# instances (a university, a course, a DBpedia resource) in full; the
+# datatypes of literals (^^<...>) are not parameters. The same
+# IRI is one parameter wherever it appears. The candidate bindings of the
+# parameters are the answers of the innermost group ({...}) that holds
+# them, with the parameters replaced by variables: the parameters of a
+# group are bound together, so that their values are consistent, and the
+# number of answers of a binding is its selectivity, for the group.
+#
+# Draws: 'uniform' over the distinct bindings, 'zipf' with the probability
+# of the binding of rank k proportional to 1/k^s (the ranks are a random
+# permutation of the bindings), or 'selectivity': as many instances from
+# every class of selectivity, the classes being powers of 10 of the number
+# of answers (1, 2-10, 11-100, ...).
+
+PARAM = re.compile(r'<[^<>"{}|^`\\\s]*>')
+PARAM_VAR = '?tpl_p'
+
+SUMMARY = 'templates_summary'
+COLUMNS = ['INSTANCE', 'BINDING', 'ANSWERS', 'CLASS', 'LATENCY_MS', 'EXEC_MS', 'RET']
+PERCENTILES = [0.5, 0.95, 0.99]
+
+
+# Start of the body of a query: after its PREFIX and BASE declarations
+def _body_start(text):
+    pos = 0
+    for m in re.finditer(r'(?im)^\s*(PREFIX|BASE)\b[^\n]*\n', text):
+        pos = m.end()
+    return pos
+
+
+# Innermost group ('{' ... '}') around a position: its start and end
+def _group(text, pos):
+    depth = 0
+    start = None
+    for i in range(pos, -1, -1):
+        if text[i] == '}':
+            depth += 1
+        elif text[i] == '{':
+            if depth == 0:
+                start = i
+                break
+            depth -= 1
+    if start is None:
+        return None
+    depth = 0
+    for i in range(start, len(text)):
+        if text[i] == '{':
+            depth += 1
+        elif text[i] == '}':
+            depth -= 1
+            if depth == 0:
+                return start, i + 1
+    return None
+
+
+class Template:
+    def __init__(self, name, text):
+        self.name = name
+        self.text = text
+        body = _body_start(text)
+        self.prologue = text[:body]
+        self.params = []
+        positions = {}
+        for m in PARAM.finditer(text, body):
+            if text[m.start() - 2:m.start()] == '^^':
+                continue
+            if m.group(0) not in self.params:
+                self.params.append(m.group(0))
+            positions.setdefault(m.group(0), m.start())
+        # Groups of parameters bound together, by their innermost group
+        self.groups = []
+        spans = {}
+        for p in self.params:
+            span = _group(text, positions[p])
+            if span is None:
+                raise Exception('The constant ' + p + ' of ' + name + ' is not in a group')
+            if span not in spans:
+                spans[span] = len(self.groups)
+                self.groups.append((span, []))
+            self.groups[spans[span]][1].append(p)
+
+    # Query whose answers are the candidate bindings of a group of parameters
+    def binding_query(self, group):
+        (start, end), params = self.groups[group]
+        pattern = self.text[start:end]
+        for p in params:
+            pattern = re.sub(r'(?<!\^\^)' + re.escape(p), PARAM_VAR + str(self.params.index(p)), pattern)
+        variables = ' '.join([PARAM_VAR + str(self.params.index(p)) for p in params])
+        return self.prologue + 'SELECT ' + variables + ' WHERE ' + pattern + '\n'
+
+    # The query with some values (one per parameter, in order)
+    def instance(self, values):
+        text = self.text[:len(self.prologue)]
+        body = self.text[len(self.prologue):]
+        return text + PARAM.sub(lambda m: values[self.params.index(m.group(0))]
+                                if m.group(0) in self.params and body[m.start() - 2:m.start()] != '^^'
+                                else m.group(0), body)
+
+
+def load_suite(queriesdir):
+    return [Template(q, open(os.path.join(queriesdir, q), 'rt').read())
+            for q in sorted(os.listdir(queriesdir)) if not q.startswith('.')]
+
+
+# A term of an answer as a constant of a query: IRIs in brackets, literals as
+# they are
+def _term(term):
+    if term.startswith('"') or (term.startswith('<') and term.endswith('>')):
+        return term
+    return '<' + term + '>'
+
+
+# The answers of a binding query (the lines of the output of the engine),
+# counted by binding: {(value, ...): answers}
+def count_bindings(lines, nparams):
+    counts = {}
+    for line in lines:
+        if isinstance(line, str):
+            line = line.encode()
+        line = line.rstrip(b'\n')
+        if line == b'' or resultsink.not_row(line):
+            continue
+        terms = [t.decode(errors='replace') for t in resultsink.TERM.findall(line)]
+        if len(terms) > 0 and terms[-1] == '.':
+            terms.pop()
+        if len(terms) != nparams:
+            continue
+        key = tuple([_term(t) for t in terms])
+        counts[key] = counts.get(key, 0) + 1
+    return counts
+
+
+# Class of selectivity of a binding with some answers: 0 for 1, 1 for
+# 2-10, 2 for 11-100, ...
+def selectivity_class(answers):
+    if answers <= 1:
+        return 0
+    return int(math.ceil(math.log10(answers)))
+
+
+def class_name(c):
+    if c == 0:
+        return '1'
+    return '%d-%d' % (10 ** (c - 1) + 1, 10 ** c)
+
+
+# Draw n bindings of a group from their counts
+def draw(counts, n, how, rng, zipf_s=1.0):
+    bindings = sorted(counts.keys())
+    if len(bindings) == 0:
+        return []
+    if how == 'uniform':
+        if n <= len(bindings):
+            return rng.sample(bindings, n)
+        return [rng.choice(bindings) for i in range(n)]
+    if how == 'zipf':
+        ranked = list(bindings)
+        rng.shuffle(ranked)
+        weights = [1.0 / (k + 1) ** zipf_s for k in range(len(ranked))]
+        return rng.choices(ranked, weights=weights, k=n)
+    if how == 'selectivity':
+        classes = {}
+        for b in bindings:
+            classes.setdefault(selectivity_class(counts[b]), []).append(b)
+        names = sorted(classes)
+        result = []
+        for i in range(n):
+            c = classes[names[i % len(names)]]
+            result.append(rng.choice(c))
+        rng.shuffle(result)
+        return result
+    raise ValueError('Unknown draw ' + how)
+
+
+# Instances of a template: n lists of values (one per parameter), each with
+# the answers of the group of its first parameter for its class. 'counts'
+# has the counts of the bindings of every group.
+def instances(template, counts, n, how, rng, zipf_s=1.0):
+    drawn = [draw(counts[g], n, how, rng, zipf_s) for g in range(len(template.groups))]
+    if any([len(d) == 0 for d in drawn]):
+        return []
+    result = []
+    for i in range(n):
+        values = [None] * len(template.params)
+        for g in range(len(template.groups)):
+            for p, v in zip(template.groups[g][1], drawn[g][i]):
+                values[template.params.index(p)] = v
+        result.append((values, counts[0][drawn[0][i]]))
+    return result
+
+
+def save_instances(path, rows):
+    with open(path + '.tmp', 'wt') as fout:
+        fout.write('\t'.join(COLUMNS) + '\n')
+        for r in rows:
+            fout.write('%d\t%s\t%d\t%s\t%.3f\t%.3f\t%d\n' % (r['instance'], ' '.join(r['binding']), r['answers'],
+                                                          class_name(r['class']), r['latency_ms'], r['exec_ms'],
+                                                          r['ret']))
+    os.replace(path + '.tmp', path)
+
+
+def load_instances(path):
+    rows = []
+    for line in open(path, 'rt'):
+        tokens = line.rstrip('\n').split('\t')
+        if tokens[0] == 'INSTANCE':
+            continue
+        rows.append({'instance': int(tokens[0]), 'binding': tokens[1].split(' '), 'answers': int(tokens[2]),
+                     'class': tokens[3], 'latency_ms': float(tokens[4]), 'exec_ms': float(tokens[5]),
+                     'ret': int(tokens[6])})
+    return rows
+
+
+# Runtime of an instance: the runtime reported by the engine, or the
+# latency of the process if it reported none
+def _runtime(r):
+    return r['exec_ms'] if r['exec_ms'] == r['exec_ms'] else r['latency_ms']
+
+
+def _stats(rows):
+    ok = [_runtime(r) for r in rows if r['ret'] == 0]
+    result = [len(rows), len(rows) - len(ok)]
+    for p in PERCENTILES:
+        result.append(repstats.percentile(ok, p) if len(ok) > 0 else float('nan'))
+    result.append(sum(ok) / len(ok) if len(ok) > 0 else float('nan'))
+    return result
+
+
+# Distribution of the runtimes per template, and per template and class of
+# selectivity, of the instances of an output dir (instances_<template>)
+def summary(outputdir, out):
+    out.write('TEMPLATE\tCLASS\tINSTANCES\tFAILED\t' + '\t'.join(['P%g_MS' % (p * 100) for p in PERCENTILES]) +
+              '\tMEAN_MS\n')
+    for f in sorted(os.listdir(outputdir)):
+        if not f.startswith('instances_') or f.endswith('.tmp'):
+            continue
+        rows = load_instances(os.path.join(outputdir, f))
+        name = f[len('instances_'):]
+        classes = sorted(set([r['class'] for r in rows]), key=lambda c: int(c.split('-')[0]))
+        for c, selected in [('ALL', rows)] + [(c, [r for r in rows if r['class'] == c]) for c in classes]:
+            s = _stats(selected)
+            out.write('%s\t%s\t%d\t%d\t' % (name, c, s[0], s[1]) + '\t'.join(['%.1f' % v for v in s[2:]]) + '\n')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Parameters of query templates, or the summary of their instances')
+    parser.add_argument('path', help='a dir of queries (to list their parameters) or an output dir with '
+                                     'instances_<template> files')
+    args = parser.parse_args()
+    if any([f.startswith('instances_') for f in os.listdir(args.path)]):
+        summary(args.path, sys.stdout)
+    else:
+        for t in load_suite(args.path):
+            print(t.name + ': ' + (' '.join(t.params) if len(t.params) > 0 else 'no parameters'))
+            for g in range(len(t.groups)):
+                print('  bindings of ' + ' '.join(t.groups[g][1]) + ':')
+                print('    ' + t.binding_query(g).replace('\n', '\n    ').rstrip())
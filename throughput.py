@@ -0,0 +1,195 @@
+import os
+import sys
+import time
+import shutil
+import argparse
+import resource
+
+import matrix
+import mixedload
+import repstats
+
+# Throughput of an engine with concurrent clients: N clients loop over the
+# queries of a suite on the same database (see mixedload.Clients), for a
+# warm-up and then for 'duration' seconds, for every N of a sweep (by
+# default 1, 2, 4 ... up to the cpus of the machine). Every client can be
+# pinned to a cpu of its own, with taskset or numactl (which also keeps its
+# memory on the node of the cpu).
+#
+# For every N the queries that started after the warm-up give the
+# throughput, its speedup over one client and the scaling efficiency
+# (speedup / N), and the latency percentiles. The cpu time and the bytes
+# read from storage by the queries (getrusage of the children, as the
+# clients are the only children that end meanwhile) give the cpu
+# utilization and the IO per busy core.
+#
+# Files written in the output dir of an engine on a dataset:
+#   clients-<N>/mixed_queries, clients-<N>/mixed_phases   the queries of N
+#                   clients (see mixedload.py)
+#   clients-<N>/usage   cpu seconds, bytes read and written, wall seconds
+#                   and busy cores of the level
+# and a table 'throughput' in the results dir of the test, with a row per
+# dataset, engine and N.
+
+USAGE = 'usage'
+TABLE = 'throughput'
+
+COLUMNS = ['DATASET', 'ENGINE', 'CLIENTS', 'QUERIES', 'FAILED', 'QPS', 'SPEEDUP', 'EFFICIENCY', 'P50_MS',
+           'P95_MS', 'CPU_PCT', 'READ_MB_S', 'READ_MB_S_CORE']
+
+
+# The cpus that the process may run on
+def cpus():
+    if hasattr(os, 'sched_getaffinity'):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count()))
+
+
+# Numbers of clients of a sweep: 'auto' for 1, 2, 4 ... up to the cpus (and
+# the number of cpus), or a list of numbers
+def levels(value):
+    if value.strip() != 'auto':
+        return [int(n) for n in value.split()]
+    ncpus = len(cpus())
+    result = []
+    n = 1
+    while n < ncpus:
+        result.append(n)
+        n *= 2
+    return result + [ncpus]
+
+
+# Prefix of the command of a client that pins it to a cpu
+def pin_prefix(pin, cpu):
+    if pin == 'taskset':
+        return ['taskset', '-c', str(cpu)]
+    if pin == 'numactl':
+        return ['numactl', '--physcpubind=' + str(cpu), '--localalloc']
+    return []
+
+
+def _usage():
+    u = resource.getrusage(resource.RUSAGE_CHILDREN)
+    # ru_inblock and ru_oublock are in blocks of 512 bytes
+    return u.ru_utime + u.ru_stime, u.ru_inblock * 512, u.ru_oublock * 512
+
+
+# Run a level of the sweep: 'clients' clients for 'warmup' and 'duration'
+# seconds. cmd(query) returns the command (a list) of a query; the clients
+# are pinned to the cpus in turn. Writes the queries and the usage of the
+# level to 'output'.
+def level(output, cmd, queries, clients, duration, warmup=0, pin='none', timeout=0, rsslimit=0, patterns=None):
+    available = cpus()
+
+    def client_cmd(query, client):
+        return pin_prefix(pin, available[client % len(available)]) + cmd(query)
+
+    if os.path.exists(output):
+        shutil.rmtree(output)
+    os.makedirs(output)
+    kwargs = {}
+    if patterns is not None:
+        kwargs['patterns'] = patterns
+    pool = mixedload.Clients(client_cmd, queries, clients, timeout, rsslimit, **kwargs)
+    before = _usage()
+    start = time.time()
+    pool.start('warmup')
+    try:
+        time.sleep(warmup)
+        pool.phase('measure')
+        time.sleep(duration)
+    finally:
+        pool.stop()
+    wall = time.time() - start
+    after = _usage()
+    mixedload.save(output, pool.rows, pool.phases)
+    with open(os.path.join(output, USAGE), 'wt') as fout:
+        fout.write('CPU_S\tREAD_BYTES\tWRITE_BYTES\tWALL_S\tCORES\n')
+        fout.write('%.3f\t%d\t%d\t%.3f\t%d\n' % (after[0] - before[0], after[1] - before[1], after[2] - before[2],
+                                                wall, min(clients, len(available))))
+
+
+def load_usage(output):
+    lines = open(os.path.join(output, USAGE), 'rt').read().splitlines()
+    tokens = lines[1].split('\t')
+    return {'cpu_s': float(tokens[0]), 'read': int(tokens[1]), 'write': int(tokens[2]), 'wall_s': float(tokens[3]),
+            'cores': int(tokens[4])}
+
+
+# The levels measured in the output dir of an engine on a dataset, by number
+# of clients
+def find(output):
+    result = {}
+    if not os.path.isdir(output):
+        return result
+    for d in os.listdir(output):
+        if d.startswith('clients-') and os.path.exists(os.path.join(output, d, USAGE)):
+            result[int(d[len('clients-'):])] = os.path.join(output, d)
+    return result
+
+
+# Rows of the table for the levels of an engine on a dataset
+def rows(dataset, engine, output):
+    found = find(output)
+    table = []
+    # Throughput of a client, from the smallest level
+    base = None
+    for n in sorted(found):
+        queries, phases = mixedload.load(found[n])
+        usage = load_usage(found[n])
+        measured = [p for p in phases if p[0] == 'measure']
+        seconds = measured[0][2] - measured[0][1] if len(measured) > 0 else 0
+        measure = [q for q in queries if q['phase'] == 'measure']
+        ok = [q['latency_ms'] for q in measure if q['ret'] == 0]
+        qps = len(ok) / seconds if seconds > 0 else float('nan')
+        if base is None:
+            base = qps / n
+        speedup = qps / base if base else float('nan')
+        read = usage['read'] / (1024 ** 2) / usage['wall_s'] if usage['wall_s'] > 0 else float('nan')
+        table.append([dataset, engine, n, len(measure), len(measure) - len(ok), qps, speedup, speedup / n,
+                      repstats.percentile(ok, 0.5) if len(ok) > 0 else float('nan'),
+                      repstats.percentile(ok, 0.95) if len(ok) > 0 else float('nan'),
+                      100 * usage['cpu_s'] / usage['wall_s'] if usage['wall_s'] > 0 else float('nan'),
+                      read, read / usage['cores']])
+    return table
+
+
+def write_table(table, out):
+    out.write('\t'.join(COLUMNS) + '\n')
+    for r in table:
+        out.write('%s\t%s\t%d\t%d\t%d\t%.2f\t%.2f\t%.2f\t%.1f\t%.1f\t%.0f\t%.1f\t%.1f\n' % tuple(r))
+
+
+# The most throughput of every engine on every dataset, and the clients
+# that reach it
+def peaks(table, out):
+    best = {}
+    for r in table:
+        key = (r[0], r[1])
+        if r[5] == r[5] and (key not in best or r[5] > best[key][5]):
+            best[key] = r
+    out.write('DATASET\tENGINE\tPEAK_QPS\tCLIENTS\tEFFICIENCY\n')
+    for key in sorted(best):
+        r = best[key]
+        out.write('%s\t%s\t%.2f\t%d\t%.2f\n' % (r[0], r[1], r[5], r[2], r[7]))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Table of a throughput sweep')
+    parser.add_argument('outputs', nargs='+', help='output dirs of engines on datasets (with clients-<N> dirs), '
+                                                   'named <dataset>[-native|-rdf3x] as in the tests')
+    args = parser.parse_args()
+    table = []
+    for output in args.outputs:
+        name = os.path.basename(os.path.normpath(output))
+        engine = 'trident'
+        for e, suffix in matrix.SUFFIXES.items():
+            if suffix != '' and name.endswith(suffix):
+                name, engine = name[:-len(suffix)], e
+        table += rows(name, engine, output)
+    if len(table) == 0:
+        print('No levels in ' + ' '.join(args.outputs))
+        sys.exit(1)
+    write_table(table, sys.stdout)
+    sys.stdout.write('\n')
+    peaks(table, sys.stdout)
@@ -0,0 +1,95 @@
+import os
+import time
+import signal
+import threading
+
+import resources
+
+# Watchdog of a command: kills the whole process group of the command when it
+# runs longer than 'timeout' seconds or when the RSS of its process tree
+# exceeds 'rsslimit' GB (0 disables a limit). The command must have been
+# started in its own session (start_new_session=True), so that killing its
+# group does not kill the runner. The RSS is polled rather than capped with
+# setrlimit, since RLIMIT_AS would also count the database files that
+# trident maps in memory.
+
+# Return codes of the commands that the watchdog killed (as timeout(1) and
+# a SIGKILL would)
+TIMEOUT = 124
+OOM = 137
+
+# Seconds between SIGTERM and SIGKILL
+GRACE = 10
+
+
+class Watchdog:
+    def __init__(self, process, timeout=0, rsslimit=0, interval=1):
+        self.process = process
+        self.timeout = timeout
+        self.rsslimit = rsslimit * (1024 ** 3)
+        self.interval = interval
+        self.reason = None
+        self.returncode = None
+        self.start = time.time()
+        self.stopped = threading.Event()
+        self.thread = None
+        if timeout > 0 or rsslimit > 0:
+            self.thread = threading.Thread(target=self._run, daemon=True)
+            self.thread.start()
+
+    def _kill(self):
+        for sig in [signal.SIGTERM, signal.SIGKILL]:
+            try:
+                os.killpg(self.process.pid, sig)
+            except ProcessLookupError:
+                return
+            if self.stopped.wait(GRACE):
+                return
+
+    def _run(self):
+        while not self.stopped.wait(self.interval):
+            elapsed = time.time() - self.start
+            if self.timeout > 0 and elapsed > self.timeout:
+                self.reason = 'TIMEOUT after %.0f s' % elapsed
+                self.returncode = TIMEOUT
+            elif self.rsslimit > 0:
+                rss = sum([st['rss'] for st in resources._tree(self.process.pid).values()])
+                if rss > self.rsslimit:
+                    self.reason = 'OOM at RSS GB %.2f after %.0f s' % (rss / (1024 ** 3), elapsed)
+                    self.returncode = OOM
+            if self.reason is not None:
+                self._kill()
+                return
+
+    # Stop watching, to be called once the command has terminated. Returns
+    # the return code of the command, or TIMEOUT/OOM if the watchdog killed
+    # it.
+    def stop(self):
+        self.stopped.set()
+        if self.thread is not None:
+            self.thread.join()
+        if self.reason is not None:
+            # What is left of the group after the SIGTERM
+            self.kill()
+        if self.returncode is not None:
+            return self.returncode
+        return self.process.returncode
+
+    # Append the reason of the kill to a log (a path or a file)
+    def report(self, log):
+        if self.reason is None or log is None:
+            return
+        if isinstance(log, str):
+            with open(log, 'at') as fout:
+                fout.write('WATCHDOG: ' + self.reason + '\n')
+        elif hasattr(log, 'write'):
+            log.flush()
+            log.write('WATCHDOG: ' + self.reason + '\n')
+            log.flush()
+
+    # Kill the command, e.g. when the runner is interrupted
+    def kill(self):
+        try:
+            os.killpg(self.process.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass